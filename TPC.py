@@ -1,29 +1,297 @@
 import argparse
-import pandas as pd
+import importlib
 import os
 import json
-import requests
+import re
+import sys
 import builtins
-from csv import Sniffer, DictWriter
+import heapq
+import itertools
+import pickle
+import tempfile
+import time
+import hashlib
+import sqlite3
+import threading
+from operator import itemgetter
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl
+import csv
+from csv import Sniffer
+from array import array
 from collections import Counter
-from tablib import Dataset
-from numpy import isclose
-from copy import copy
+from contextlib import suppress
 
-# creating excel files
-import openpyxl
-from openpyxl.styles import PatternFill
+class _LazyModule():
+    '''
+    Proxy of a module imported on first attribute access.
+
+    Heavy dependencies are bound to proxies, so "-h", argument errors and code paths
+    which do not need them do not pay for their import. Attributes are cached on the proxy
+    after the first lookup.
+    '''
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+pd = _LazyModule('pandas')
+np = _LazyModule('numpy')
+requests = _LazyModule('requests')
+concurrent_futures = _LazyModule('concurrent.futures')
+multiprocessing = _LazyModule('multiprocessing')
+
+class CsvSink():
+    '''
+    Writes batches of discrepencies to csv or txt file.
+
+    Args:
+        filename (str): path to output file
+        fieldnames (list): names of columns
+    '''
+    def __init__(self, filename, fieldnames):
+        self.log_file = open(filename, "w", newline='')
+        self.writer = csv.writer(self.log_file)
+        self.writer.writerow(fieldnames)
+        self.log_file.flush()
+
+    def write(self, columns):
+        self.writer.writerows(zip(*columns.values()))
+        self.log_file.flush()
+
+    def close(self):
+        self.log_file.close()
+
+class JsonLinesSink():
+    '''
+    Writes batches of discrepencies to JSON Lines file, one json object per discrepency.
+    NaN values are written as null to keep each line a valid json.
+    '''
+    def __init__(self, filename, fieldnames):
+        self.log_file = open(filename, "w")
+        self.fieldnames = fieldnames
+
+    def write(self, columns):
+        lines = []
+        for row in zip(*columns.values()):
+            record = {heading:(None if isinstance(value, float) and value != value else value) for heading, value in zip(self.fieldnames, row)}
+            lines.append(json.dumps(record, default=str))
+        self.log_file.write('\n'.join(lines) + '\n')
+        self.log_file.flush()
+
+    def close(self):
+        self.log_file.close()
+
+class ArrowSink():
+    '''
+    Base class of sinks writing batches of discrepencies with pyarrow library.
+    Expected and actual values may be of any type, so they are stored as strings.
+    '''
+    def __init__(self, filename, fieldnames):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f"Writing {os.path.splitext(filename)[1]} files requires pyarrow library. Install it with 'pip install pyarrow'.")
+        self.pa = pyarrow
+        self.filename = filename
+        self.fieldnames = fieldnames
+        self.schema = None
+        self.writer = None
+
+    def table(self, columns):
+        columns = dict(columns)
+        for heading in ('expected_value', 'actual_value'):
+            columns[heading] = [None if value is None else str(value) for value in columns[heading]]
+        if self.schema is None:
+            unique_col_type = self.pa.array(columns[self.fieldnames[0]]).type
+            if unique_col_type == self.pa.null():
+                unique_col_type = self.pa.string()
+            types = {self.fieldnames[0]:unique_col_type, 'error_code':self.pa.int8()}
+            self.schema = self.pa.schema([(heading, types.get(heading, self.pa.string())) for heading in self.fieldnames])
+        return self.pa.Table.from_pydict(columns, schema=self.schema)
+
+    def write(self, columns):
+        table = self.table(columns)
+        if self.writer is None:
+            self.writer = self.open_writer()
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None:
+            self.table({heading:[] for heading in self.fieldnames})
+            self.writer = self.open_writer()
+        self.writer.close()
+
+class ParquetSink(ArrowSink):
+    '''
+    Writes batches of discrepencies as row groups of Parquet file.
+    '''
+    def open_writer(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+
+class FeatherSink(ArrowSink):
+    '''
+    Writes batches of discrepencies as record batches of Feather (Arrow IPC) file.
+    '''
+    def open_writer(self):
+        import pyarrow.ipc
+        return pyarrow.ipc.new_file(self.filename, self.schema)
+
+SINKS = {
+    '.csv':CsvSink,
+    '.txt':CsvSink,
+    '.jsonl':JsonLinesSink,
+    '.parquet':ParquetSink,
+    '.feather':FeatherSink,
+    }
+
+def current_rss():
+    '''
+    Returns resident set size of the process in bytes. Where /proc is not available,
+    the peak resident set size so far is returned (or None if it is not available either).
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+class NullStage():
+    '''
+    Stage returned by disabled StageProfiler; does nothing.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def set(self, **counts):
+        pass
+
+NULL_STAGE = NullStage()
+
+class ProfiledStage():
+    '''
+    Stage measured by StageProfiler. Peak RSS is updated by the sampling thread of the profiler.
+    '''
+    def __init__(self, profiler, name, counts):
+        self.profiler = profiler
+        self.name = name
+        self.counts = counts
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss() or 0
+        self.profiler.active.add(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.profiler.active.discard(self)
+        self.peak_rss = max(self.peak_rss, current_rss() or 0)
+        self.profiler.record(self, seconds)
+
+    def set(self, **counts):
+        self.counts.update(counts)
+
+class StageProfiler():
+    '''
+    Records wall time, peak resident memory (RSS), row and discrepency counts of stages of a run.
+
+    Instrumented code wraps a stage in "with profiler.stage(name, rows=...) as stage:" and may add
+    counts with stage.set(...). Stages of the same name (e.g. repeated flushes) are summed up.
+    While the profiler is enabled, RSS is sampled by a background thread every interval seconds.
+    Disabled profiler returns a shared no-op stage, so instrumentation costs a single method call.
+
+    Methods:
+        stage(name, **counts): context manager measuring a stage
+        report(**info): returns dict with measured stages and info
+        write(filename, **info): save report as JSON file
+        close: stop sampling RSS
+    '''
+    def __init__(self, enabled=True, interval=0.005):
+        self.enabled = enabled
+        self.stages = {}
+        self.active = set()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.stopped = threading.Event()
+        if enabled:
+            threading.Thread(target=self.sample, args=(interval,), daemon=True).start()
+
+    def sample(self, interval):
+        while not self.stopped.wait(interval):
+            rss = current_rss() or 0
+            for stage in list(self.active):
+                if rss > stage.peak_rss:
+                    stage.peak_rss = rss
+
+    def stage(self, name, **counts):
+        if not self.enabled:
+            return NULL_STAGE
+        return ProfiledStage(self, name, counts)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(stage.name, {'calls':0, 'seconds':0.0, 'start_rss_mib':round(stage.start_rss / 2**20, 1), 'peak_rss_mib':0.0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['peak_rss_mib'] = max(entry['peak_rss_mib'], round(stage.peak_rss / 2**20, 1))
+            for name, count in stage.counts.items():
+                entry[name] = entry.get(name, 0) + count
+
+    def report(self, **info):
+        with self.lock:
+            stages = [dict(name=name, **dict(entry, seconds=round(entry['seconds'], 6))) for name, entry in self.stages.items()]
+        return dict({
+            'total_seconds':round(time.perf_counter() - self.start, 6),
+            'peak_rss_mib':max([stage['peak_rss_mib'] for stage in stages], default=0.0),
+            'stages':stages,
+            }, **info)
+
+    def write(self, filename, **info):
+        with open(filename, 'w') as f:
+            json.dump(self.report(**info), f, indent=2, default=str)
+
+    def close(self):
+        self.stopped.set()
+
+NULL_PROFILER = StageProfiler(enabled=False)
 
 class DiscrepenciesLogger():
     '''
-    Class created for an easy manipulation of csv discrepencies file.
+    Class created for an easy manipulation of discrepencies file.
+
+    Discrepencies are buffered in memory in columnar structure and written to the sink
+    in batches of batch_size rows. Sink is chosen by the extension of filename (see SINKS).
 
     Args:
-        filename (str): path to csv or txt output file
+        filename (str): path to csv, txt, jsonl, parquet or feather output file
         unique_col (str): name of database column containing unique ids
+        batch_size (int): number of buffered discrepencies written to the sink at once
+        profiler (StageProfiler): profiler measuring writes to the sink (stage write_output)
+        keep_rows (bool): if False, discrepencies written to the sink are dropped from memory, so rows, errors_json,
+            tabularize and prepare_excel see only discrepencies not flushed yet
 
     Methods:
         add(data): add a row of dict-like data matching fieldnames
+        add_frame(frame): add all rows of long-form pandas.DataFrame with columns matching fieldnames in a single call
+        flush: write buffered discrepencies to the sink
+        close: flush and close the sink
+        error_counts: returns dict with numbers of all logged discrepencies by error code
         tabularize: create tablib.Dataset containing discrepencies with error messages, codes, expected and actual values
         prepare_excel(actual_df, expected_df, excel_filename): create excel file with marked differences based on actual_df
 
@@ -36,51 +304,126 @@ class DiscrepenciesLogger():
         3 => Passenger ID is duplicated in expected data
         4 => Missing passenger ID in actual data
         5 => Excessive passenger ID in actual data
+        6 => Passenger ID of the row moved in actual data (expected and actual ID logged as values of the ID column,
+             followed by wrong values of the moved row)
     '''
-    def __init__(self, filename, unique_col):
+    def __init__(self, filename, unique_col, batch_size=100000, profiler=None, keep_rows=True):
         self.filename = filename
         self.unique_col = unique_col
+        self.batch_size = batch_size
+        self.profiler = profiler or NULL_PROFILER
+        self.keep_rows = keep_rows
         self.fieldnames = [self.unique_col, 'error_message', 'error_code', 'column_name', 'expected_value', 'actual_value']
-        self.errors_json = {}
+        self.columns = self.new_columns()
+        self.flushed_rows = 0
+        # Rows dropped from columns after flushing and their error codes (keep_rows=False)
+        self.dropped_rows = 0
+        self.dropped_codes = Counter()
+        self._errors_json = None
+
+        sink_class = SINKS[os.path.splitext(self.filename)[1].lower()]
+        self.sink = sink_class(self.filename, self.fieldnames)
 
-        self.log_file = open(self.filename, "w", newline='')
-        self.writer = DictWriter(self.log_file, fieldnames=self.fieldnames)
-        self.writer.writeheader()
+    def __len__(self):
+        return self.dropped_rows + len(self.columns['error_code'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def new_columns(self):
+        columns = {heading:[] for heading in self.fieldnames}
+        columns['error_code'] = array('b')
+        return columns
 
     def add(self, data):
-        self.writer.writerow(data)
-        self.log_file.flush()
-        if not data[self.unique_col] in self.errors_json.keys():
-            self.errors_json[data[self.unique_col]] = {'errors':[]}
-        error_data = {heading:data.get(heading, None) for heading in self.fieldnames if not heading == self.unique_col}
-        self.errors_json[data[self.unique_col]]['errors'].append(error_data)
+        for heading, values in self.columns.items():
+            values.append(data.get(heading, None))
+        self._errors_json = None
+        if len(self) - self.flushed_rows >= self.batch_size:
+            self.flush()
+
+    def add_frame(self, frame):
+        '''
+        Add discrepencies stored in long-form DataFrame (one row per discrepency).
+        Missing fieldnames are treated the same way as missing keys in add method.
+        '''
+        for heading, values in self.columns.items():
+            values.extend(frame[heading].tolist() if heading in frame.columns else [None] * len(frame))
+        self._errors_json = None
+        if len(self) - self.flushed_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write buffered discrepencies to the sink.
+        '''
+        if len(self) > self.flushed_rows:
+            buffered = self.flushed_rows - self.dropped_rows
+            with self.profiler.stage('write_output', rows=len(self) - self.flushed_rows):
+                self.sink.write({heading:values[buffered:] for heading, values in self.columns.items()})
+            self.flushed_rows = len(self)
+        if not self.keep_rows and self.columns['error_code']:
+            self.dropped_codes.update(self.columns['error_code'])
+            self.dropped_rows = self.flushed_rows
+            self.columns = self.new_columns()
+            self._errors_json = None
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+    def rows(self):
+        '''
+        Returns iterator over logged discrepencies as tuples ordered like fieldnames.
+        '''
+        return zip(*self.columns.values())
+
+    def error_counts(self):
+        '''
+        Returns dict with numbers of logged discrepencies (including dropped ones) by error code.
+        '''
+        return dict(sorted((self.dropped_codes + Counter(self.columns['error_code'])).items()))
+
+    @property
+    def errors_json(self):
+        if self._errors_json is None:
+            errors_json = {}
+            headings = self.fieldnames[1:]
+            for row in self.rows():
+                if not row[0] in errors_json:
+                    errors_json[row[0]] = {'errors':[]}
+                errors_json[row[0]]['errors'].append(dict(zip(headings, row[1:])))
+            self._errors_json = errors_json
+        return self._errors_json
 
     def tabularize(self):
         '''
         Returns tablib.Dataset representation of discrepencies
         '''
-        return Dataset().load(open(self.filename).read())
+        from tablib import Dataset
+        return Dataset(*[['' if value is None else str(value) for value in row] for row in self.rows()], headers=self.fieldnames)
 
-    def prepare_excel(self, actual_df, expected_df, excel_filename):
+    def prepare_excel(self, actual_df, expected_df, excel_filename, max_rows=1048576):
         '''
         Prepare Excel file in excel_filename directory.
+
+        Rows of actual_df and rows missing in actual data (taken from expected_df) are streamed to
+        a write-only workbook in a single pass, in id order and with error styles already applied.
+        When a sheet reaches max_rows rows (Excel limit by default), the report continues in a new sheet.
         '''
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+
         while True:
             try:
-                actual_df.to_excel(excel_filename, sheet_name='Discrepencies')
+                open(excel_filename, 'ab').close()
                 break
             except IOError as e:
                 input(f"Please close file {excel_filename} and hit enter to proceed!")
-        wb = openpyxl.load_workbook(excel_filename)
-        sh = wb['Discrepencies']
-
-        columns_headings = {cell.value:idx for idx, cell in enumerate(sh[1])}
-        cols_num = len(columns_headings)
-        error_message_cell = sh.cell(row=1, column=cols_num+1)
-        error_message_cell.value = "error_message"
-        error_message_cell.font = copy(sh[1][1].font)
-        error_message_cell.border = copy(sh[1][1].border)
-        error_message_cell.alignment = copy(sh[1][1].alignment)
 
         error_styles = {
             1: PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
@@ -88,42 +431,429 @@ class DiscrepenciesLogger():
             3: PatternFill(start_color="EBAE34", end_color="EBAE34", fill_type="solid"),
             4: PatternFill(start_color="8A0000", end_color="8A0000", fill_type="solid"),
             5: PatternFill(start_color="108A00", end_color="108A00", fill_type="solid"),
+            6: PatternFill(start_color="7A3DB8", end_color="7A3DB8", fill_type="solid"),
         }
+        header_font = Font(bold=True)
+        header_border = Border(**{side:Side(style='thin') for side in ('left', 'right', 'top', 'bottom')})
+        header_alignment = Alignment(horizontal='center', vertical='top')
+
+        # Errors grouped by id; the last row error of an id decides its style, as the message column holds one message
+        wrong_values, row_errors, missing_rows = {}, {}, {}
+        moved_ids, moved_values = {}, {}
+        for row_id, error_message, error_code, column_name, expected_value, actual_value in zip(self.columns[self.unique_col],
+                self.columns['error_message'], self.columns['error_code'], self.columns['column_name'], self.columns['expected_value'],
+                self.columns['actual_value']):
+            if error_code == 1:
+                wrong_values.setdefault(row_id, []).append((column_name, expected_value, error_message))
+            elif error_code == 4:
+                missing_rows[row_id] = error_message
+            elif error_code == 6 and column_name == self.unique_col:
+                moved_ids[row_id] = (actual_value, error_message)
+            elif error_code == 6:
+                moved_values.setdefault(row_id, []).append((column_name, expected_value))
+            else:
+                row_errors[row_id] = (error_code, error_message)
+        # Moved rows are logged under expected ids, but marked in rows of their actual ids
+        moved_rows = {actual_id:(expected_id, error_message, moved_values.get(expected_id, []))
+            for expected_id, (actual_id, error_message) in moved_ids.items()}
+
+        if not actual_df.index.is_monotonic_increasing:
+            actual_df = actual_df.sort_index()
+        missing_df = expected_df[expected_df.index.isin(list(missing_rows))].reindex(columns=actual_df.columns).sort_index()
+        headings = [actual_df.index.name or self.unique_col] + list(actual_df.columns) + ['error_message']
+        positions = {heading:idx for idx, heading in enumerate(headings)}
+        rows = heapq.merge(
+            ((row, False) for row in actual_df.itertuples(name=None)),
+            ((row, True) for row in missing_df.itertuples(name=None)),
+            key=lambda item: item[0][0],
+            )
+
+        wb = openpyxl.Workbook(write_only=True)
+        sh = None
+        sheet_rows = 0
 
-        for row in sh.iter_rows(min_row=1):
-            row_id = row[columns_headings[self.unique_col]].value
-            if row_id in self.errors_json.keys():
-                error_stack = self.errors_json[row_id]['errors']
-                for error in error_stack:
-                    err = error['error_code']
-                    err_style = error_styles.get(err, None)
-                    if err == 1:
-                        cell = row[columns_headings[error['column_name']]]
-                        cell.fill = err_style
-                        cell.value = f"{cell.value} \\\\ expected: {error['expected_value']} \\\\"
-                        sh.cell(row=cell.row, column=cols_num+1).value = error['error_message']
-                    elif err in [2, 3, 5]:
-                        for cell in row:
-                            cell.fill = err_style
-                        sh.cell(row=row[0].row, column=cols_num+1).value = error['error_message']
-
-        # Adding missing rows
-        rows_num = sh.max_row
-        err_style = error_styles[4]
-        for id_key, id_vals in self.errors_json.items():
-            for error in id_vals['errors']:
-                if error['error_code'] == 4:
-                    for heading, idx in columns_headings.items():
-                        cell = sh.cell(row=rows_num, column=idx+1)
-                        if heading == self.unique_col:
-                            cell.value = id_key
-                        else:
-                            cell.value = expected_df.loc[id_key, heading]
-                        cell.fill = err_style
-                    sh.cell(row=rows_num, column=cols_num+1).value = error['error_message']
-                    rows_num += 1
+        def styled(value, **styles):
+            cell = WriteOnlyCell(sh, value=value)
+            for name, style in styles.items():
+                setattr(cell, name, style)
+            return cell
+
+        for row, missing in rows:
+            if sh is None or sheet_rows >= max_rows:
+                sh = wb.create_sheet('Discrepencies' if sh is None else f'Discrepencies {len(wb.worksheets) + 1}')
+                sh.append([styled(heading, font=header_font, border=header_border, alignment=header_alignment) for heading in headings])
+                sheet_rows = 1
+            row_id = row[0]
+            values = [None if pd.isna(value) else value for value in row] + [None]
+            if missing:
+                err_style = error_styles[4]
+                values = [styled(value, fill=err_style) for value in values[:-1]] + [missing_rows[row_id]]
+            elif row_id in moved_rows:
+                expected_id, error_message, moved_wrong_values = moved_rows[row_id]
+                values = [styled(value, fill=error_styles[6]) for value in values[:-1]] + [f"{error_message} from {expected_id}"]
+                for column_name, expected_value in moved_wrong_values:
+                    idx = positions[column_name]
+                    values[idx] = styled(f"{values[idx].value} \\\\ expected: {expected_value} \\\\", fill=error_styles[1])
+            elif row_id in row_errors:
+                error_code, error_message = row_errors[row_id]
+                err_style = error_styles[error_code]
+                values = [styled(value, fill=err_style) for value in values[:-1] + [error_message]]
+            elif row_id in wrong_values:
+                for column_name, expected_value, error_message in wrong_values[row_id]:
+                    idx = positions[column_name]
+                    values[idx] = styled(f"{values[idx]} \\\\ expected: {expected_value} \\\\", fill=error_styles[1])
+                    values[-1] = error_message
+            sh.append(values)
+            sheet_rows += 1
+
+        if sh is None:
+            sh = wb.create_sheet('Discrepencies')
+            sh.append(headings)
         wb.save(excel_filename)
 
+class ComparisonStopped(Exception):
+    '''
+    Raised by DiscrepenciesSummary to stop the comparison early.
+    '''
+
+class DiscrepenciesSummary():
+    '''
+    Counts discrepencies by error code and column and passes only a bounded sample of them to logger.
+
+    Accepts discrepencies like DiscrepenciesLogger (add and add_frame methods), so it can be given
+    to any comparison in place of a logger. As soon as a discrepency beyond max_errors or one with
+    an error code from stop_codes appears, discrepencies following the limit are dropped and
+    ComparisonStopped is raised; comparisons stop at that point and counts of the summary are lower bounds.
+
+    Args:
+        logger (DiscrepenciesLogger): logger receiving sampled discrepencies
+        sample_size (int): number of examples passed to logger for every error code and column,
+            all discrepencies are passed if None
+        max_errors (int): number of discrepencies kept, the comparison is stopped by the next one
+        stop_codes (list): error codes which stop the comparison
+
+    Methods:
+        add(data): count a row of dict-like data matching fieldnames of logger
+        add_frame(frame): count all rows of long-form pandas.DataFrame
+        close: close the logger
+        report: returns dict with counts by error code and column and the reason of stopping
+        tabularize: create tablib.Dataset with counts by error code and column
+    '''
+    def __init__(self, logger, sample_size=10, max_errors=None, stop_codes=None):
+        self.logger = logger
+        self.sample_size = sample_size
+        self.max_errors = max_errors
+        self.stop_codes = list(stop_codes or [])
+        self.counts = {}
+        self.messages = {}
+        self.total = 0
+        self.stopped_by = None
+
+    def __len__(self):
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, data):
+        self.add_frame(pd.DataFrame([data]))
+
+    def add_frame(self, frame):
+        '''
+        Count discrepencies stored in long-form DataFrame and pass examples to logger.
+        Raises ComparisonStopped if a limit is reached.
+        '''
+        if self.stopped_by or not len(frame):
+            return
+        codes = frame['error_code'].to_numpy()
+        stop_at = len(frame)
+        if self.max_errors is not None and self.total + stop_at > self.max_errors:
+            stop_at, self.stopped_by = self.max_errors - self.total, f'max_errors {self.max_errors}'
+        if self.stop_codes:
+            hits = np.flatnonzero(np.isin(codes[:stop_at], self.stop_codes))
+            if len(hits):
+                stop_at, self.stopped_by = hits[0] + 1, f'error_code {codes[hits[0]]}'
+        if stop_at < len(frame):
+            frame, codes = frame.iloc[:stop_at], codes[:stop_at]
+        if not len(frame):
+            raise ComparisonStopped(self.stopped_by)
+
+        # Discrepencies are grouped by error code and column; row errors have no column
+        columns = frame['column_name'].fillna('').to_numpy() if 'column_name' in frame.columns else np.full(len(frame), '', dtype=object)
+        groups = pd.DataFrame({'error_code':codes, 'column_name':columns}).groupby(['error_code', 'column_name'], sort=False)
+        numbers, sizes = groups.ngroup().to_numpy(), groups.size()
+        keys = [(int(code), column or None) for code, column in sizes.index]
+        seen = np.array([self.counts.get(key, 0) for key in keys])
+        for key, count, position in zip(keys, sizes.to_numpy(), np.unique(numbers, return_index=True)[1]):
+            self.messages.setdefault(key, frame['error_message'].iat[position])
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+        self.total += len(frame)
+        if self.sample_size is not None:
+            frame = frame[groups.cumcount().to_numpy() + seen[numbers] < self.sample_size]
+        self.logger.add_frame(frame)
+        if self.stopped_by:
+            raise ComparisonStopped(self.stopped_by)
+
+    def close(self):
+        self.logger.close()
+
+    def report(self):
+        by_error_code, by_column = {}, {}
+        for (code, column), count in sorted(self.counts.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            by_error_code[code] = by_error_code.get(code, 0) + count
+            if column is not None:
+                by_column[column] = by_column.get(column, 0) + count
+        return {
+            'discrepencies':self.total,
+            'by_error_code':by_error_code,
+            'by_column':by_column,
+            'complete':self.stopped_by is None,
+            'stopped_by':self.stopped_by,
+            'sample_size':self.sample_size,
+            }
+
+    def tabularize(self):
+        '''
+        Returns tablib.Dataset with numbers of discrepencies by error code and column
+        '''
+        from tablib import Dataset
+        rows = sorted(self.counts.items(), key=lambda item: (item[0][0], item[0][1] or ''))
+        return Dataset(*[[code, self.messages[(code, column)], column or '', count] for (code, column), count in rows],
+            headers=['error_code', 'error_message', 'column_name', 'count'])
+
+def _history_value(value):
+    '''
+    Convert logged value to a type SQLite stores natively (numpy scalars to Python ones, other objects to strings).
+    '''
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+class DiscrepenciesHistory():
+    '''
+    Persistent store of discrepencies of many runs in a SQLite database.
+
+    Every recorded run gets a row in runs table and its discrepencies are appended to discrepencies
+    table, indexed by run, error code, column and id, by run and column, and by id and run. So
+    discrepencies of a run, an id or a column are queried without scanning other runs or result files.
+    A discrepency is identified by id, error code and column; values do not take part in the diff.
+
+    A run is diffed with the previous run of the same input file when it is recorded: every discrepency
+    gets first_run, the run since which it persists, and discrepencies of the previous run missing in
+    the new one get resolved_run. A diff of a run and its previous run is then a lookup of new (first_run
+    is the run) and resolved discrepencies in partial indexes holding only them; other pairs of runs are
+    diffed by probing the index of one run for every discrepency of the other.
+
+    Args:
+        filename (str): path to SQLite database, created if it does not exist
+        unique_col (str): name of database column containing unique ids
+
+    Methods:
+        record(logger, **metadata): append discrepencies of DiscrepenciesLogger as a new run, returns its run_id
+        runs(): returns DataFrame of recorded runs
+        last_run(input_file=None, before=None): returns run_id of the latest run (of input_file, before run_id before)
+        query(run_id=None, ids=None, columns=None, error_codes=None): returns DataFrame of discrepencies
+        diff(old_run, new_run, persisting=True, logger=None): returns DataFrame of new, resolved and persisting discrepencies
+        close: close the database
+    '''
+    HEADINGS = ['error_code', 'column_name', 'error_message', 'expected_value', 'actual_value']
+
+    def __init__(self, filename, unique_col='passengerid'):
+        self.filename = filename
+        self.unique_col = unique_col
+        self.key = quote_identifier(unique_col)
+        self.connection = sqlite3.connect(filename)
+        with self.connection:
+            self.connection.executescript(f'''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY, started TEXT, input_file TEXT, output_file TEXT,
+                    discrepencies INTEGER, arguments TEXT, previous_run INTEGER);
+                CREATE TABLE IF NOT EXISTS discrepencies (
+                    run_id INTEGER NOT NULL REFERENCES runs (run_id), {self.key}, error_code INTEGER, column_name TEXT,
+                    error_message TEXT, expected_value, actual_value, first_run INTEGER, resolved_run INTEGER);
+                ''')
+            # Stores created before statuses were recorded get the columns, their discrepencies are left without statuses
+            for table, column in [('runs', 'previous_run'), ('discrepencies', 'first_run'), ('discrepencies', 'resolved_run')]:
+                if column not in {row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')}:
+                    self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER')
+            self.connection.executescript(f'''
+                CREATE INDEX IF NOT EXISTS discrepencies_error_code ON discrepencies (run_id, error_code, column_name, {self.key});
+                CREATE INDEX IF NOT EXISTS discrepencies_column ON discrepencies (run_id, column_name, {self.key}, error_code);
+                CREATE INDEX IF NOT EXISTS discrepencies_id ON discrepencies ({self.key}, run_id);
+                CREATE INDEX IF NOT EXISTS discrepencies_new ON discrepencies (run_id) WHERE first_run = run_id;
+                CREATE INDEX IF NOT EXISTS discrepencies_resolved_run ON discrepencies (resolved_run) WHERE resolved_run IS NOT NULL;
+                ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def read(self, query, parameters=()):
+        '''
+        Returns DataFrame of rows of query, built from all rows fetched at once (faster than pandas.read_sql_query).
+        '''
+        cursor = self.connection.execute(query, parameters)
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+    def logged_columns(self, logger):
+        '''
+        Returns list of columns of logger as stored in discrepencies table, ordered like HEADINGS, and sets of types of their values.
+        '''
+        columns = []
+        # Only columns holding values of other than native types are converted value by value
+        native = {type(None), str, int, float, bool}
+        for heading in [logger.unique_col] + self.HEADINGS:
+            values = logger.columns[heading]
+            types = set(map(type, values))
+            if not types <= native:
+                values = list(map(_history_value, values))
+                types = set(map(type, values))
+            columns.append((values, types))
+        return columns
+
+    def record(self, logger, input_file=None, output_file=None, arguments=None, batch_size=100000):
+        '''
+        Append all discrepencies of logger as a new run in a single transaction and diff it with the
+        previous run of input_file. Returns run_id of the run.
+        '''
+        values = [values for values, types in self.logged_columns(logger)]
+        previous_run = self.last_run(input_file=input_file) if input_file is not None else None
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (started, input_file, output_file, discrepencies, arguments, previous_run) VALUES (?, ?, ?, ?, ?, ?)',
+                (time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), input_file, output_file, len(logger),
+                    json.dumps(arguments, default=str) if arguments is not None else None, previous_run))
+            run_id = cursor.lastrowid
+
+            # Discrepencies of both runs are matched by key in memory, as only keys of the previous run are read
+            first_runs, resolved = itertools.repeat(run_id), []
+            if previous_run is not None:
+                key = [self.unique_col, 'error_code', 'column_name']
+                new_keys = pd.DataFrame(dict(zip(key, values[:3])))
+                old_keys = self.read(f'SELECT rowid, {self.key}, error_code, column_name, COALESCE(first_run, run_id) AS first_run FROM discrepencies'
+                    ' WHERE run_id = ?', [previous_run])
+                if len(old_keys) and len(new_keys):
+                    new_keys['error_code'] = new_keys['error_code'].astype('int64')
+                    matched = new_keys.merge(old_keys.drop_duplicates(key), how='left', on=key)
+                    first_runs = matched['first_run'].fillna(run_id).astype('int64').tolist()
+                    old_keys = old_keys.merge(new_keys.drop_duplicates(), how='left', on=key, indicator=True)
+                    resolved = old_keys.loc[old_keys['_merge'] == 'left_only', 'rowid'].tolist()
+                elif len(old_keys):
+                    resolved = old_keys['rowid'].tolist()
+
+            rows = zip(itertools.repeat(run_id), *values, first_runs)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                self.connection.executemany(f'INSERT INTO discrepencies (run_id, {self.key}, error_code, column_name, error_message,'
+                    ' expected_value, actual_value, first_run) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            self.connection.executemany('UPDATE discrepencies SET resolved_run = ? WHERE rowid = ?', zip(itertools.repeat(run_id), resolved))
+        return run_id
+
+    def runs(self):
+        return pd.read_sql_query('SELECT * FROM runs ORDER BY run_id', self.connection)
+
+    def last_run(self, input_file=None, before=None):
+        conditions, parameters = [], []
+        if input_file is not None:
+            conditions.append('input_file = ?')
+            parameters.append(input_file)
+        if before is not None:
+            conditions.append('run_id < ?')
+            parameters.append(int(before))
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        row = self.connection.execute(f'SELECT MAX(run_id) FROM runs{where}', parameters).fetchone()
+        return row[0]
+
+    def query(self, run_id=None, ids=None, columns=None, error_codes=None):
+        '''
+        Returns DataFrame of discrepencies of run_id (the latest run if None) narrowed to given ids, columns
+        and error codes, ordered by id, error code and column.
+        '''
+        run_id = self.last_run() if run_id is None else run_id
+        conditions, parameters = ['run_id = ?'], [run_id]
+        if ids:
+            conditions.append(f"{self.key} IN ({', '.join(str(int(i)) for i in ids)})")
+        if columns:
+            conditions.append(f"column_name IN ({', '.join('?' * len(columns))})")
+            parameters.extend(columns)
+        if error_codes:
+            conditions.append(f"error_code IN ({', '.join(str(int(code)) for code in error_codes)})")
+        return self.read(f'SELECT {self.key}, error_message, error_code, column_name, expected_value, actual_value'
+            f" FROM discrepencies WHERE {' AND '.join(conditions)} ORDER BY {self.key}, error_code, column_name", parameters)
+
+    def diff(self, old_run, new_run, persisting=True, logger=None):
+        '''
+        Returns DataFrame of discrepencies which are new in new_run, resolved since old_run and, if persisting
+        is True, persisting in both runs (status column), ordered by id, error code and column. Values of new
+        and persisting discrepencies are taken from new_run, values of resolved ones from old_run. Without
+        persisting discrepencies only changes are fetched, which is much faster when most discrepencies persist.
+
+        If old_run is the previous run of new_run and logger which recorded new_run is given, discrepencies
+        of new_run are taken from the logger and only ids of new ones and resolved discrepencies are fetched.
+        '''
+        key = self.key
+        values = f'd.{key}, d.error_message, d.error_code, d.column_name, d.expected_value, d.actual_value'
+        previous_run = self.connection.execute('SELECT previous_run FROM runs WHERE run_id = ?', [new_run]).fetchone()
+        if previous_run is not None and previous_run[0] == old_run and logger is not None and not logger.dropped_rows:
+            # Rows of a run are inserted in a single transaction, so their rowids are consecutive and follow the order of logger
+            first_rowid, = self.connection.execute('SELECT MIN(rowid) FROM discrepencies WHERE run_id = ?', [new_run]).fetchone()
+            new_rows = self.read('SELECT rowid - ? AS position FROM discrepencies WHERE run_id = ? AND first_run = run_id',
+                [first_rowid, new_run])['position'].to_numpy(dtype='int64')
+            logged = dict(zip([self.unique_col] + self.HEADINGS, self.logged_columns(logger)))
+            resolved = self.connection.execute(f"SELECT 'resolved', {values} FROM discrepencies d WHERE d.resolved_run = ?", [new_run]).fetchall()
+            is_new = np.zeros(len(logger), dtype='int8')
+            is_new[new_rows] = 1
+            status = np.array(['persisting', 'new'], dtype=object)[is_new if persisting else is_new[new_rows]]
+            columns = {'status':np.concatenate([status, np.array(['resolved'] * len(resolved), dtype=object)])}
+            # Columns are built with dtypes which would be inferred from their values, as building DataFrame from lists is slow
+            for heading, resolved_values in zip(logger.fieldnames, list(zip(*resolved))[1:] if resolved else itertools.repeat(())):
+                column, types = logged[heading]
+                if not persisting:
+                    column = [column[row] for row in new_rows]
+                    types = set(map(type, column))
+                types = types | set(map(type, resolved_values))
+                types = types - {bool} | {int} if bool in types else types
+                if types and types <= {int}:
+                    dtype = 'int64'
+                elif types and types <= {int, float, type(None)} and types != {type(None)}:
+                    dtype = 'float64'
+                else:
+                    dtype = object
+                columns[heading] = np.concatenate([np.asarray(column, dtype=dtype), np.array(resolved_values, dtype=dtype)])
+            # Discrepencies with the same key are all new or all persisting and never resolved, so status is left out of the sort
+            return pd.DataFrame(columns).sort_values([self.unique_col, 'error_code', 'column_name'], na_position='first', kind='stable', ignore_index=True)
+        if previous_run is not None and previous_run[0] == old_run:
+            # Statuses found when new_run was recorded
+            if persisting:
+                new, new_parameters = (f"SELECT CASE WHEN d.first_run = ? THEN 'new' ELSE 'persisting' END AS status, {values}"
+                    ' FROM discrepencies d WHERE d.run_id = ?'), [new_run, new_run]
+            else:
+                new, new_parameters = f"SELECT 'new' AS status, {values} FROM discrepencies d WHERE d.run_id = ? AND d.first_run = d.run_id", [new_run]
+            resolved, resolved_parameters = f"SELECT 'resolved', {values} FROM discrepencies d WHERE d.resolved_run = ?", [new_run]
+        else:
+            # Rows of a run missing in the other run are found by scanning and probing the covering index, values are fetched for them only
+            changed = (f'd.rowid IN (SELECT k.rowid FROM discrepencies k WHERE k.run_id = ? AND NOT EXISTS (SELECT 1 FROM discrepencies o'
+                f' WHERE o.run_id = ? AND o.{key} = k.{key} AND o.error_code = k.error_code AND o.column_name IS k.column_name))')
+            if persisting:
+                new, new_parameters = (f"SELECT CASE WHEN {changed} THEN 'new' ELSE 'persisting' END AS status, {values} FROM discrepencies d"
+                    " WHERE d.run_id = ?"), [new_run, old_run, new_run]
+            else:
+                new, new_parameters = f"SELECT 'new' AS status, {values} FROM discrepencies d WHERE {changed}", [new_run, old_run]
+            resolved, resolved_parameters = f"SELECT 'resolved', {values} FROM discrepencies d WHERE {changed}", [old_run, new_run]
+        return self.read(f'{new} UNION ALL {resolved} ORDER BY 2, 4, 5, 1', new_parameters + resolved_parameters)
+
 class ArgparseFactory():
     '''
     Necessary if one wants to run titanic_datasets_comparison function from Python script.
@@ -155,218 +885,2257 @@ def check_arg_file_extension(filename, extensions, arg):
     if file_extension not in extensions:
         raise argparse.ArgumentError(arg, f"Allowed file extensions are {', '.join(extensions)}, not '{file_extension}'.")
 
-def load_json_data(json_data):
-    '''
-    Normalize json from API.
+class JsonColumns():
     '''
-    expected_df = pd.json_normalize(pd.json_normalize(json_data, max_level=0)['fields'])
-    return expected_df
+    Typed column buffers filled with fields of JSON records one record at a time.
 
-def load_actual_data():
-    '''
-    Perform http request and retrieve data in json format.
+    Columns holding only integers or floats are kept in array('q') or array('d') buffers,
+    other columns in lists. Integer column with a missing value or a float becomes a float column,
+    column with a value of any other type becomes a list. Missing values are stored as NaN.
 
-    May raise requests exceptions like ConnectionError, MaxRetriesError, TimeoutError.
-    '''
-    try:
-        json_request = requests.get(API_URL).json()
-    except requests.exceptions.ConnectionError:
-        raise ValueError("Failed to establish new connection. Check your Internet connection and try again.")
-    except Exception as e:
-        raise e
-    return load_json_data(json_request['records'])
+    Args:
+        usecols (list): lower-case names of kept columns, all columns are kept if None
 
-def discrepencies_series_mask(df1, df2, isclose_flag=True):
-    '''
-    Compares two series and returns False if values matches and True if they don't.
-    
-    There are a handful of questions that the project manager would have to answer:
-    * Is 15 == 15.0?
-    * Is "15" == 15.0?
-    * Is 15.0000000005 == 15.0?
-    * Is 15.0000000005 == 15?
-    * Is 15.0000000005 == "15"?
-    
-    For simplicity reasons I assumed that we are only interested in comparing floating point 
-    numbers using the numpy.isclose function if isclose_flag == True. Integer 15 and 15.0
-    are not considered equal. However, if it were to be changed in the future, the function
-    pandas.to_numeric wit errors=coerce can be used.
+    Methods:
+        add(fields): append values of fields dict, column names are lower-cased
+        add_names(fields): register column names of fields dict without appending a row
+        to_frame: create pandas.DataFrame of buffered columns
     '''
+    def __init__(self, usecols=None):
+        self.usecols = set(usecols) if usecols is not None else None
+        self.names = {}
+        self.columns = {}
+        self.length = 0
 
-    bool_mask = pd.Series(data=[True])
-    bool_mask = bool_mask.repeat(repeats=len(df1))
-    bool_mask.index = df1.index
+    def __len__(self):
+        return self.length
 
-    # Property of Nan is that NaN != Nan is equal True, NaN == NaN is equal False.
-    # Bearing that in mind, I have to check if values are not both NaNs.
-    bool_mask[(pd.isnull(df1) & pd.isnull(df2))] = False
+    def add_names(self, fields):
+        for key in fields:
+            key = key.lower()
+            if key not in self.names and (self.usecols is None or key in self.usecols):
+                self.names[key] = None
 
-    if isclose_flag:
-        # If requested, compare floats with numpy.isclose function. 
-        # API is producing results like fare = 7.8542000000000005 so I recommend using -f flag
-        if df1.dtype == "float64" and df2.dtype == "float64":
-            bool_mask[isclose(df1, df2)] = False
+    def add(self, fields):
+        self.add_names(fields)
+        for key, value in fields.items():
+            key = key.lower()
+            if self.usecols is not None and key not in self.usecols:
+                continue
+            if key not in self.columns:
+                self.columns[key] = self.new_column(value)
+            self.append(key, value)
+        self.length += 1
+        for key, column in self.columns.items():
+            if len(column) < self.length:
+                self.append(key, None)
 
-    if not df1.dtype == df2.dtype or (df1.dtype == 'object' and df2.dtype == 'object'):
-        # In rare cases, wrong data can change column's data type. 
-        # For example, string "young" in column Age (dtype float64) can lead to comparison malfunctioning.
-        # Converting both series to string is the simplies solution, 
-        # but those columns can no longer be compared using numpy.isclose function.
-        df1, df2 = df1.astype(str), df2.astype(str)
-    bool_mask[df1 == df2] = False
-    return bool_mask
+    def new_column(self, value):
+        '''
+        Create a buffer for a column first seen in current row, filled with NaN for previous rows.
+        '''
+        if not self.length:
+            if type(value) is int:
+                return array('q')
+            if type(value) is float:
+                return array('d')
+        elif type(value) in (int, float):
+            return array('d', [np.nan]) * self.length
+        return [np.nan] * self.length
 
+    def append(self, key, value):
+        column = self.columns[key]
+        typecode = getattr(column, 'typecode', None)
+        if typecode == 'q' and type(value) is int:
+            try:
+                return column.append(value)
+            except OverflowError:
+                column = self.columns[key] = column.tolist()
+        elif typecode in ('q', 'd') and (value is None or type(value) in (int, float)):
+            if typecode == 'q':
+                column = self.columns[key] = array('d', column)
+            try:
+                return column.append(np.nan if value is None else value)
+            except OverflowError:
+                column = self.columns[key] = column.tolist()
+        elif typecode:
+            column = self.columns[key] = column.tolist()
+        column.append(np.nan if value is None else value)
 
-def titanic_datasets_comparison(args, test_flag = False):
-    '''
-    Titanic passengers datasets comparison function.
+    def to_frame(self):
+        data = {}
+        for key in self.names:
+            column = self.columns.get(key)
+            if column is None:
+                data[key] = np.full(self.length, np.nan)
+            elif isinstance(column, array):
+                data[key] = np.frombuffer(column, dtype=np.int64 if column.typecode == 'q' else np.float64)
+            else:
+                data[key] = column
+        return pd.DataFrame(data, index=pd.RangeIndex(self.length))
 
-    Parameters:
-        args (argparse.Namespace): parsed arguments of argparse.parser
-        test_flag (bool): if True, returns json_response for easier testing
+def iter_json_records(file, buffer_size=65536):
     '''
-    UNIQUE_COL = "passengerid"
-    USECOLS = None
-    USEIDS = None
-
-    # Setting flags and checking files extensions
-    verbose_flag = args.verbose
-    builtin_print = builtins.print
+    Yields items of top-level JSON array read from text file object piece by piece.
+    Only the current item and at most buffer_size characters of the file are kept in memory.
+    '''
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
 
-    def print(*args, **kwargs):
-        '''
-        Setting verbosity level and overriding builtin print function.
-        '''
-        if verbose_flag:
-            return builtin_print(*args, **kwargs)
+    def refill():
+        nonlocal buffer, position, eof
+        data = file.read(buffer_size)
+        eof = not data
+        buffer, position = buffer[position:] + data, 0
 
-    isclose_flag = args.floatprecision
-    if args.columns: USECOLS = args.columns + [UNIQUE_COL]
-    if args.passengerid: USEIDS = args.passengerid
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            position = JSON_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or eof:
+                return
+            refill()
 
-    check_arg_file_extension(args.outputfile.name, ['.csv', '.txt'], textout_arg)
-    output_filename = args.outputfile.name
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise ValueError("JSON input is not an array of records!")
+    position += 1
+    skip_whitespace()
+    if buffer[position:position + 1] == ']':
+        return
+    while True:
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            # Number at the end of the buffer may be cut in the middle
+            if end == len(buffer) and not eof:
+                refill()
+                continue
+            break
+        position = end
+        yield item
+        skip_whitespace()
+        separator = buffer[position:position + 1]
+        position += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' after JSON record, not '{separator}'.")
+        skip_whitespace()
 
-    file = args.inputfile 
-    check_arg_file_extension(file.name, ['.csv', '.json'], input_file_arg)
-    input_file_extension = os.path.splitext(file.name)[1].lower()
+def iter_records_frames(records, chunksize=None, usecols=None, useids=None, unique_col='passengerid', keep_meta=False):
+    '''
+    Build DataFrames of chunksize rows (or a single DataFrame if chunksize is None) from records exported from the API.
 
-    if args.excel:
-        excel_flag = True
-        check_arg_file_extension(args.excel.name, ['.xls', '.xlsx'], excelout_arg)
-        excel_filename = args.excel.name
-    else:
-        excel_flag = False
+    Fields of each record go straight to typed column buffers (see JsonColumns). Only usecols columns
+    of records with unique_col value in useids are kept. If keep_meta is True, recordid and
+    record_timestamp of records are kept as last columns.
+    '''
+    useids = set(useids) if useids else None
 
-    if input_file_extension == '.csv':
-        dialect = Sniffer().sniff(file.read(1024))
-        try:
-            expected_df = pd.read_csv(file.name, dialect=dialect)
-        except Exception as e:
-            raise argparse.ArgumentError(args.inputfile, f"CSV input is not valid!")
-    else:
-        try:
-            json_data = json.loads(file.read())
-            expected_df = load_json_data(json_data)
-        except Exception as e:
-            raise argparse.ArgumentError(args.inputfile, f"JSON input is not valid!")
+    def new_buffers():
+        return JsonColumns(usecols), JsonColumns(META_COLUMNS)
 
-    actual_df = load_actual_data()
-    expected_df.columns = [c.lower() for c in expected_df.columns]
-    actual_df.columns = [c.lower() for c in actual_df.columns]
+    def to_frame(columns, meta):
+        frame = columns.to_frame()
+        if keep_meta:
+            for col_name, values in meta.to_frame().items():
+                frame[col_name] = values.values
+        return frame
 
-    # Narrowing databases to given columns and IDs
-    if USECOLS:
-        for df, df_name in [(actual_df, "Actual data"), (expected_df, "Expected data")]:
-            if not all(col in df.columns for col in USECOLS):
-                missing_cols = ','.join([c for c in USECOLS if not c in df.columns])
-                raise argparse.ArgumentError(cols_arg, f"{df_name} does not contain column(s): {missing_cols}")
-        expected_df = expected_df[USECOLS]
-        actual_df =  actual_df[USECOLS]
-    else:
-        if list(set(actual_df.columns) - set(expected_df.columns)):
-            raise ValueError("Columns of actual and expected dataframe do not match!\nUse '-c' argument to select columns.")
+    columns, meta = new_buffers()
+    yielded = False
+    for record in records:
+        fields = record['fields']
+        if useids is not None and unique_col not in fields:
+            fields = {key.lower():value for key, value in fields.items()}
+        if useids is not None and fields.get(unique_col) not in useids:
+            columns.add_names(fields)
+            continue
+        columns.add(fields)
+        if keep_meta:
+            meta.add({col_name:record[col_name] for col_name in META_COLUMNS if col_name in record})
+        if chunksize and len(columns) == chunksize:
+            yield to_frame(columns, meta)
+            yielded = True
+            names = columns.names
+            columns, meta = new_buffers()
+            columns.names = dict(names)
+    if len(columns) or not yielded:
+        yield to_frame(columns, meta)
 
-    if USEIDS:
-        expected_df = expected_df[expected_df[UNIQUE_COL].isin(USEIDS)]
-        actual_df = actual_df[actual_df[UNIQUE_COL].isin(USEIDS)]
+def iter_json_frames(file, chunksize=None, usecols=None, useids=None, unique_col='passengerid', keep_meta=False, buffer_size=65536):
+    '''
+    Parse JSON file exported from the API incrementally (see iter_json_records and iter_records_frames).
+    Memory use is proportional to selected columns and rows instead of the file size.
+    '''
+    return iter_records_frames(iter_json_records(file, buffer_size), chunksize, usecols, useids, unique_col, keep_meta)
 
-    expected_df = expected_df.set_index(UNIQUE_COL).sort_index()
-    actual_df =  actual_df.set_index(UNIQUE_COL).sort_index()
+def load_json_data(json_data, keep_meta=False):
+    '''
+    Normalize json from API.
 
-    Logger = DiscrepenciesLogger(filename=output_filename, unique_col=UNIQUE_COL)
+    If keep_meta is True, recordid and record_timestamp of records are kept as columns.
+    '''
+    return next(iter_records_frames(json_data, keep_meta=keep_meta))
 
-    expected_not_seen = list(set(expected_df.index) - set(actual_df.index))
-    actual_not_expected = list(set(actual_df.index) - set(expected_df.index))
+def read_csv_header(filename, dialect='excel'):
+    '''
+    Returns list of column names from the first row of CSV file.
+    '''
+    with open(filename, newline='') as f:
+        return next(csv.reader(f, dialect), [])
 
-    # Checking for duplicated ids in UNIQUE_COL.
-    # In fact, I wouldn't have to check for duplicates in expected_df
-    # assuming that the data will be clean. In this scenario, however,
-    # I have to make sure that both dataframes have unique indexes.
-    duplicated_rows_expected = [row for row, count in Counter(expected_df.index).items() if count > 1]
-    duplicated_rows_actual = [row for row, count in Counter(actual_df.index).items() if count > 1]
+def iter_arrow_csv_frames(filename, columns=None, dtypes=None, dialect='excel', block_size=None, fallback_chunksize=100000):
+    '''
+    Read CSV file batch by batch with pyarrow.csv streaming reader.
+    Types of dtypes without Arrow equivalent are cast after conversion to pandas.
 
-    rows_with_errors = (
-        (duplicated_rows_actual, f"Duplicated {UNIQUE_COL} in actual data", 2),
-        (duplicated_rows_expected, f"Duplicated {UNIQUE_COL} in expected data", 3),
-        (expected_not_seen, f"Missing row in actual data", 4),
-        (actual_not_expected, f"Excessive row in actual data", 5),
+    The reader infers types of columns from the first block of block_size bytes, so a value of another
+    type later in the file (e.g. 'Young' in float column Age) can not be converted. Rows following
+    the last converted batch are then read by pandas parser in chunks of fallback_chunksize rows.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        raise ImportError("Reading CSV files with pyarrow engine requires pyarrow library. Install it with 'pip install pyarrow'.")
+    if isinstance(dialect, str):
+        dialect = csv.get_dialect(dialect)
+    column_types, casts = {}, {}
+    for name, dtype in (dtypes or {}).items():
+        try:
+            column_types[name] = pyarrow.from_numpy_dtype(np.dtype(dtype))
+        except (TypeError, pyarrow.ArrowNotImplementedError):
+            casts[name] = dtype
+    convert_options = {'column_types':column_types, 'strings_can_be_null':True}
+    if columns is not None:
+        convert_options['include_columns'] = columns
+    reader = pyarrow.csv.open_csv(
+        filename,
+        read_options=pyarrow.csv.ReadOptions(**({'block_size':block_size} if block_size else {})),
+        parse_options=pyarrow.csv.ParseOptions(
+            delimiter=dialect.delimiter,
+            quote_char=dialect.quotechar or False,
+            double_quote=dialect.doublequote,
+            escape_char=dialect.escapechar or False,
+            ),
+        convert_options=pyarrow.csv.ConvertOptions(**convert_options),
         )
+    rows = 0
+    while True:
+        try:
+            batch = reader.read_next_batch()
+        except StopIteration:
+            return
+        except pyarrow.ArrowInvalid:
+            break
+        frame = batch.to_pandas()
+        # Null strings are None in pyarrow and NaN in pandas.read_csv
+        for col_name in frame.columns[frame.dtypes == object]:
+            frame[col_name] = frame[col_name].where(frame[col_name].notna(), np.nan)
+        rows += len(frame)
+        yield frame.astype(casts) if casts else frame
+    yield from pd.read_csv(filename, dialect=dialect, usecols=columns, dtype=dtypes, skiprows=lambda row: 0 < row <= rows,
+        chunksize=fallback_chunksize)
 
-    for rows, error_message, error_code in rows_with_errors:
-        for row in rows:
-            Logger.add({
-                UNIQUE_COL:row,
-                'error_message':error_message,
-                'error_code':error_code,
-                })
+def resolve_csv_engine(engine):
+    '''
+    Returns 'pyarrow' for 'auto' engine if pyarrow is installed, 'c' otherwise.
+    '''
+    if engine != 'auto':
+        return engine
+    try:
+        import pyarrow.csv
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
 
-    # Making copy of dataframe for marking discrepencies in excel file
-    if excel_flag: 
-        excel_actual_df = actual_df.copy()
-        excel_expected_df = expected_df.copy()
+def iter_csv_frames(filename, chunksize=None, usecols=None, useids=None, unique_col='passengerid', dtype=None, engine='c',
+        dialect='excel', filter_chunksize=100000):
+    '''
+    Read CSV file into DataFrames of at most chunksize rows (or a single DataFrame if chunksize is None)
+    with lower-case column names.
 
-    # Dropping duplicated rows, expected not seen and seen but not expected
-    expected_df.drop(expected_not_seen, inplace=True)
-    actual_df.drop(actual_not_expected, inplace=True)
-    duplicated_rows = set(duplicated_rows_expected + duplicated_rows_actual)
-    for df in (expected_df, actual_df):
-        df.drop(duplicated_rows, inplace=True)
+    Only usecols columns (matched case-insensitively) are parsed and rows with unique_col value not in useids
+    are dropped chunk by chunk, so filtered out rows are never held in memory all at once.
+    dtype maps lower-case column names to types, which are then not inferred.
+    engine is 'c' (pandas parser), 'pyarrow' (pyarrow.csv streaming reader) or 'auto'.
+    '''
+    header = read_csv_header(filename, dialect)
+    columns = [name for name in header if name.lower() in usecols] if usecols else None
+    dtypes = {name:dtype[name.lower()] for name in header if name.lower() in dtype} if dtype else None
+    if resolve_csv_engine(engine) == 'pyarrow':
+        frames = iter_arrow_csv_frames(filename, columns, dtypes, dialect)
+    else:
+        read_chunksize = chunksize or (filter_chunksize if useids else None)
+        frames = pd.read_csv(filename, dialect=dialect, usecols=columns, dtype=dtypes, chunksize=read_chunksize)
+        if read_chunksize is None:
+            frames = [frames]
 
-    for col_name in actual_df.columns:
-        not_matched_bool = discrepencies_series_mask(actual_df[col_name], expected_df[col_name], isclose_flag=isclose_flag)
-        rows_not_matched = actual_df[not_matched_bool].index
-        for row in rows_not_matched:
-            Logger.add({
-                UNIQUE_COL:row,
-                'error_message':'wrong value',
-                'error_code':1,
-                'column_name':col_name,
-                'expected_value':expected_df.loc[row,:][col_name],
-                'actual_value':actual_df.loc[row,:][col_name],
-                })
+    useids = set(useids) if useids else None
+    selected = []
+    yielded = False
+    for frame in frames:
+        frame.columns = [c.lower() for c in frame.columns]
+        if useids is not None:
+            frame = frame[frame[unique_col].isin(useids)]
+        if chunksize and len(frame):
+            yield from iter_frame_chunks(frame, chunksize)
+            yielded = True
+        elif not chunksize or not selected:
+            selected.append(frame)
+    # Chunked reading yields an empty frame with all columns when no row was selected
+    if not yielded:
+        yield pd.concat(selected, ignore_index=True) if len(selected) > 1 else selected[0]
 
-    print(Logger.tabularize(), '\n')
+class ActualDataFetcher():
+    '''
+    Fetches records of actual data from API page by page.
+
+    First page tells the number of records (nhits), remaining pages are requested concurrently
+    over a pooled session by at most workers threads and yielded in order. If the API does not
+    report nhits, pages are requested one by one until a page shorter than page_size is returned.
+    Requests failed with connection errors, timeouts or 429/5xx responses are retried with
+    exponential backoff (backoff * 2 ** attempt seconds).
+
+    Args:
+        url (str): records endpoint url; rows and start query parameters are overridden
+        page_size (int): number of records requested at once
+        workers (int): maximum number of concurrent requests
+        timeout (float): timeout of a single request in seconds
+        retries (int): number of retries of a failed request
+        backoff (float): backoff factor of retries in seconds
+        keep_meta (bool): keep recordid and record_timestamp of records in normalized DataFrames
+
+    Methods:
+        iter_pages(first_response): yield lists of records page by page
+        iter_frames(first_response): yield normalized DataFrames page by page
+
+    Attributes:
+        nhits: number of records reported by the API
+        headers: headers of the first page response
+    '''
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, url, page_size=1000, workers=4, timeout=30, retries=3, backoff=0.5, keep_meta=False):
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        self.url = urlunsplit((scheme, netloc, path, '', fragment))
+        self.params = [(key, value) for key, value in parse_qsl(query) if key not in ('rows', 'start')]
+        self.page_size = page_size
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_meta = keep_meta
+        self.nhits = None
+        self.headers = {}
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, start, headers=None):
+        '''
+        Request page of records beginning at start, retrying on transient errors.
+        '''
+        params = self.params + [('rows', self.page_size), ('start', start)]
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout, headers=headers)
+                if response.status_code in self.RETRY_STATUSES:
+                    raise requests.exceptions.RetryError(f"API responded with status code {response.status_code}")
+                response.raise_for_status()
+                return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RetryError) as e:
+                if attempt == self.retries:
+                    if isinstance(e, requests.exceptions.ConnectionError):
+                        raise ValueError("Failed to establish new connection. Check your Internet connection and try again.")
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def get_records(self, start):
+        return self.get(start).json()['records']
+
+    def iter_pages(self, first_response=None):
+        '''
+        Yield lists of records page by page.
+        The first page is taken from first_response, if it has been requested already (see SnapshotCache).
+        '''
+        response = first_response or self.get(0)
+        self.headers = response.headers
+        json_response = response.json()
+        records = json_response['records']
+        self.nhits = json_response.get('nhits')
+        yield records
+
+        fetched = len(records)
+        if self.nhits is None:
+            while len(records) == self.page_size:
+                records = self.get_records(fetched)
+                fetched += len(records)
+                yield records
+            return
+
+        starts = iter(range(self.page_size, self.nhits, self.page_size))
+        with concurrent_futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque(executor.submit(self.get_records, start) for start in itertools.islice(starts, self.workers))
+            while pending:
+                records = pending.popleft().result()
+                for start in itertools.islice(starts, 1):
+                    pending.append(executor.submit(self.get_records, start))
+                fetched += len(records)
+                yield records
+        if fetched != self.nhits:
+            raise ValueError(f"Fetched {fetched} records, but API reported {self.nhits} records.")
+
+    def iter_frames(self, first_response=None):
+        '''
+        Yield normalized DataFrames page by page.
+        '''
+        for records in self.iter_pages(first_response):
+            if records:
+                yield load_json_data(records, keep_meta=self.keep_meta)
+
+def load_actual_data(fetcher=None, lean=False, first_response=None, unique_col='passengerid'):
+    '''
+    Retrieve actual data from API page by page and normalize it.
+    If lean is True, every page is compacted with compact_frame as soon as it is parsed.
+    First page is not requested again if its response is given as first_response.
+    If the API returns no records, DataFrame without rows and with unique_col (and meta columns) is returned.
+
+    May raise requests exceptions like HTTPError, RetryError, Timeout.
+    '''
+    fetcher = fetcher or ActualDataFetcher(API_URL)
+    frames = [compact_frame(frame) if lean else frame for frame in fetcher.iter_frames(first_response)]
+    if not frames:
+        return pd.DataFrame(columns=[unique_col] + (META_COLUMNS if fetcher.keep_meta else []))
+    if lean:
+        return concat_compact_frames(frames)
+    return pd.concat(frames, ignore_index=True)
+
+class SnapshotCache():
+    '''
+    Local cache of normalized actual data.
+
+    Snapshots are stored in directory as Feather files (or pickles if pyarrow is not installed
+    or the data can not be stored as Feather) together with meta.json file holding validators
+    (ETag and Last-Modified headers of the first page) and timestamps of each snapshot.
+    A snapshot validated less than ttl seconds ago is used without any request. An older one is
+    revalidated with a conditional request of the first page and reused if API responds with
+    304 Not Modified. Otherwise data is fetched again (starting with the page already received)
+    and only keep newest snapshots are kept.
+
+    Args:
+        directory (str): path to cache directory
+        ttl (float): number of seconds during which snapshot is used without revalidation
+        offline (bool): if True, newest snapshot is used without any request
+        keep (int): number of snapshots kept for each url
+
+    Methods:
+        load(fetcher): returns DataFrame of actual data served by fetcher
+    '''
+    def __init__(self, directory, ttl=3600, offline=False, keep=3):
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.keep = keep
+
+    def url_directory(self, fetcher):
+        key = hashlib.sha1(f'{fetcher.url}?{sorted(fetcher.params)}&keep_meta={fetcher.keep_meta}'.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, key)
+
+    def read_meta(self, directory):
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'snapshots':[]}
+
+    def write_meta(self, directory, meta):
+        tmp_filename = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp_filename, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_filename, os.path.join(directory, 'meta.json'))
+
+    def read_snapshot(self, directory, snapshot):
+        filename = os.path.join(directory, snapshot['filename'])
+        if not filename.endswith('.feather'):
+            return pd.read_pickle(filename)
+        actual_df = pd.read_feather(filename)
+        # Feather stores missing strings as nulls which are read back as None instead of NaN
+        for col_name in actual_df.columns[actual_df.dtypes == 'object']:
+            actual_df[col_name] = actual_df[col_name].where(actual_df[col_name].notna(), float('nan'))
+        return actual_df
+
+    def write_snapshot(self, directory, actual_df, stem):
+        try:
+            filename = f'{stem}.feather'
+            actual_df.to_feather(os.path.join(directory, filename))
+        except Exception:
+            filename = f'{stem}.pickle'
+            actual_df.to_pickle(os.path.join(directory, filename))
+        return filename
+
+    def load(self, fetcher):
+        '''
+        Returns DataFrame of actual data from cache or from fetcher.
+        '''
+        directory = self.url_directory(fetcher)
+        os.makedirs(directory, exist_ok=True)
+        meta = self.read_meta(directory)
+        snapshot = meta['snapshots'][-1] if meta['snapshots'] else None
+        now = time.time()
+
+        if self.offline:
+            if snapshot is None:
+                raise ValueError(f"There is no cached snapshot of {fetcher.url} to use in offline mode.")
+            return self.read_snapshot(directory, snapshot)
+
+        first_response = None
+        if snapshot is not None:
+            if now - snapshot['validated_at'] < self.ttl:
+                return self.read_snapshot(directory, snapshot)
+            headers = {}
+            if snapshot.get('etag'):
+                headers['If-None-Match'] = snapshot['etag']
+            if snapshot.get('last_modified'):
+                headers['If-Modified-Since'] = snapshot['last_modified']
+            if headers:
+                first_response = fetcher.get(0, headers=headers)
+                if first_response.status_code == 304:
+                    snapshot['validated_at'] = now
+                    self.write_meta(directory, meta)
+                    return self.read_snapshot(directory, snapshot)
+
+        actual_df = load_actual_data(fetcher, first_response=first_response)
+        filename = self.write_snapshot(directory, actual_df, stem=f'snapshot-{int(now * 1000)}')
+        meta['url'] = fetcher.url
+        meta['snapshots'].append({
+            'filename':filename,
+            'etag':fetcher.headers.get('ETag'),
+            'last_modified':fetcher.headers.get('Last-Modified'),
+            'fetched_at':now,
+            'validated_at':now,
+            })
+        for old_snapshot in meta['snapshots'][:-self.keep]:
+            try:
+                os.remove(os.path.join(directory, old_snapshot['filename']))
+            except FileNotFoundError:
+                pass
+        meta['snapshots'] = meta['snapshots'][-self.keep:]
+        self.write_meta(directory, meta)
+        return actual_df
+
+def compact_frame(df, max_distinct=0.5):
+    '''
+    Returns shallow copy of df with compact dtypes.
+
+    Integer columns are downcast to the smallest integer type holding their values and columns
+    of strings with at most max_distinct distinct values per row are converted to categoricals.
+    Float columns are kept, as downcasting them would change compared values.
+    '''
+    df = df.copy(deep=False)
+    for col_name in df.columns:
+        series = df[col_name]
+        if series.dtype.kind in 'iu':
+            df[col_name] = pd.to_numeric(series, downcast='integer')
+        elif (series.dtype == 'object' and len(series) and series.nunique() <= max_distinct * len(series)
+                and pd.api.types.infer_dtype(series, skipna=True) == 'string'):
+            df[col_name] = series.astype('category')
+    return df
+
+def conform_dtypes(expected_df, actual_df):
+    '''
+    Convert columns of actual_df to compact dtypes of expected_df (see compact_frame).
+
+    Integer columns are cast to the expected type if their values fit in it, otherwise the
+    expected column is upcast. Strings are converted to categoricals sharing categories of the
+    expected column (extended with new actual values), so they are compared by codes. Columns
+    of other kinds are left as they are, so they compare the same way as without compaction.
+
+    Returns shallow copies of (expected_df, actual_df).
+    '''
+    expected_df, actual_df = expected_df.copy(deep=False), actual_df.copy(deep=False)
+    for col_name in actual_df.columns.intersection(expected_df.columns):
+        expected_col, actual_col = expected_df[col_name], actual_df[col_name]
+        if expected_col.dtype.kind in 'iu' and actual_col.dtype.kind in 'iu':
+            dtype = np.promote_types(expected_col.dtype, pd.to_numeric(actual_col, downcast='integer').dtype)
+            if dtype != expected_col.dtype:
+                expected_df[col_name] = expected_col.astype(dtype)
+            actual_df[col_name] = actual_col.astype(dtype)
+        elif isinstance(expected_col.dtype, pd.CategoricalDtype) and (isinstance(actual_col.dtype, pd.CategoricalDtype)
+                or actual_col.dtype == 'object' and pd.api.types.infer_dtype(actual_col, skipna=True) in ('string', 'empty')):
+            categories = expected_col.cat.categories
+            new_categories = pd.Index(actual_col.dropna().unique()).difference(categories)
+            if len(new_categories):
+                categories = categories.append(new_categories)
+                expected_df[col_name] = expected_col.cat.set_categories(categories)
+            actual_df[col_name] = pd.Series(pd.Categorical(actual_col, categories=categories), index=actual_col.index)
+    return expected_df, actual_df
+
+def concat_compact_frames(frames):
+    '''
+    Concatenate frames compacted with compact_frame. Columns which are categorical in all frames
+    are combined with union of their categories instead of falling back to objects.
+    '''
+    columns = list(dict.fromkeys(col_name for frame in frames for col_name in frame.columns))
+    categorical_cols = [col_name for col_name in columns
+        if all(col_name in frame.columns and isinstance(frame[col_name].dtype, pd.CategoricalDtype) for frame in frames)]
+    df = pd.concat([frame.drop(columns=categorical_cols) for frame in frames], ignore_index=True)
+    for col_name in categorical_cols:
+        df.insert(columns.index(col_name), col_name, pd.api.types.union_categoricals([frame[col_name] for frame in frames], ignore_order=True))
+    return df
+
+def _both_null(df1, df2):
+    # Property of Nan is that NaN != Nan is equal True, NaN == NaN is equal False.
+    # Bearing that in mind, I have to check if values are not both NaNs.
+    return pd.isnull(df1.values) & pd.isnull(df2.values)
+
+def _same_dtype(df1, df2):
+    # Unordered categoricals are of equal dtypes even if their categories are in different order,
+    # but only categoricals with categories in the same order have comparable codes
+    if df1.dtype != df2.dtype:
+        return False
+    return not isinstance(df1.dtype, pd.CategoricalDtype) or df1.cat.categories.equals(df2.cat.categories)
+
+def _string_mismatches(df1, df2, tolerance=None):
+    '''
+    Compare string representations of values. Only series which do not hold strings already are converted.
+    '''
+    def strings(series):
+        if series.dtype == 'object' and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+            return series.values
+        return series.astype(str).values
+    return ~(strings(df1) == strings(df2)) & ~_both_null(df1, df2)
+
+def _coerced_mismatches(df1, df2, convert, tolerance=None):
+    '''
+    Compare values converted by convert function (returning NaN/NaT for values it can not convert).
+    Bad cells, which hold a value that can not be converted on either side, are compared as strings.
+    '''
+    values1, values2 = convert(df1), convert(df2)
+    bad = (pd.isnull(values1) & pd.notnull(df1.values)) | (pd.isnull(values2) & pd.notnull(df2.values))
+    if tolerance:
+        equal = np.isclose(values1.astype('float64'), values2.astype('float64'), rtol=tolerance[0], atol=tolerance[1])
+    else:
+        equal = values1 == values2
+    mask = ~equal & ~_both_null(df1, df2)
+    if bad.any():
+        bad_cells = np.flatnonzero(bad)
+        mask[bad_cells] = _string_mismatches(df1.iloc[bad_cells], df2.iloc[bad_cells])
+    return mask
+
+def _numbers(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    return np.asarray(pd.to_numeric(series, errors='coerce'))
+
+def _datetimes(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    return np.asarray(pd.to_datetime(series, errors='coerce'))
+
+def _int_mismatches(df1, df2, tolerance=None):
+    return _coerced_mismatches(df1, df2, _numbers)
+
+def _float_mismatches(df1, df2, tolerance=None):
+    return _coerced_mismatches(df1, df2, _numbers, tolerance)
+
+def _datetime_mismatches(df1, df2, tolerance=None):
+    return _coerced_mismatches(df1, df2, _datetimes)
+
+def _category_mismatches(df1, df2, tolerance=None):
+    '''
+    Compare codes of both series in categories shared by them. Categoricals sharing categories in the
+    same order (see conform_dtypes) are compared without any conversion; NaN has code -1 on both sides.
+    '''
+    if not (isinstance(df1.dtype, pd.CategoricalDtype) and _same_dtype(df1, df2)):
+        categories1 = df1.cat.categories if isinstance(df1.dtype, pd.CategoricalDtype) else pd.Index(df1.dropna().unique())
+        categories2 = df2.cat.categories if isinstance(df2.dtype, pd.CategoricalDtype) else pd.Index(df2.dropna().unique())
+        categories = categories1.append(categories2).unique()
+        df1, df2 = [pd.Series(pd.Categorical(series, categories=categories), index=series.index) for series in (df1, df2)]
+    return df1.cat.codes.values != df2.cat.codes.values
+
+def _exact_mismatches(df1, df2, tolerance=None):
+    return ~(df1.values == df2.values) & ~_both_null(df1, df2)
+
+# Classes of cells in mixed columns: missing, integer, float and other value compared as string.
+# Strings are classified as integers, floats or other values after parsing.
+_NULL_CELL, _INT_CELL, _FLOAT_CELL, _OTHER_CELL, _STRING_CELL = 0, 1, 2, 3, 4
+_CELL_CLASSES = {}
+
+def _cell_classes():
+    '''
+    Returns dict of cell classes by type of value. Built on first use, so that numpy is not imported with TPC.
+    '''
+    if not _CELL_CLASSES:
+        _CELL_CLASSES.update({value_type:_INT_CELL for value_type in (int, np.int8, np.int16, np.int32, np.int64,
+            np.uint8, np.uint16, np.uint32, np.uint64)})
+        _CELL_CLASSES.update({value_type:_FLOAT_CELL for value_type in (float, np.float16, np.float32, np.float64)})
+        _CELL_CLASSES[str] = _STRING_CELL
+    return _CELL_CLASSES
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+def _parse_numbers(strings, block_size=65536):
+    '''
+    Returns float64 array of numbers held by array of strings, NaN where a string does not hold a number.
+    Strings are converted by numpy block by block; only blocks with a bad value are parsed one by one.
+    '''
+    numbers = np.empty(len(strings))
+    for start in range(0, len(strings), block_size):
+        block = strings[start:start + block_size]
+        try:
+            numbers[start:start + len(block)] = block.astype('float64')
+        except ValueError:
+            numbers[start:start + len(block)] = [_to_float(value) for value in block]
+    return numbers
+
+def typed_cells(series):
+    '''
+    Split series into cells of int, float and other values.
+
+    Strings holding numbers are coerced: integer literals to ints, other numbers to floats.
+    Returns tuple (classes, numbers, values, strings) of arrays: cell classes (_NULL_CELL, _INT_CELL,
+    _FLOAT_CELL or _OTHER_CELL), numeric values of int and float cells, original values and mask
+    of cells holding strings.
+    '''
+    if series.dtype.kind in 'iuf':
+        numbers = series.values.astype('float64')
+        if series.dtype.kind == 'f':
+            classes = np.where(np.isnan(numbers), _NULL_CELL, _FLOAT_CELL).astype('int8')
+        else:
+            classes = np.full(len(series), _INT_CELL, dtype='int8')
+        return classes, numbers, series.values, np.zeros(len(series), dtype=bool)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    elif series.dtype != 'object':
+        series = series.astype(str)
+
+    values = series.values
+    null = pd.isnull(values)
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred in ('string', 'empty'):
+        classes = np.full(len(values), _OTHER_CELL, dtype='int8')
+        is_string = ~null
+    else:
+        cell_classes = _cell_classes()
+        classes = np.fromiter((cell_classes.get(type(value), _OTHER_CELL) for value in values), dtype='int8', count=len(values))
+        is_string = classes == _STRING_CELL
+        classes[is_string] = _OTHER_CELL
+    classes[null] = _NULL_CELL
+    numbers = np.full(len(values), np.nan)
+    numeric = (classes == _INT_CELL) | (classes == _FLOAT_CELL)
+    if numeric.any():
+        numbers[numeric] = values[numeric].astype('float64')
+
+    # Numbers held by strings
+    strings = np.flatnonzero(is_string)
+    if len(strings):
+        parsed = _parse_numbers(values[strings])
+        parsed_cells = ~np.isnan(parsed)
+        strings, parsed = strings[parsed_cells], parsed[parsed_cells]
+        numbers[strings] = parsed
+        integral = parsed == np.floor(parsed)
+        int_literals = np.zeros(len(strings), dtype=bool)
+        int_literals[integral] = [value.strip().lstrip('+-').isdigit() for value in values[strings[integral]]]
+        classes[strings] = np.where(int_literals, _INT_CELL, _FLOAT_CELL)
+    return classes, numbers, values, is_string
+
+def _mixed_mismatches(df1, df2, tolerance=None):
+    '''
+    Compare series of different dtypes or with values of different types cell by cell.
+
+    Ints are equal to ints and floats to floats (with tolerance, if given) of the same value.
+    Values of different classes are not equal and remaining values are compared as strings.
+    A string is compared as a number only with a number; two strings are compared as strings,
+    the same way as in columns holding strings only.
+    '''
+    # In rare cases, wrong data can change column's data type.
+    # For example, string "young" in column Age (dtype float64) leaves the column with objects,
+    # so only the cell holding it is compared as string.
+    classes1, numbers1, values1, strings1 = typed_cells(df1)
+    classes2, numbers2, values2, strings2 = typed_cells(df2)
+    both_strings = strings1 & strings2
+    classes1[both_strings] = classes2[both_strings] = _OTHER_CELL
+    mask = classes1 != classes2
+    same = ~mask
+    floats = same & (classes1 == _FLOAT_CELL)
+    if tolerance:
+        mask[floats] = ~np.isclose(numbers1[floats], numbers2[floats], rtol=tolerance[0], atol=tolerance[1])
+    else:
+        mask[floats] = numbers1[floats] != numbers2[floats]
+    ints = same & (classes1 == _INT_CELL)
+    mask[ints] = numbers1[ints] != numbers2[ints]
+    others = np.flatnonzero(same & (classes1 == _OTHER_CELL))
+    if len(others):
+        mask[others] = [str(value1) != str(value2) for value1, value2 in zip(values1[others], values2[others])]
+    return mask
+
+COLUMN_KERNELS = {
+    'int':_int_mismatches,
+    'float':_float_mismatches,
+    'string':_string_mismatches,
+    'category':_category_mismatches,
+    'datetime':_datetime_mismatches,
+    'exact':_exact_mismatches,
+    'mixed':_mixed_mismatches,
+    }
+SCHEMA_KINDS = ['int', 'float', 'string', 'category', 'datetime']
+
+def column_kind(df1, df2):
+    '''
+    Infer kind of comparison (key of COLUMN_KERNELS) of two series from their dtypes.
+    '''
+    if df1.dtype != df2.dtype:
+        return 'mixed'
+    if isinstance(df1.dtype, pd.CategoricalDtype):
+        return 'category'
+    if df1.dtype == 'object':
+        strings = ('string', 'empty')
+        if pd.api.types.infer_dtype(df1, skipna=True) in strings and pd.api.types.infer_dtype(df2, skipna=True) in strings:
+            return 'string'
+        return 'mixed'
+    return {'i':'int', 'u':'int', 'f':'float', 'M':'datetime'}.get(df1.dtype.kind, 'exact')
+
+def parse_schema(s):
+    '''
+    Parse comma-separated column:kind[:rtol[:atol]] items of schema into dict of column rules.
+    '''
+    schema = {}
+    for item in s.split(','):
+        col_name, kind, *tolerances = item.split(':')
+        if kind not in SCHEMA_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown kind '{kind}' of column {col_name}, use one of {', '.join(SCHEMA_KINDS)}.")
+        if tolerances and kind != 'float' or len(tolerances) > 2:
+            raise argparse.ArgumentTypeError(f"Tolerances rtol[:atol] can be given for float columns only, not '{item}'.")
+        rule = {'kind':kind}
+        rule.update(zip(['rtol', 'atol'], [float(tolerance) for tolerance in tolerances]))
+        schema[col_name.lower()] = rule
+    return schema
+
+def discrepencies_series_mask(df1, df2, isclose_flag=True, rule=None):
+    '''
+    Compares two series and returns False if values matches and True if they don't.
+    
+    There are a handful of questions that the project manager would have to answer:
+    * Is 15 == 15.0?
+    * Is "15" == 15.0?
+    * Is 15.0000000005 == 15.0?
+    * Is 15.0000000005 == 15?
+    * Is 15.0000000005 == "15"?
+    
+    For simplicity reasons I assumed that we are only interested in comparing floating point 
+    numbers using the numpy.isclose function if isclose_flag == True. Integer 15 and 15.0
+    are not considered equal. However, if it were to be changed in the future, the function
+    pandas.to_numeric wit errors=coerce can be used.
+
+    Series are compared by a kernel (see COLUMN_KERNELS) chosen by rule, a dict with kind of
+    the column (one of SCHEMA_KINDS) and optional rtol and atol tolerances of float comparison.
+    Without rule, kind is inferred from dtypes by column_kind. Series of different dtypes or with
+    values of different types are compared cell by cell (see typed_cells), so a single wrong value
+    neither disables numpy.isclose comparison of remaining floats nor converts them to strings.
+    '''
+    rule = rule or {}
+    kind = rule.get('kind') or column_kind(df1, df2)
+    if 'rtol' in rule or 'atol' in rule:
+        tolerance = (rule.get('rtol', 1e-05), rule.get('atol', 1e-08))
+    elif isclose_flag:
+        # API is producing results like fare = 7.8542000000000005 so I recommend using -f flag
+        tolerance = (1e-05, 1e-08)
+    else:
+        tolerance = None
+    return pd.Series(COLUMN_KERNELS[kind](df1, df2, tolerance), index=df1.index)
+
+def normalize_floats(series, digits=10):
+    '''
+    Round floats to given number of significant digits.
+
+    Floats equal after rounding to 10 significant digits differ by less than 1e-9 of their
+    magnitude, so they are also equal according to numpy.isclose with default tolerances.
+    '''
+    values = series.values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = 10.0 ** (np.floor(np.log10(np.abs(values))) - (digits - 1))
+        rounded = np.round(values / magnitude) * magnitude
+    return pd.Series(np.where(np.isfinite(values) & (values != 0), rounded, values), index=series.index)
+
+def _hashable_columns(df1, df2):
+    # Objects other than strings are hashed by their string representations (e.g. None like 'None'),
+    # but compared by their types, so only object columns holding strings are hashed
+    if not _same_dtype(df1, df2):
+        return False
+    strings = ('string', 'empty')
+    return df1.dtype != 'object' or (pd.api.types.infer_dtype(df1, skipna=True) in strings
+        and pd.api.types.infer_dtype(df2, skipna=True) in strings)
+
+def changed_rows_mask(expected_df, actual_df, columns, isclose_flag=True, sample_size=1000, max_changed=0.5):
+    '''
+    Returns boolean array marking aligned rows whose values in columns may differ.
+
+    Rows of both dataframes are hashed column by column with vectorized pandas.util.hash_array,
+    so rows with equal hashes hold equal values. With isclose_flag, float64 columns are normalized
+    with normalize_floats before hashing, so rows with equal hashes are also equal according to
+    discrepencies_series_mask. Columns must have the same dtype in both dataframes and categorical
+    columns the same categories in the same order (see _same_dtype). Object columns must hold strings
+    only (see _hashable_columns), as other objects are hashed by their string representations.
+
+    Hashing pays off only if most rows are equal, so a sample of rows is hashed first and if more
+    than max_changed of them differ, all rows are marked as changed.
+    '''
+    def hash_rows(df, rows=None):
+        row_hash = np.zeros(len(df) if rows is None else len(rows), dtype='uint64')
+        for col_name in columns:
+            series = df[col_name] if rows is None else df[col_name].iloc[rows]
+            if isclose_flag and series.dtype == 'float64':
+                series = normalize_floats(series)
+            elif isinstance(series.dtype, pd.CategoricalDtype):
+                # Hashed categoricals share categories in the same order on both sides, so their codes are comparable
+                series = series.cat.codes
+            hashed = pd.util.hash_array(series.values, categorize=categorize[col_name])
+            if series.dtype == 'object':
+                # Missing values are hashed like strings 'None' and 'nan', so they are tagged
+                hashed = hashed ^ (pd.isnull(series.values) * np.uint64(0x9E3779B97F4A7C15))
+            row_hash = (row_hash * np.uint64(1000003)) ^ hashed
+        return row_hash
+
+    sample = np.unique(np.linspace(0, len(expected_df) - 1, num=min(sample_size, len(expected_df))).astype(int))
+    # Factorizing before hashing is faster for columns with few distinct values
+    categorize = {col_name:expected_df[col_name].iloc[sample].nunique() < len(sample) / 2 for col_name in columns}
+    if (hash_rows(expected_df, sample) != hash_rows(actual_df, sample)).mean() > max_changed:
+        return np.ones(len(expected_df), dtype=bool)
+    return hash_rows(expected_df) != hash_rows(actual_df)
+
+# Column pairs inherited by forked workers of parallel_series_masks
+_inherited_column_pairs = []
+
+def _compare_inherited_series(position, isclose_flag, rule=None):
+    actual_col, expected_col = _inherited_column_pairs[position]
+    return np.flatnonzero(discrepencies_series_mask(actual_col, expected_col, isclose_flag=isclose_flag, rule=rule).values)
+
+def _compare_shared_series(descriptors, isclose_flag, rule=None):
+    from multiprocessing import shared_memory
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in descriptors]
+    try:
+        actual_col, expected_col = [
+            pd.Series(np.ndarray(shape, dtype=dtype, buffer=block.buf), copy=False)
+            for block, (_, dtype, shape) in zip(blocks, descriptors)
+            ]
+        positions = np.flatnonzero(discrepencies_series_mask(actual_col, expected_col, isclose_flag=isclose_flag, rule=rule).values)
+        del actual_col, expected_col
+        return positions
+    finally:
+        for block in blocks:
+            block.close()
+
+def parallel_series_masks(column_pairs, isclose_flag=True, jobs=2, use_fork=None, rules=None):
+    '''
+    Compute discrepencies_series_mask of (actual, expected) series pairs in a pool of jobs processes.
+
+    Series are not pickled to workers. Where fork start method is available, workers inherit them
+    from the parent's memory. Otherwise series of fixed-width dtypes (numbers, booleans, dates) are
+    copied once to shared memory blocks and remaining series are compared by the parent process
+    while workers are busy. Workers return positions of mismatched values only.
+
+    Rules of comparison (see discrepencies_series_mask) can be given in a list ordered like column_pairs.
+    Returns list of boolean arrays in order of column_pairs.
+    '''
+    global _inherited_column_pairs
+    rules = rules or [None] * len(column_pairs)
+    if use_fork is None:
+        use_fork = 'fork' in multiprocessing.get_all_start_methods()
+    positions = [None] * len(column_pairs)
+
+    if use_fork:
+        _inherited_column_pairs = column_pairs
+        try:
+            with concurrent_futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+                positions = list(executor.map(_compare_inherited_series, range(len(column_pairs)), itertools.repeat(isclose_flag), rules))
+        finally:
+            _inherited_column_pairs = []
+    else:
+        from multiprocessing import shared_memory
+        blocks, futures = [], {}
+        try:
+            with concurrent_futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                for position, pair in enumerate(column_pairs):
+                    if not all(col.dtype.kind in 'biufcmM' for col in pair):
+                        continue
+                    descriptors = []
+                    for col in pair:
+                        values = col.values
+                        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                        blocks.append(block)
+                        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                        descriptors.append((block.name, values.dtype.str, values.shape))
+                    futures[position] = executor.submit(_compare_shared_series, descriptors, isclose_flag, rules[position])
+                for position, (actual_col, expected_col) in enumerate(column_pairs):
+                    if position not in futures:
+                        positions[position] = np.flatnonzero(discrepencies_series_mask(actual_col, expected_col, isclose_flag=isclose_flag,
+                            rule=rules[position]).values)
+                for position, future in futures.items():
+                    positions[position] = future.result()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    masks = []
+    for (actual_col, _), mismatched in zip(column_pairs, positions):
+        mask = np.zeros(len(actual_col), dtype=bool)
+        mask[mismatched] = True
+        masks.append(mask)
+    return masks
+
+def iter_column_discrepencies(expected_df, actual_df, unique_col, isclose_flag=True, row_hash=True, jobs=1, schema=None):
+    '''
+    Yields long-form DataFrames of wrong values found by column_discrepencies, one per column with
+    wrong values. Unless jobs > 1, each column is compared only when the frame of the previous one
+    has been consumed, so the comparison can be stopped early.
+    '''
+    hashed_cols = set()
+    if row_hash and len(actual_df):
+        # Rows equal after normalize_floats may still differ according to a schema rule (e.g. string or zero tolerance)
+        hashed_cols = {col_name for col_name in actual_df.columns
+            if _hashable_columns(actual_df[col_name], expected_df[col_name]) and col_name not in (schema or {})}
+    if hashed_cols:
+        candidates = changed_rows_mask(expected_df, actual_df, [c for c in actual_df.columns if c in hashed_cols], isclose_flag=isclose_flag)
+        hashed_expected_df, hashed_actual_df = expected_df[candidates], actual_df[candidates]
+
+    column_pairs = []
+    for col_name in actual_df.columns:
+        if col_name in hashed_cols:
+            column_pairs.append((hashed_actual_df[col_name], hashed_expected_df[col_name]))
+        else:
+            column_pairs.append((actual_df[col_name], expected_df[col_name]))
+    rules = [(schema or {}).get(col_name) for col_name in actual_df.columns]
+    if jobs > 1 and len(column_pairs) > 1:
+        masks = parallel_series_masks(column_pairs, isclose_flag=isclose_flag, jobs=jobs, rules=rules)
+    else:
+        masks = (discrepencies_series_mask(actual_col, expected_col, isclose_flag=isclose_flag, rule=rule).values
+            for (actual_col, expected_col), rule in zip(column_pairs, rules))
+
+    for col_name, (actual_col, expected_col), not_matched_bool in zip(actual_df.columns, column_pairs, masks):
+        if not not_matched_bool.any():
+            continue
+        yield pd.DataFrame({
+            unique_col:actual_col.index[not_matched_bool],
+            'error_message':'wrong value',
+            'error_code':1,
+            'column_name':col_name,
+            'expected_value':expected_col.values[not_matched_bool],
+            'actual_value':actual_col.values[not_matched_bool],
+            })
+
+def concat_column_discrepencies(frames, unique_col):
+    '''
+    Concatenate frames yielded by iter_column_discrepencies into a single long-form DataFrame.
+    '''
+    if not frames:
+        return pd.DataFrame(columns=[unique_col, 'error_message', 'error_code', 'column_name', 'expected_value', 'actual_value'])
+    return pd.concat(frames, ignore_index=True)
+
+def column_discrepencies(expected_df, actual_df, unique_col, isclose_flag=True, row_hash=True, jobs=1, schema=None):
+    '''
+    Compare two dataframes with identical, unique and sorted indexes column by column.
+
+    If row_hash is True, rows which are equal in all columns of the same dtype on both sides
+    are found with changed_rows_mask first and only remaining rows are compared in those columns.
+    Columns of different dtypes, object columns holding other values than strings and columns
+    with a schema rule are always compared in full. If jobs > 1, columns are compared
+    in parallel with parallel_series_masks. Columns are compared according to rules of schema, a dict
+    of rules by column name (see discrepencies_series_mask and parse_schema).
+
+    Returns long-form DataFrame with one row per wrong value (error code 1) and columns
+    matching DiscrepenciesLogger fieldnames. Rows are ordered by column, then by index.
+    '''
+    frames = list(iter_column_discrepencies(expected_df, actual_df, unique_col, isclose_flag=isclose_flag, row_hash=row_hash, jobs=jobs,
+        schema=schema))
+    return concat_column_discrepencies(frames, unique_col)
+
+def check_columns(actual_columns, expected_columns, usecols=None):
+    '''
+    Check if both datasets contain selected columns or, if no columns are selected,
+    if expected data contains all columns of actual data.
+    '''
+    if usecols:
+        for columns, df_name in [(actual_columns, "Actual data"), (expected_columns, "Expected data")]:
+            if not all(col in columns for col in usecols):
+                missing_cols = ','.join([c for c in usecols if not c in columns])
+                raise argparse.ArgumentError(cols_arg, f"{df_name} does not contain column(s): {missing_cols}")
+    elif list(set(actual_columns) - set(expected_columns)):
+        raise ValueError("Columns of actual and expected dataframe do not match!\nUse '-c' argument to select columns.")
+
+def peek_chunks(chunks):
+    '''
+    Returns first chunk of chunks iterator and an iterator over all chunks.
+    Raises ValueError if there are no chunks.
+    '''
+    chunks = iter(chunks)
+    try:
+        first_chunk = next(chunks)
+    except StopIteration:
+        raise ValueError("Dataset is empty!")
+    return first_chunk, itertools.chain([first_chunk], chunks)
+
+def row_hashes(df):
+    '''
+    Returns Series of 64-bit hashes of df rows including index.
+    '''
+    return pd.util.hash_pandas_object(df, index=True)
+
+def incremental_column_discrepencies(expected_df, actual_df, unique_col, manifest_filename, isclose_flag=True, actual_meta=None, jobs=1,
+        schema=None):
+    '''
+    Incremental version of column_discrepencies.
+
+    Expected rows are fingerprinted with hashes of their contents and actual rows with hashes
+    of recordid and record_timestamp (if actual_meta contains them) or of their contents.
+    Only rows whose fingerprints changed since the run saved in manifest_filename are compared,
+    wrong values of the remaining rows are taken from the manifest. Manifest saved by a run
+    with different columns, isclose_flag or schema is ignored. New manifest is saved after comparison.
+    '''
+    settings = {'columns':list(actual_df.columns), 'isclose_flag':isclose_flag, 'schema':schema or {}}
+    expected_hashes = row_hashes(expected_df).values
+    if actual_meta is not None and len(actual_meta.columns):
+        actual_hashes = row_hashes(actual_meta).values
+    else:
+        actual_hashes = row_hashes(actual_df).values
+
+    unchanged = pd.Series(False, index=expected_df.index).values
+    previous_discrepencies = None
+    if os.path.exists(manifest_filename):
+        manifest = pd.read_pickle(manifest_filename)
+        if manifest['settings'] == settings:
+            positions = manifest['hashes'].index.get_indexer(expected_df.index)
+            found = positions >= 0
+            unchanged[found] = (
+                (manifest['hashes']['expected'].values[positions[found]] == expected_hashes[found])
+                & (manifest['hashes']['actual'].values[positions[found]] == actual_hashes[found])
+                )
+            previous_discrepencies = manifest['discrepencies']
+
+    frames = [column_discrepencies(expected_df[~unchanged], actual_df[~unchanged], unique_col, isclose_flag=isclose_flag, jobs=jobs,
+        schema=schema)]
+    if previous_discrepencies is not None:
+        frames.append(previous_discrepencies[previous_discrepencies[unique_col].isin(expected_df.index[unchanged])])
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    column_order = {col_name:position for position, col_name in enumerate(actual_df.columns)}
+    wrong_values = pd.concat(frames, ignore_index=True)
+    wrong_values = (
+        wrong_values.assign(column_order=wrong_values['column_name'].map(column_order))
+        .sort_values(['column_order', unique_col], kind='mergesort')
+        .drop(columns='column_order')
+        .reset_index(drop=True)
+        )
+
+    tmp_filename = f'{manifest_filename}.tmp'
+    pd.to_pickle({
+        'settings':settings,
+        'hashes':pd.DataFrame({'expected':expected_hashes, 'actual':actual_hashes}, index=expected_df.index),
+        'discrepencies':wrong_values,
+        }, tmp_filename)
+    os.replace(tmp_filename, manifest_filename)
+    return wrong_values
+
+def iter_frame_chunks(df, chunksize):
+    '''
+    Split in-memory DataFrame into chunks of chunksize rows.
+    '''
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+def narrow_chunks(chunks, unique_col, usecols=None, useids=None):
+    '''
+    Lower-case column names of each chunk and narrow it to given columns and IDs.
+    '''
+    for chunk in chunks:
+        chunk = chunk.rename(columns=str.lower)
+        if usecols:
+            chunk = chunk.reindex(columns=usecols)
+        if useids:
+            chunk = chunk[chunk[unique_col].isin(useids)]
+        yield chunk
+
+def spill_sorted_runs(chunks, columns, directory, prefix, block_size=10000):
+    '''
+    Sort each chunk by its first column and pickle it to a run file in blocks of block_size row tuples.
+    Returns list of run filenames.
+    '''
+    runs = []
+    for run_num, chunk in enumerate(chunks):
+        chunk = chunk.reindex(columns=columns).sort_values(columns[0], kind='mergesort')
+        run = os.path.join(directory, f'{prefix}-{run_num}.pickle')
+        with open(run, 'wb') as f:
+            for start in range(0, len(chunk), block_size):
+                block = list(chunk.iloc[start:start + block_size].itertuples(index=False, name=None))
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+        runs.append(run)
+    return runs
+
+def read_sorted_run(run):
+    '''
+    Yield row tuples of run file created with spill_sorted_runs.
+    '''
+    with open(run, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+def merge_sorted_runs(runs, directory, prefix, fan_in=128):
+    '''
+    Merge sorted run files into one stream of row tuples sorted by the first value.
+    If there are more than fan_in runs, they are merged in several passes so that
+    no more than fan_in files are open at once.
+    '''
+    merge_pass = 0
+    while len(runs) > fan_in:
+        merged_runs = []
+        for group_num, start in enumerate(range(0, len(runs), fan_in)):
+            group = runs[start:start + fan_in]
+            run = os.path.join(directory, f'{prefix}-merge{merge_pass}-{group_num}.pickle')
+            rows = heapq.merge(*[read_sorted_run(r) for r in group], key=itemgetter(0))
+            with open(run, 'wb') as f:
+                while True:
+                    block = list(itertools.islice(rows, 10000))
+                    if not block:
+                        break
+                    pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for r in group:
+                os.remove(r)
+            merged_runs.append(run)
+        runs = merged_runs
+        merge_pass += 1
+    return heapq.merge(*[read_sorted_run(r) for r in runs], key=itemgetter(0))
+
+def merge_join_groups(expected_rows, actual_rows):
+    '''
+    Join two streams of row tuples sorted by id (first value).
+    Yields (id, expected_rows, actual_rows) for each id found on any side in id order.
+    '''
+    expected_groups = ((key, list(group)) for key, group in itertools.groupby(expected_rows, key=itemgetter(0)))
+    actual_groups = ((key, list(group)) for key, group in itertools.groupby(actual_rows, key=itemgetter(0)))
+    expected_group, actual_group = next(expected_groups, None), next(actual_groups, None)
+    while expected_group is not None or actual_group is not None:
+        if actual_group is None or (expected_group is not None and expected_group[0] < actual_group[0]):
+            yield expected_group[0], expected_group[1], []
+            expected_group = next(expected_groups, None)
+        elif expected_group is None or actual_group[0] < expected_group[0]:
+            yield actual_group[0], [], actual_group[1]
+            actual_group = next(actual_groups, None)
+        else:
+            yield expected_group[0], expected_group[1], actual_group[1]
+            expected_group, actual_group = next(expected_groups, None), next(actual_groups, None)
+
+def stream_comparison(expected_chunks, actual_chunks, logger, unique_col, columns, isclose_flag=True, batch_size=100000, directory=None,
+        schema=None):
+    '''
+    Out-of-core comparison of datasets read in chunks.
+
+    Both sides are sorted by unique_col with an external sort-merge (sorted runs are spilled to
+    temporary files in directory), then joined by id. Ids duplicated, missing or excessive across
+    all chunks are logged with error codes 2-5 and rows present once on both sides are compared
+    in batches of batch_size rows with column_discrepencies. Errors are logged in id order, at latest
+    when batch_size compared rows or batch_size row errors are collected, and dtypes of compared values
+    are inferred per batch.
+
+    Parameters:
+        expected_chunks, actual_chunks (iterable): DataFrames with lower-cased column names
+        logger (DiscrepenciesLogger): logger receiving discrepencies, with keep_rows=False it holds at most
+            batch_size of them in memory
+        unique_col (str): name of column containing unique ids
+        columns (list): names of compared columns (without unique_col)
+        schema (dict): rules of comparison by column name (see column_discrepencies)
+    '''
+    layout = [unique_col] + list(columns)
+    error_messages = {
+        2:f"Duplicated {unique_col} in actual data",
+        3:f"Duplicated {unique_col} in expected data",
+        4:f"Missing row in actual data",
+        5:f"Excessive row in actual data",
+        }
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        expected_runs = spill_sorted_runs(expected_chunks, layout, tmp_dir, 'expected')
+        actual_runs = spill_sorted_runs(actual_chunks, layout, tmp_dir, 'actual')
+        expected_rows = merge_sorted_runs(expected_runs, tmp_dir, 'expected')
+        actual_rows = merge_sorted_runs(actual_runs, tmp_dir, 'actual')
+
+        row_errors = {unique_col:[], 'error_code':[]}
+        expected_batch, actual_batch = [], []
+
+        def flush():
+            logger.add_frame(pd.DataFrame({
+                unique_col:row_errors[unique_col],
+                'error_message':[error_messages[code] for code in row_errors['error_code']],
+                'error_code':row_errors['error_code'],
+                }))
+            row_errors[unique_col], row_errors['error_code'] = [], []
+            if expected_batch:
+                expected_df = pd.DataFrame.from_records(expected_batch, columns=layout).set_index(unique_col)
+                actual_df = pd.DataFrame.from_records(actual_batch, columns=layout).set_index(unique_col)
+                logger.add_frame(column_discrepencies(expected_df, actual_df, unique_col, isclose_flag=isclose_flag, schema=schema))
+                expected_batch.clear()
+                actual_batch.clear()
+
+        for row_id, expected_group, actual_group in merge_join_groups(expected_rows, actual_rows):
+            if len(expected_group) == 1 and len(actual_group) == 1:
+                expected_batch.append(expected_group[0])
+                actual_batch.append(actual_group[0])
+                if len(expected_batch) >= batch_size:
+                    flush()
+                continue
+            codes = []
+            if len(actual_group) > 1: codes.append(2)
+            if len(expected_group) > 1: codes.append(3)
+            if not actual_group: codes.append(4)
+            if not expected_group: codes.append(5)
+            row_errors[unique_col].extend([row_id] * len(codes))
+            row_errors['error_code'].extend(codes)
+            if len(row_errors[unique_col]) >= batch_size:
+                flush()
+        flush()
+
+def quote_identifier(name):
+    '''
+    Quote SQL identifier (name of table or column) with double quotes.
+    '''
+    return '"' + name.replace('"', '""') + '"'
+
+def sql_columns(connection, table):
+    '''
+    Returns dict mapping lower-cased names of table columns to their names in the database.
+    '''
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f'SELECT * FROM {quote_identifier(table)} WHERE 1 = 0')
+        return {description[0].lower():description[0] for description in cursor.description}
+    finally:
+        cursor.close()
+
+def sql_mismatch(expected_value, actual_value, tolerance=None):
+    '''
+    Returns SQL expression equal to 1 if two values differ and 0 otherwise. Two NULLs are equal.
+    With tolerance (rtol, atol), numbers are compared like numpy.isclose does, values which are
+    not numbers (value + 0 differs from value) are compared exactly.
+    '''
+    equal = f'{expected_value} = {actual_value}'
+    if tolerance:
+        rtol, atol = (repr(float(value)) for value in tolerance)
+        equal = (f'({equal} OR ({expected_value} + 0 = {expected_value} AND {actual_value} + 0 = {actual_value}'
+            f' AND ABS({actual_value} - {expected_value}) <= {atol} + {rtol} * ABS({expected_value})))')
+    return (f'CASE WHEN {expected_value} IS NULL AND {actual_value} IS NULL THEN 0'
+        f' WHEN {expected_value} IS NULL OR {actual_value} IS NULL THEN 1 WHEN {equal} THEN 0 ELSE 1 END')
+
+def sql_comparison(connection, expected_table, actual_table, logger, unique_col='passengerid', columns=None, ids=None,
+        isclose_flag=True, schema=None, batch_size=100000, sample_size=1000):
+    '''
+    Comparison of two tables of a database pushed down into the database engine.
+
+    Duplicated, missing and excessive ids (error codes 2-5) are found with GROUP BY and EXCEPT
+    queries, which need no index on unique_col. Rows with ids present once on both sides are
+    joined by the engine, which returns only rows with at least one wrong value. Results are
+    fetched in batches of batch_size rows, so neither table is loaded into memory. Errors with
+    codes 2-5 are logged first, wrong values after them in id order.
+
+    Values are compared with equality of the database (e.g. SQLite considers 15 and 15.0 equal).
+    Columns with rtol or atol in schema, columns of float kind in schema and, without schema rule,
+    columns with floats in first sample_size rows are compared like numpy.isclose does if
+    isclose_flag is True.
+
+    Parameters:
+        connection: DB-API connection to database containing both tables (e.g. sqlite3.Connection)
+        expected_table, actual_table (str): names of tables with expected and actual data
+        logger (DiscrepenciesLogger): logger receiving discrepencies
+        unique_col (str): lower-cased name of column containing unique ids
+        columns (list): lower-cased names of compared columns, all columns of actual table if None
+        ids (list): integer ids of compared rows, all rows if None
+        schema (dict): rules of comparison by column name (see column_discrepencies)
+    '''
+    expected_names, actual_names = sql_columns(connection, expected_table), sql_columns(connection, actual_table)
+    usecols = Comparator.selected_columns(columns, unique_col)
+    check_columns(list(actual_names), list(expected_names), usecols)
+    if unique_col not in expected_names or unique_col not in actual_names:
+        raise ValueError(f"Both tables must contain column {unique_col}.")
+    compared = [c for c in (usecols or actual_names) if c != unique_col]
+    expected, actual = quote_identifier(expected_table), quote_identifier(actual_table)
+    expected_key, actual_key = quote_identifier(expected_names[unique_col]), quote_identifier(actual_names[unique_col])
+    id_list = ', '.join(str(int(i)) for i in ids or [])
+
+    def where(*conditions, key):
+        conditions = list(conditions) + ([f'{key} IN ({id_list})'] if ids else [])
+        return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    def fetch(query):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    row_queries = (
+        (f'SELECT {actual_key} FROM {actual}{where(key=actual_key)} GROUP BY {actual_key} HAVING COUNT(*) > 1',
+            f"Duplicated {unique_col} in actual data", 2),
+        (f'SELECT {expected_key} FROM {expected}{where(key=expected_key)} GROUP BY {expected_key} HAVING COUNT(*) > 1',
+            f"Duplicated {unique_col} in expected data", 3),
+        (f'SELECT {expected_key} FROM {expected}{where(key=expected_key)} EXCEPT SELECT {actual_key} FROM {actual}',
+            f"Missing row in actual data", 4),
+        (f'SELECT {actual_key} FROM {actual}{where(key=actual_key)} EXCEPT SELECT {expected_key} FROM {expected}',
+            f"Excessive row in actual data", 5),
+        )
+    for query, error_message, error_code in row_queries:
+        for rows in fetch(query + ' ORDER BY 1'):
+            logger.add_frame(pd.DataFrame({unique_col:[row[0] for row in rows], 'error_message':error_message, 'error_code':error_code}))
+    if not compared:
+        return
+
+    # Tolerances of float comparison by column, kinds of columns without schema rule are inferred from samples
+    schema = schema or {}
+    samples = []
+    for table, names in [(expected, expected_names), (actual, actual_names)]:
+        query = f"SELECT {', '.join(quote_identifier(names[c]) for c in compared)} FROM {table} LIMIT {int(sample_size)}"
+        samples.append(pd.DataFrame.from_records([row for rows in fetch(query) for row in rows], columns=compared))
+    tolerances = {}
+    for col_name in compared:
+        rule = schema.get(col_name, {})
+        if 'rtol' in rule or 'atol' in rule:
+            tolerances[col_name] = (rule.get('rtol', 1e-05), rule.get('atol', 1e-08))
+        elif not isclose_flag:
+            continue
+        elif rule.get('kind') == 'float' or not rule and any(sample[col_name].dtype == 'float64' for sample in samples):
+            tolerances[col_name] = (1e-05, 1e-08)
+
+    width = len(compared)
+    flags = ', '.join(
+        sql_mismatch(f'e.{quote_identifier(expected_names[c])}', f'a.{quote_identifier(actual_names[c])}', tolerances.get(c))
+        + f' AS d{position}' for position, c in enumerate(compared))
+    values = ', '.join(f'e.{quote_identifier(expected_names[c])}, a.{quote_identifier(actual_names[c])}' for c in compared)
+    unique_ids = 'SELECT {key} FROM {table} GROUP BY {key} HAVING COUNT(*) = 1'
+    query = (f'SELECT * FROM (SELECT e.{expected_key}, {flags}, {values} FROM {expected} e JOIN {actual} a ON e.{expected_key} = a.{actual_key}'
+        + where(f'e.{expected_key} IN ({unique_ids.format(key=expected_key, table=expected)})',
+            f'a.{actual_key} IN ({unique_ids.format(key=actual_key, table=actual)})', key=f'e.{expected_key}')
+        + ') joined WHERE ' + ' OR '.join(f'd{position} = 1' for position in range(width)) + ' ORDER BY 1')
+    for rows in fetch(query):
+        wrong_values = {unique_col:[], 'column_name':[], 'expected_value':[], 'actual_value':[]}
+        for row in rows:
+            for position, col_name in enumerate(compared):
+                if row[1 + position]:
+                    wrong_values[unique_col].append(row[0])
+                    wrong_values['column_name'].append(col_name)
+                    wrong_values['expected_value'].append(row[1 + width + 2 * position])
+                    wrong_values['actual_value'].append(row[2 + width + 2 * position])
+        logger.add_frame(pd.DataFrame(dict(wrong_values, error_message='wrong value', error_code=1)))
+
+def _blocking_value(value):
+    '''
+    Normalize value of key column: whitespace of strings is collapsed and letters case-folded,
+    integral floats are written as integers, so 'Smith,  John' and 'smith, john' or 7.0 and 7 match.
+    '''
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def match_moved_rows(expected_df, actual_df, keys):
+    '''
+    Pair rows missing in actual data with excessive rows of actual data which are likely the same
+    records renumbered upstream.
+
+    Rows of both sides are grouped into blocks by normalized values of key columns (stable attributes
+    such as name and ticket), and only rows of the same block are paired, in id order within the block,
+    as renumbering usually keeps the order of records. Blocks are joined with a hash join, so the time
+    of matching is linear in the number of rows instead of comparing every missing row with every
+    excessive one. Rows with a missing key value and rows left without a pair in their block stay unmatched.
+
+    Parameters:
+        expected_df (pandas.DataFrame): rows missing in actual data, indexed by unique ids
+        actual_df (pandas.DataFrame): excessive rows of actual data, indexed by unique ids
+        keys (list): names of key columns
+
+    Returns DataFrame with ids of paired rows in columns expected and actual, sorted by expected id.
+    '''
+    keys = list(keys)
+
+    def blocks(df):
+        df = df[keys]
+        df = df[df.notna().all(axis=1)].sort_index(kind='mergesort')
+        block = pd.DataFrame({key:df[key].astype(object).map(_blocking_value).values for key in keys})
+        block['block_rank'] = block.groupby(keys, sort=False).cumcount()
+        block['block_id'] = df.index.values
+        return block
+
+    pairs = blocks(expected_df).merge(blocks(actual_df), on=keys + ['block_rank'], suffixes=('_expected', '_actual'))
+    return (
+        pd.DataFrame({'expected':pairs['block_id_expected'].values, 'actual':pairs['block_id_actual'].values})
+        .sort_values('expected', kind='mergesort')
+        .reset_index(drop=True)
+        )
+
+def moved_discrepencies(expected_df, actual_df, pairs, unique_col, isclose_flag=True, schema=None):
+    '''
+    Returns long-form DataFrame of moved rows (error code 6) paired with match_moved_rows. Every pair
+    is logged under its expected id with both ids as expected and actual values of unique_col, followed
+    by wrong values of the pair found with column_discrepencies. Rows are ordered by expected id.
+    '''
+    ids = pd.DataFrame({
+        unique_col:pairs['expected'].values,
+        'error_message':f"Moved {unique_col} in actual data",
+        'error_code':6,
+        'column_name':unique_col,
+        'expected_value':pairs['expected'].astype(object).values,
+        'actual_value':pairs['actual'].astype(object).values,
+        })
+    if not len(pairs):
+        return ids
+    moved_actual_df = actual_df.loc[pairs['actual'].values]
+    moved_actual_df.index = pd.Index(pairs['expected'].values, name=actual_df.index.name)
+    wrong_values = column_discrepencies(expected_df.loc[pairs['expected'].values], moved_actual_df, unique_col, isclose_flag=isclose_flag,
+        row_hash=False, schema=schema)
+    wrong_values = wrong_values.assign(error_message='wrong value of moved row', error_code=6)
+    return pd.concat([ids, wrong_values], ignore_index=True).sort_values(unique_col, kind='mergesort').reset_index(drop=True)
+
+class ComparisonResult():
+    '''
+    Discrepencies found by Comparator.compare.
+
+    Attributes:
+        unique_col (str): name of database column containing unique ids
+        row_errors (pandas.DataFrame): duplicated, missing and excessive ids (error codes 2-5)
+        wrong_values (pandas.DataFrame): wrong values (error code 1)
+        actual_df (pandas.DataFrame): narrowed actual data indexed and sorted by unique_col, before dropping any row
+        moved_rows (pandas.DataFrame): renumbered rows and their wrong values (error code 6, see moved_discrepencies)
+
+    All frames are in long form with columns matching DiscrepenciesLogger fieldnames.
+
+    Methods:
+        error_counts: returns dict of numbers of discrepencies by error code
+        ids(error_code): returns list of ids with given error code
+        log(logger): add all discrepencies to DiscrepenciesLogger
+    '''
+    def __init__(self, unique_col, row_errors, wrong_values, actual_df, moved_rows=None):
+        self.unique_col = unique_col
+        self.row_errors = row_errors
+        self.wrong_values = wrong_values
+        self.actual_df = actual_df
+        self.moved_rows = moved_rows if moved_rows is not None else concat_column_discrepencies([], unique_col)
+
+    def __len__(self):
+        return len(self.row_errors) + len(self.moved_rows) + len(self.wrong_values)
+
+    def error_counts(self):
+        counts = Counter(self.row_errors['error_code'].tolist())
+        counts.update(self.moved_rows['error_code'].tolist())
+        if len(self.wrong_values):
+            counts[1] = len(self.wrong_values)
+        return dict(sorted(counts.items()))
+
+    def ids(self, error_code):
+        frame = {1:self.wrong_values, 6:self.moved_rows}.get(error_code, self.row_errors)
+        return list(dict.fromkeys(frame.loc[frame['error_code'] == error_code, self.unique_col].tolist()))
+
+    def log(self, logger):
+        logger.add_frame(self.row_errors)
+        logger.add_frame(self.moved_rows)
+        logger.add_frame(self.wrong_values)
+
+class Comparator():
+    '''
+    Comparison engine holding expected dataset narrowed, indexed and sorted once.
+
+    Only actual data is prepared by compare, so a single Comparator can check many actual
+    snapshots. compare does not modify the Comparator and may be called from many threads
+    at once; comparisons with jobs > 1 are serialized, as worker processes share module state.
+
+    Args:
+        expected_df (pandas.DataFrame): expected data with unique_col column
+        unique_col (str): name of database column containing unique ids
+        columns (list): lower-case names of compared columns, all columns are compared if None
+        ids (list): compared ids, all ids are compared if None
+        isclose_flag (bool): compare floats using numpy.isclose function
+        jobs (int): number of processes comparing columns in parallel
+        lean (bool): keep expected data with compact dtypes (see compact_frame) and convert actual data to them
+        schema (dict): rules of comparison by column name (see column_discrepencies)
+        rekey (list): names of stable key columns pairing missing rows with excessive ones as moved rows (see match_moved_rows)
+        profiler (StageProfiler): profiler measuring stages of reading expected data and comparisons
+
+    Methods:
+        from_file(filename, ...): create Comparator from CSV or JSON file of expected data
+        compare(actual_df, manifest_filename=None, logger=None): returns ComparisonResult of actual_df
+    '''
+    def __init__(self, expected_df, unique_col='passengerid', columns=None, ids=None, isclose_flag=True, jobs=1, lean=False, schema=None,
+            rekey=None, profiler=None):
+        self.unique_col = unique_col
+        self.usecols = self.selected_columns(columns, unique_col)
+        self.useids = ids
+        self.isclose_flag = isclose_flag
+        self.jobs = jobs
+        self.lean = lean
+        self.schema = schema
+        self.rekey = rekey
+        self.parallel_lock = threading.Lock()
+        self.profiler = profiler = profiler or NULL_PROFILER
+
+        with profiler.stage('index_expected', rows=len(expected_df)):
+            self.prepare_expected(expected_df)
+
+    def prepare_expected(self, expected_df):
+        unique_col = self.unique_col
+        expected_df = expected_df.copy(deep=False)
+        expected_df.columns = [c.lower() for c in expected_df.columns]
+        self.expected_columns = list(expected_df.columns)
+        if self.usecols:
+            expected_df = expected_df[[c for c in self.usecols if c in expected_df.columns]]
+        if self.useids:
+            expected_df = expected_df[expected_df[unique_col].isin(self.useids)]
+        self.expected_df = expected_df.set_index(unique_col).sort_index()
+        if self.lean:
+            self.expected_df = compact_frame(self.expected_df)
+        self.expected_ids = set(self.expected_df.index)
+        self.duplicated_expected = [row for row, count in Counter(self.expected_df.index).items() if count > 1]
+        # Building the index hash table here keeps lookups in compare free of lazy initialization
+        self.expected_df.index.is_unique
+
+    @staticmethod
+    def selected_columns(columns, unique_col):
+        if not columns:
+            return None
+        return list(columns) + ([unique_col] if unique_col not in columns else [])
+
+    @classmethod
+    def from_file(cls, filename, unique_col='passengerid', columns=None, ids=None, dtype=None, engine='c', **kwargs):
+        '''
+        Create Comparator from CSV or JSON file. Only selected columns and ids are read (see iter_csv_frames
+        and iter_json_frames). With lean=True JSON file is read in chunks of LEAN_CHUNKSIZE records, each
+        compacted with compact_frame as soon as it is parsed. CSV file is read at once even then, as types
+        of CSV columns inferred chunk by chunk could differ from those inferred from the whole file.
+        '''
+        usecols = cls.selected_columns(columns, unique_col)
+        extension = os.path.splitext(filename)[1].lower()
+        lean = kwargs.get('lean', False)
+        with (kwargs.get('profiler') or NULL_PROFILER).stage('read_expected') as stage:
+            if extension == '.csv':
+                with open(filename) as f:
+                    dialect = Sniffer().sniff(f.read(1024))
+                expected_df = next(iter_csv_frames(filename, usecols=usecols, useids=ids, unique_col=unique_col, dtype=dtype,
+                    engine=engine, dialect=dialect))
+            elif extension == '.json':
+                with open(filename) as f:
+                    if lean:
+                        expected_df = concat_compact_frames([compact_frame(frame)
+                            for frame in iter_json_frames(f, LEAN_CHUNKSIZE, usecols=usecols, useids=ids, unique_col=unique_col)])
+                    else:
+                        expected_df = next(iter_json_frames(f, usecols=usecols, useids=ids, unique_col=unique_col))
+            else:
+                raise ValueError(f"Allowed file extensions are .csv, .json, not '{extension}'.")
+            stage.set(rows=len(expected_df))
+        return cls(expected_df, unique_col=unique_col, columns=columns, ids=ids, **kwargs)
+
+    def compare(self, actual_df, manifest_filename=None, logger=None):
+        '''
+        Compare actual_df with expected data.
+
+        If manifest_filename is given, wrong values are found with incremental_column_discrepencies.
+        If logger is given, discrepencies are added to it as soon as they are found (row errors first,
+        then wrong values column by column), so ComparisonStopped raised by DiscrepenciesSummary
+        stops the comparison early; the exception is propagated.
+        Returns ComparisonResult.
+        '''
+        unique_col = self.unique_col
+        profiler = self.profiler
+        with profiler.stage('index_actual', rows=len(actual_df)):
+            # Actual data shared by many comparisons can be indexed once with index_actual_data
+            indexed = actual_df.index.name == unique_col
+            actual_df = actual_df.copy(deep=False)
+            actual_df.columns = [c.lower() for c in actual_df.columns]
+            meta_cols = [c for c in META_COLUMNS if c in actual_df.columns]
+
+            # Narrowing actual data to given columns and IDs
+            check_columns([c for c in actual_df.columns if c not in meta_cols] + ([unique_col] if indexed else []), self.expected_columns,
+                self.usecols)
+            if self.rekey:
+                for columns, df_name in [(actual_df.columns, "Actual data"), (self.expected_df.columns, "Expected data")]:
+                    if not all(col in columns for col in self.rekey):
+                        missing_cols = ','.join([c for c in self.rekey if not c in columns])
+                        raise argparse.ArgumentError(rekey_arg, f"{df_name} does not contain compared key column(s): {missing_cols}")
+            if self.usecols:
+                actual_df = actual_df[[c for c in self.usecols if not (indexed and c == unique_col)] + meta_cols]
+            if not indexed:
+                actual_df = actual_df.set_index(unique_col)
+            if self.useids:
+                actual_df = actual_df[actual_df.index.isin(self.useids)]
+            if not (indexed and actual_df.index.is_monotonic_increasing):
+                actual_df = actual_df.sort_index()
+            actual_meta = actual_df[meta_cols]
+            actual_df = actual_df.drop(columns=meta_cols)
+            expected_df = self.expected_df
+            if self.lean:
+                expected_df, actual_df = conform_dtypes(expected_df, actual_df)
+
+        with profiler.stage('row_errors', rows=len(actual_df)) as stage:
+            actual_ids = set(actual_df.index)
+            expected_not_seen = list(self.expected_ids - actual_ids)
+            actual_not_expected = list(actual_ids - self.expected_ids)
+
+            # Checking for duplicated ids in unique_col.
+            # In fact, I wouldn't have to check for duplicates in expected_df
+            # assuming that the data will be clean. In this scenario, however,
+            # I have to make sure that both dataframes have unique indexes.
+            duplicated_rows_actual = [row for row, count in Counter(actual_df.index).items() if count > 1]
+
+            # Missing and excessive rows renumbered upstream are paired and reported as moved rows instead
+            moved_pairs = None
+            if self.rekey and expected_not_seen and actual_not_expected:
+                moved_pairs = match_moved_rows(
+                    expected_df[expected_df.index.isin(list(set(expected_not_seen).difference(self.duplicated_expected)))],
+                    actual_df[actual_df.index.isin(list(set(actual_not_expected).difference(duplicated_rows_actual)))],
+                    self.rekey)
+                moved_expected, moved_actual = set(moved_pairs['expected']), set(moved_pairs['actual'])
+                expected_not_seen = [row for row in expected_not_seen if row not in moved_expected]
+                actual_not_expected = [row for row in actual_not_expected if row not in moved_actual]
+            rows_with_errors = (
+                (duplicated_rows_actual, f"Duplicated {unique_col} in actual data", 2),
+                (self.duplicated_expected, f"Duplicated {unique_col} in expected data", 3),
+                (expected_not_seen, f"Missing row in actual data", 4),
+                (actual_not_expected, f"Excessive row in actual data", 5),
+                )
+            row_errors = pd.DataFrame({
+                unique_col:[row for rows, _, _ in rows_with_errors for row in rows],
+                'error_message':[error_message for rows, error_message, _ in rows_with_errors for row in rows],
+                'error_code':[error_code for rows, _, error_code in rows_with_errors for row in rows],
+                })
+            stage.set(discrepencies=len(row_errors))
+            if logger is not None:
+                logger.add_frame(row_errors)
+
+        moved_rows = None
+        if moved_pairs is not None:
+            with profiler.stage('moved_rows', rows=len(moved_pairs)) as stage:
+                moved_rows = moved_discrepencies(expected_df, actual_df, moved_pairs, unique_col, isclose_flag=self.isclose_flag,
+                    schema=self.schema)
+                stage.set(discrepencies=len(moved_rows))
+                if logger is not None:
+                    logger.add_frame(moved_rows)
+            expected_not_seen = expected_not_seen + list(moved_pairs['expected'])
+            actual_not_expected = actual_not_expected + list(moved_pairs['actual'])
+
+        # Dropping duplicated rows, expected not seen and seen but not expected (moved rows included)
+        duplicated_rows = set(self.duplicated_expected + duplicated_rows_actual)
+        if expected_not_seen or duplicated_rows:
+            expected_df = expected_df[~expected_df.index.isin(list(duplicated_rows.union(expected_not_seen)))]
+        compared = ~actual_df.index.isin(list(duplicated_rows.union(actual_not_expected)))
+        compared_actual_df = actual_df[compared] if not compared.all() else actual_df
+
+        with profiler.stage('column_comparison', rows=len(compared_actual_df)) as stage:
+            if self.jobs > 1:
+                self.parallel_lock.acquire()
+            try:
+                if manifest_filename:
+                    wrong_values = incremental_column_discrepencies(expected_df, compared_actual_df, unique_col, manifest_filename,
+                        isclose_flag=self.isclose_flag, actual_meta=actual_meta[compared], jobs=self.jobs, schema=self.schema)
+                    if logger is not None:
+                        logger.add_frame(wrong_values)
+                else:
+                    frames = []
+                    for frame in iter_column_discrepencies(expected_df, compared_actual_df, unique_col, isclose_flag=self.isclose_flag,
+                            jobs=self.jobs, schema=self.schema):
+                        frames.append(frame)
+                        if logger is not None:
+                            logger.add_frame(frame)
+                    wrong_values = concat_column_discrepencies(frames, unique_col)
+            finally:
+                if self.jobs > 1:
+                    self.parallel_lock.release()
+            stage.set(discrepencies=len(wrong_values))
+        return ComparisonResult(unique_col, row_errors, wrong_values, actual_df, moved_rows=moved_rows)
+
+def index_actual_data(actual_df, unique_col='passengerid'):
+    '''
+    Returns actual data with lower-cased column names, indexed and sorted by unique_col. Comparator.compare
+    skips these steps for such data, so actual data compared with many expected files is indexed once.
+    '''
+    actual_df = actual_df.copy(deep=False)
+    actual_df.columns = [c.lower() for c in actual_df.columns]
+    return actual_df.set_index(unique_col).sort_index()
+
+def batch_input_files(path):
+    '''
+    Returns sorted list of CSV and JSON files of directory or list of files given in manifest file,
+    one path per line (relative to the manifest). Empty lines and lines starting with # are skipped.
+    '''
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if os.path.splitext(name)[1].lower() in ['.csv', '.json'])
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(os.path.dirname(path), line) for line in lines if line and not line.startswith('#')]
+
+def batch_output_files(filenames, output_filename):
+    '''
+    Returns paths of discrepencies files of expected files, placed next to output_filename and named
+    after expected files with the extension of output_filename, e.g. partner_discrepencies.csv.
+    '''
+    directory, extension = os.path.dirname(output_filename), os.path.splitext(output_filename)[1]
+    outputs = [os.path.join(directory, os.path.splitext(os.path.basename(filename))[0] + '_discrepencies' + extension) for filename in filenames]
+    duplicates = [output for output, count in Counter(outputs + [output_filename]).items() if count > 1]
+    if duplicates:
+        raise ValueError(f"Expected files would share discrepencies file(s): {', '.join(duplicates)}. Rename them.")
+    return outputs
+
+_batch_actual_df = None
+
+def _init_batch_worker(actual_df):
+    global _batch_actual_df
+    _batch_actual_df = actual_df
+
+def _compare_batch_file(filename, output_filename, comparator_options, summary_options):
+    '''
+    Compare expected file with actual data held by the worker. Returns dict with counts of discrepencies
+    (see DiscrepenciesSummary.report) or error message if the file can not be compared.
+    '''
+    start = time.perf_counter()
+    result = {'input_file':filename, 'output_file':None, 'expected_rows':None}
+    try:
+        comparator = Comparator.from_file(filename, **comparator_options)
+        result.update(output_file=output_filename, expected_rows=len(comparator.expected_df))
+        with DiscrepenciesSummary(DiscrepenciesLogger(output_filename, comparator.unique_col), **summary_options) as summary:
+            with suppress(ComparisonStopped):
+                comparator.compare(_batch_actual_df, logger=summary)
+        result.update(summary.report(), error=None)
+    except ImportError:
+        raise
+    except Exception as e:
+        result.update(error=f"{type(e).__name__}: {e}")
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+def batch_comparison(filenames, actual_df, output_filename, processes=1, unique_col='passengerid', sample_size=None, max_errors=None,
+        stop_codes=None, **kwargs):
+    '''
+    Compare many expected files with the same actual data, fetched and indexed once.
+
+    Files are compared by a pool of processes workers (in this process if processes is 1). Workers
+    get actual data once, inherited from memory where fork start method is available and pickled
+    once per worker otherwise. Discrepencies of every file are written to its own file (see
+    batch_output_files); a file which can not be read or compared is reported with its error
+    instead of stopping the batch.
+
+    Parameters:
+        filenames (list): paths to CSV or JSON files of expected data
+        actual_df (pandas.DataFrame): actual data
+        output_filename (str): path to output file, giving directory and format of discrepencies files
+        sample_size, max_errors, stop_codes: options of DiscrepenciesSummary used for every file
+        kwargs: options of Comparator.from_file (columns, ids, isclose_flag, schema, ...)
+
+    Returns list of dicts with counts of discrepencies of files, in order of filenames.
+    '''
+    outputs = batch_output_files(filenames, output_filename)
+    actual_df = index_actual_data(actual_df, unique_col)
+    comparator_options = dict(kwargs, unique_col=unique_col, jobs=1)
+    summary_options = {'sample_size':sample_size, 'max_errors':max_errors, 'stop_codes':stop_codes}
+    if processes > 1 and len(filenames) > 1:
+        mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with concurrent_futures.ProcessPoolExecutor(max_workers=min(processes, len(filenames)), mp_context=mp_context,
+                initializer=_init_batch_worker, initargs=(actual_df,)) as executor:
+            return list(executor.map(_compare_batch_file, filenames, outputs, itertools.repeat(comparator_options),
+                itertools.repeat(summary_options)))
+    _init_batch_worker(actual_df)
+    try:
+        return [_compare_batch_file(filename, output, comparator_options, summary_options) for filename, output in zip(filenames, outputs)]
+    finally:
+        _init_batch_worker(None)
+
+def write_batch_results(results, filename):
+    '''
+    Write table of batch results, one row per expected file, to csv/txt, jsonl, parquet or feather file.
+    '''
+    rows = []
+    for result in results:
+        row = {key:result.get(key) for key in ['input_file', 'output_file', 'expected_rows', 'discrepencies']}
+        row.update({f'error_code_{code}':result.get('by_error_code', {}).get(code, 0) for code in range(1, 7)})
+        row.update({key:result.get(key) for key in ['complete', 'seconds', 'error']})
+        rows.append(row)
+    df = pd.DataFrame(rows, columns=['input_file', 'output_file', 'expected_rows', 'discrepencies']
+        + [f'error_code_{code}' for code in range(1, 7)] + ['complete', 'seconds', 'error'])
+    df = df.astype({'expected_rows':'Int64', 'discrepencies':'Int64'})
+    write_table(df, filename)
+    return df
+
+def write_table(df, filename):
+    '''
+    Write DataFrame to csv/txt, jsonl, parquet or feather file chosen by the extension of filename.
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.jsonl':
+        df.to_json(filename, orient='records', lines=True)
+    elif extension == '.parquet':
+        df.to_parquet(filename, index=False)
+    elif extension == '.feather':
+        df.to_feather(filename)
+    else:
+        df.to_csv(filename, index=False)
+
+def batch_datasets_comparison(args, fetcher, cache, profiler, print=builtins.print, test_flag=False):
+    '''
+    Batch mode of titanic_datasets_comparison comparing expected files listed by args.batch with
+    actual data fetched once (see batch_comparison). Table of results, one row per expected file,
+    is written to args.outputfile and aggregated counts to args.summary.
+
+    Parameters:
+        args (argparse.Namespace): parsed arguments of argparse.parser
+        fetcher (ActualDataFetcher), cache (SnapshotCache): source of actual data
+        profiler (StageProfiler): profiler measuring stages of the batch
+        print (function): function printing verbose output
+        test_flag (bool): if True, returns list of results of expected files for easier testing
+    '''
+    for arg, flag, feature in [(excelout_arg, args.excel, "Excel report"), (stream_arg, args.stream, "Streaming mode"),
+            (incremental_arg, args.incremental, "Incremental comparison"), (history_arg, args.history, "History")]:
+        if flag:
+            raise argparse.ArgumentError(arg, f"{feature} is not available in batch mode.")
+    try:
+        filenames = batch_input_files(args.batch)
+    except OSError as e:
+        raise argparse.ArgumentError(batch_arg, f"Batch can not be read: {e}")
+    if not filenames:
+        raise argparse.ArgumentError(batch_arg, "Batch does not contain any CSV or JSON file.")
+    for filename in filenames:
+        check_arg_file_extension(filename, ['.csv', '.json'], batch_arg)
+    args.outputfile.close()
+    output_filename = args.outputfile.name
+    try:
+        batch_output_files(filenames, output_filename)
+    except ValueError as e:
+        raise argparse.ArgumentError(batch_arg, str(e))
+
+    with profiler.stage('fetch_actual') as stage:
+        if cache:
+            actual_df = compact_frame(cache.load(fetcher)) if args.lean else cache.load(fetcher)
+        else:
+            actual_df = load_actual_data(fetcher, lean=args.lean)
+        stage.set(rows=len(actual_df))
+    with profiler.stage('batch_comparison', rows=len(filenames)) as stage:
+        results = batch_comparison(filenames, actual_df, output_filename, processes=args.jobs,
+            sample_size=args.sample if args.summary else None, max_errors=args.max_errors, stop_codes=args.stop_on,
+            columns=args.columns, ids=args.passengerid, dtype=args.dtypes, engine=args.csvengine, isclose_flag=args.floatprecision,
+            lean=args.lean, schema=args.schema, rekey=args.rekey)
+        discrepencies = sum(result.get('discrepencies') or 0 for result in results)
+        stage.set(discrepencies=discrepencies)
+    by_error_code = Counter()
+    for result in results:
+        by_error_code.update(result.get('by_error_code', {}))
+
+    table = write_batch_results(results, output_filename)
+    if args.verbose:
+        from tablib import Dataset
+        print(Dataset(*[['' if value is None or value is pd.NA else str(value) for value in row] for row in table.itertuples(index=False)],
+            headers=list(table.columns)), '\n')
+    failed = [result['input_file'] for result in results if result['error']]
+    if failed:
+        print(f"{len(failed)} of {len(filenames)} expected files could not be compared: {', '.join(failed)}")
+    print(f'Results of {len(filenames)} expected files logged in file {output_filename}, discrepencies in files next to it')
+
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump({
+                'actual_rows':len(actual_df),
+                'expected_files':len(filenames),
+                'failed_files':len(failed),
+                'discrepencies':discrepencies,
+                'by_error_code':dict(sorted(by_error_code.items())),
+                'files':results,
+                }, f, indent=2, default=str)
+        print(f'Summary of discrepencies saved in file {args.summary}')
+
+    if args.profile:
+        profiler.close()
+        profiler.write(args.profile,
+            arguments={key:getattr(value, 'name', value) for key, value in vars(args).items()},
+            discrepencies=discrepencies,
+            discrepencies_by_code=dict(sorted(by_error_code.items())),
+            )
+        print(f'Profile of comparison stages saved in file {args.profile}')
+
+    if test_flag:
+        return results
+
+def titanic_datasets_comparison(args, test_flag = False):
+    '''
+    Titanic passengers datasets comparison function.
+
+    Parameters:
+        args (argparse.Namespace): parsed arguments of argparse.parser
+        test_flag (bool): if True, returns json_response for easier testing
+    '''
+    UNIQUE_COL = "passengerid"
+    USECOLS = None
+    USEIDS = None
+
+    # Setting flags and checking files extensions
+    verbose_flag = args.verbose
+    builtin_print = builtins.print
+
+    def print(*args, **kwargs):
+        '''
+        Setting verbosity level and overriding builtin print function.
+        '''
+        if verbose_flag:
+            return builtin_print(*args, **kwargs)
+
+    isclose_flag = args.floatprecision
+    if args.columns: USECOLS = args.columns + [UNIQUE_COL]
+    if args.passengerid: USEIDS = args.passengerid
+
+    check_arg_file_extension(args.outputfile.name, list(SINKS.keys()), textout_arg)
+    output_filename = args.outputfile.name
+    if args.max_errors is not None and args.max_errors < 1:
+        raise argparse.ArgumentError(max_errors_arg, "Maximum number of errors must be positive.")
+    if args.stop_on and not set(args.stop_on) <= set(range(1, 7)):
+        raise argparse.ArgumentError(stop_on_arg, "Error codes must be integers from 1 to 6.")
+    if args.rekey and args.columns and not set(args.rekey) <= set(args.columns):
+        raise argparse.ArgumentError(rekey_arg, "Key columns of moved rows must be compared columns (see -c).")
+    if args.diff and not args.history:
+        raise argparse.ArgumentError(diff_arg, "Diff of runs requires history store (--history).")
+    if args.diff:
+        check_arg_file_extension(args.diff, list(SINKS.keys()), diff_arg)
+    if args.history and (args.summary or args.max_errors or args.stop_on):
+        raise argparse.ArgumentError(history_arg, "History is not available with --summary, --max-errors or --stop-on, which log only a part of discrepencies.")
+
+    fetcher = ActualDataFetcher(args.url, page_size=args.pagesize, workers=args.workers, timeout=args.timeout, retries=args.retries,
+        keep_meta=bool(args.incremental))
+    if args.cachedir:
+        cache = SnapshotCache(args.cachedir, ttl=args.cachettl, offline=args.offline, keep=args.cachekeep)
+    elif args.offline:
+        raise argparse.ArgumentError(offline_arg, "Offline mode requires cache directory (--cachedir).")
+    else:
+        cache = None
+    profiler = StageProfiler(enabled=bool(args.profile))
+
+    if args.batch:
+        return batch_datasets_comparison(args, fetcher, cache, profiler, print, test_flag=test_flag)
+
+    file = args.inputfile 
+    check_arg_file_extension(file.name, ['.csv', '.json'] + SQL_EXTENSIONS, input_file_arg)
+    input_file_extension = os.path.splitext(file.name)[1].lower()
+
+    if args.excel:
+        excel_flag = True
+        check_arg_file_extension(args.excel.name, ['.xls', '.xlsx'], excelout_arg)
+        excel_filename = args.excel.name
+    else:
+        excel_flag = False
+
+    # With summary or limits, discrepencies are counted by DiscrepenciesSummary, which may stop the comparison early
+    if (args.summary or args.max_errors or args.stop_on) and excel_flag:
+        raise argparse.ArgumentError(excelout_arg, "Excel report is not available with --summary, --max-errors or --stop-on.")
+    # Streaming mode keeps logged discrepencies in memory only if they are printed, recorded or returned after the comparison
+    keep_rows = not args.stream or verbose_flag or test_flag or bool(args.history)
+    Logger = DiscrepenciesLogger(filename=output_filename, unique_col=UNIQUE_COL, profiler=profiler, keep_rows=keep_rows)
+    if args.summary or args.max_errors or args.stop_on:
+        Summary = DiscrepenciesSummary(Logger, sample_size=args.sample if args.summary else None, max_errors=args.max_errors,
+            stop_codes=args.stop_on)
+    else:
+        Summary = None
+    target = Logger if Summary is None else Summary
+
+    if input_file_extension in SQL_EXTENSIONS:
+        for arg, flag, feature in [(excelout_arg, excel_flag, "Excel report"), (stream_arg, args.stream, "Streaming mode"),
+                (incremental_arg, args.incremental, "Incremental comparison"), (lean_arg, args.lean, "Lean mode"),
+                (rekey_arg, args.rekey, "Matching of moved rows")]:
+            if flag:
+                raise argparse.ArgumentError(arg, f"{feature} is not available with database input.")
+        file.close()
+        connection = sqlite3.connect(file.name)
+        try:
+            with profiler.stage('sql_comparison') as stage:
+                with suppress(ComparisonStopped):
+                    sql_comparison(connection, args.expectedtable, args.actualtable, target, unique_col=UNIQUE_COL, columns=args.columns,
+                        ids=USEIDS, isclose_flag=isclose_flag, schema=args.schema, batch_size=args.chunksize)
+                stage.set(discrepencies=len(target))
+        except sqlite3.Error as e:
+            raise argparse.ArgumentError(input_file_arg, f"Database input is not valid: {e}")
+        finally:
+            connection.close()
+    elif args.stream:
+        if excel_flag:
+            raise argparse.ArgumentError(excelout_arg, "Excel report is not available in streaming mode.")
+        if args.incremental:
+            raise argparse.ArgumentError(incremental_arg, "Incremental comparison is not available in streaming mode.")
+        if args.lean:
+            raise argparse.ArgumentError(lean_arg, "Lean mode is not available in streaming mode, which keeps only chunks in memory.")
+        if args.rekey:
+            raise argparse.ArgumentError(rekey_arg, "Matching of moved rows is not available in streaming mode.")
+        try:
+            if input_file_extension == '.csv':
+                dialect = Sniffer().sniff(file.read(1024))
+                expected_chunks = iter_csv_frames(file.name, args.chunksize, USECOLS, USEIDS, UNIQUE_COL, dtype=args.dtypes,
+                    engine=args.csvengine, dialect=dialect)
+            else:
+                expected_chunks = iter_json_frames(file, args.chunksize, USECOLS, USEIDS, UNIQUE_COL)
+            first_expected, expected_chunks = peek_chunks(expected_chunks)
+        except ImportError:
+            raise
+        except Exception as e:
+            raise argparse.ArgumentError(args.inputfile, f"{input_file_extension[1:].upper()} input is not valid!")
+        with profiler.stage('fetch_actual'):
+            if cache:
+                first_actual, actual_chunks = peek_chunks(iter_frame_chunks(cache.load(fetcher), args.chunksize))
+            else:
+                first_actual, actual_chunks = peek_chunks(fetcher.iter_frames())
+        actual_columns = [c.lower() for c in first_actual.columns]
+        check_columns(actual_columns, [c.lower() for c in first_expected.columns], USECOLS)
+
+        # Reading and fetching of further chunks is interleaved with the comparison
+        with profiler.stage('stream_comparison') as stage:
+            with suppress(ComparisonStopped):
+                stream_comparison(
+                    expected_chunks=narrow_chunks(expected_chunks, UNIQUE_COL, USECOLS, USEIDS),
+                    actual_chunks=narrow_chunks(actual_chunks, UNIQUE_COL, USECOLS, USEIDS),
+                    logger=target,
+                    unique_col=UNIQUE_COL,
+                    columns=[c for c in (USECOLS or actual_columns) if c != UNIQUE_COL],
+                    isclose_flag=isclose_flag,
+                    batch_size=args.chunksize,
+                    schema=args.schema,
+                    )
+            stage.set(discrepencies=len(target))
+    else:
+        try:
+            comparator = Comparator.from_file(file.name, unique_col=UNIQUE_COL, columns=args.columns, ids=USEIDS, dtype=args.dtypes,
+                engine=args.csvengine, isclose_flag=isclose_flag, jobs=args.jobs, lean=args.lean,
+                schema=args.schema, rekey=args.rekey, profiler=profiler)
+        except ImportError:
+            raise
+        except Exception as e:
+            raise argparse.ArgumentError(args.inputfile, f"{input_file_extension[1:].upper()} input is not valid!")
+
+        with profiler.stage('fetch_actual') as stage:
+            if cache:
+                actual_df = compact_frame(cache.load(fetcher)) if args.lean else cache.load(fetcher)
+            else:
+                actual_df = load_actual_data(fetcher, lean=args.lean)
+            stage.set(rows=len(actual_df))
+        if Summary is not None:
+            with suppress(ComparisonStopped):
+                comparator.compare(actual_df, manifest_filename=args.incremental, logger=Summary)
+        else:
+            result = comparator.compare(actual_df, manifest_filename=args.incremental)
+            result.log(Logger)
+
+    Logger.close()
+    if args.history:
+        # Discrepencies are appended to the history store as a new run and compared with the previous run of the input file
+        with profiler.stage('history', rows=len(Logger)):
+            with DiscrepenciesHistory(args.history, unique_col=UNIQUE_COL) as history:
+                input_filename = os.path.abspath(file.name)
+                run_id = history.record(Logger, input_file=input_filename, output_file=output_filename,
+                    arguments={key:getattr(value, 'name', value) for key, value in vars(args).items()})
+                if args.diff:
+                    previous_run = history.last_run(input_file=input_filename, before=run_id)
+                    diff = history.diff(previous_run, run_id, logger=Logger)
+                    write_table(diff, args.diff)
+        print(f'Discrepencies saved in history {args.history} as run {run_id}')
+        if args.diff:
+            counts = Counter(diff['status'])
+            print(f"{counts['new']} new, {counts['resolved']} resolved and {counts['persisting']} persisting discrepencies since "
+                + (f'run {previous_run}' if previous_run else 'no previous run') + f' saved in file {args.diff}')
+    if verbose_flag:
+        with profiler.stage('tabularize', rows=len(Logger)):
+            if Summary is not None:
+                print(Summary.tabularize(), '\n')
+            print(Logger.tabularize(), '\n')
 
     if excel_flag:
-        Logger.prepare_excel(actual_df=excel_actual_df, expected_df=excel_expected_df, excel_filename=excel_filename)
+        with profiler.stage('excel', rows=len(result.actual_df)):
+            Logger.prepare_excel(actual_df=result.actual_df, expected_df=comparator.expected_df, excel_filename=excel_filename)
         print(f'Created file {excel_filename} with marked discrepencies.')
 
-    print(f'Discrepencies logged in file {output_filename}')
+    if Summary is not None and Summary.stopped_by:
+        print(f'Comparison stopped early ({Summary.stopped_by}).')
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(Summary.report(), f, indent=2)
+        print(f'Summary of discrepencies saved in file {args.summary}, examples logged in file {output_filename}')
+    else:
+        print(f'Discrepencies logged in file {output_filename}')
+
+    if args.profile:
+        profiler.close()
+        profiler.write(args.profile,
+            arguments={key:getattr(value, 'name', value) for key, value in vars(args).items()},
+            discrepencies=len(target),
+            discrepencies_by_code=Logger.error_counts() if Summary is None else Summary.report()['by_error_code'],
+            )
+        print(f'Profile of comparison stages saved in file {args.profile}')
 
     if test_flag:
         return Logger.errors_json
 
+API_URL = 'https://public.opendatasoft.com/api/records/1.0/search/?dataset=titanic-passengers&rows=10000'
+META_COLUMNS = ['recordid', 'record_timestamp']
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+LEAN_CHUNKSIZE = 100000
+SQL_EXTENSIONS = ['.db', '.sqlite', '.sqlite3']
+
 parser = argparse.ArgumentParser()
-input_file_arg = parser.add_argument('-i', '--inputfile', required=True, help='path to CSV or JSON input file', type=argparse.FileType('r'))
-textout_arg = parser.add_argument('-o', '--outputfile', required=True, help='path to CSV or TXT output file', type=argparse.FileType('w'))
+input_group = parser.add_mutually_exclusive_group(required=True)
+input_file_arg = input_group.add_argument('-i', '--inputfile', help='path to CSV or JSON input file or SQLite database with both tables', type=argparse.FileType('r'))
+batch_arg = input_group.add_argument('-b', '--batch', help='path to directory of CSV and JSON input files or to manifest file listing them, compared with actual data fetched once')
+textout_arg = parser.add_argument('-o', '--outputfile', required=True, help='path to CSV, TXT, JSONL, PARQUET or FEATHER output file', type=argparse.FileType('w'))
 excelout_arg = parser.add_argument('-e', '--excel', help='path to XLS or XLSX file in which the differences between the databases will be saved', type=argparse.FileType('w'))
 cols_arg = parser.add_argument('-c', '--columns', help='comma-separated list of columns', type=lambda s: [c.lower() for c in s.split(',')])
 ids_arg = parser.add_argument('-p', '--passengerid', help='comma-separated list of passengers ids', type=lambda s: [int(i) for i in s.split(',')])
 verbose_arg = parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
 float_precision_arg = parser.add_argument('-f', '--floatprecision', help='compare floats using numpy.isclose function', action='store_true')
-
-API_URL = 'https://public.opendatasoft.com/api/records/1.0/search/?dataset=titanic-passengers&rows=10000'
+stream_arg = parser.add_argument('-s', '--stream', help='compare datasets larger than memory chunk by chunk using external sort-merge', action='store_true')
+chunksize_arg = parser.add_argument('--chunksize', help='number of rows read and compared at once in streaming mode or fetched at once from database', type=int, default=100000)
+url_arg = parser.add_argument('-u', '--url', help='url of API records endpoint serving actual data', default=API_URL)
+pagesize_arg = parser.add_argument('--pagesize', help='number of records requested from API at once', type=int, default=1000)
+workers_arg = parser.add_argument('--workers', help='maximum number of concurrent API requests', type=int, default=4)
+timeout_arg = parser.add_argument('--timeout', help='timeout of a single API request in seconds', type=float, default=30)
+retries_arg = parser.add_argument('--retries', help='number of retries of a failed API request', type=int, default=3)
+cachedir_arg = parser.add_argument('--cachedir', help='path to directory with cached snapshots of actual data')
+cachettl_arg = parser.add_argument('--cachettl', help='number of seconds during which cached snapshot is used without revalidation', type=float, default=3600)
+cachekeep_arg = parser.add_argument('--cachekeep', help='number of cached snapshots kept', type=int, default=3)
+offline_arg = parser.add_argument('--offline', help='use newest cached snapshot of actual data without any request', action='store_true')
+jobs_arg = parser.add_argument('-j', '--jobs', help='number of processes comparing columns (input files in batch mode) in parallel', type=int, default=1)
+dtypes_arg = parser.add_argument('--dtypes', help='comma-separated column:dtype pairs of CSV input, e.g. fare:float64,ticket:str',
+    type=lambda s: {c.lower():t for c, t in (pair.split(':', 1) for pair in s.split(','))})
+csvengine_arg = parser.add_argument('--csvengine', help='CSV parser: c (pandas), pyarrow or auto (pyarrow if installed)',
+    choices=['c', 'pyarrow', 'auto'], default='c')
+incremental_arg = parser.add_argument('--incremental', help='path to manifest file; compare only rows changed since the run which saved it')
+schema_arg = parser.add_argument('--schema', help='comma-separated column:kind[:rtol[:atol]] rules of comparison, kind is one of '
+    + ', '.join(SCHEMA_KINDS) + ', e.g. fare:float:1e-3,pclass:int', type=parse_schema)
+lean_arg = parser.add_argument('--lean', help='store text columns with few distinct values as categoricals and downcast integers to reduce memory use', action='store_true')
+expectedtable_arg = parser.add_argument('--expectedtable', help='name of table with expected data in database input', default='expected')
+actualtable_arg = parser.add_argument('--actualtable', help='name of table with actual data in database input', default='actual')
+summary_arg = parser.add_argument('--summary', help='path to JSON file with numbers of discrepencies by error code and column; only examples are logged in output file')
+sample_arg = parser.add_argument('--sample', help='number of examples of every error code and column logged with --summary', type=int, default=10)
+max_errors_arg = parser.add_argument('--max-errors', help='stop comparison after given number of discrepencies', type=int)
+stop_on_arg = parser.add_argument('--stop-on', help='comma-separated error codes which stop comparison as soon as they appear, e.g. 4,5',
+    type=lambda s: [int(code) for code in s.split(',')])
+rekey_arg = parser.add_argument('--rekey', help='comma-separated stable columns, e.g. name,ticket, pairing missing rows with excessive rows renumbered in actual data; pairs are logged as moved rows (error code 6)',
+    type=lambda s: [c.lower() for c in s.split(',')])
+history_arg = parser.add_argument('--history', help='path to SQLite database to which discrepencies of the run are appended')
+diff_arg = parser.add_argument('--diff', help='path to CSV, TXT, JSONL, PARQUET or FEATHER file with new, resolved and persisting discrepencies since the previous run of the input file in --history')
+profile_arg = parser.add_argument('--profile', help='path to JSON file with time, memory and row counts of comparison stages')
 
 if __name__ == '__main__':
     args = parser.parse_args()
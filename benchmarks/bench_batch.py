@@ -0,0 +1,77 @@
+'''
+Benchmark of batch mode (-b) against separate runs of the CLI for every expected file.
+
+Writes the expected data of a synthetic dataset to a number of files (alternately CSV and JSON)
+and serves its actual data from the local stand-in API. Each file is compared in a separate
+run first, fetching actual data every time. Then the whole directory is compared in batch
+mode with each number of processes. Found discrepencies are checked against the numbers
+injected by the generator:
+
+    $ (venv) python benchmarks/bench_batch.py --rows 200000 --files 8 --jobs 1,2,4
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates, write_expected
+from standin_api import serve
+
+def run_cli(arguments):
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(arguments)
+    start = time.perf_counter()
+    result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch mode against separate runs for every expected file.')
+    parser.add_argument('--rows', type=int, default=200000, help='number of expected ids')
+    parser.add_argument('--files', type=int, default=8, help='number of expected files')
+    parser.add_argument('--jobs', type=lambda s: [int(j) for j in s.split(',')], default=[1, 2, 4], help='comma-separated numbers of processes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--pagesize', type=int, default=10000, help='number of records requested from stand-in API at once')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    truth = {code:count for code, count in dataset.truth().items() if count}
+    print(f'{args.files} files of {args.rows} rows, {os.cpu_count()} CPUs, injected discrepencies by error code: {truth}\n')
+    server = serve(dataset)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            input_directory = os.path.join(directory, 'expected')
+            output_directory = os.path.join(directory, 'output')
+            os.makedirs(input_directory)
+            os.makedirs(output_directory)
+            filenames = [os.path.join(input_directory, f'partner{i}{[".csv", ".json"][i % 2]}') for i in range(args.files)]
+            for filename in filenames:
+                write_expected(dataset, filename)
+            source_args = f'-u {server.url} --pagesize {args.pagesize} -f'
+
+            print(f"{'run':>16} {'time [s]':>9} {'per file [s]':>13}  result")
+            elapsed, found = 0.0, []
+            for filename in filenames:
+                seconds, errors_json = run_cli(f'-i {filename} -o {os.path.join(output_directory, "discrepencies.csv")} {source_args}')
+                elapsed += seconds
+                counts = {}
+                for errors in errors_json.values():
+                    for error in errors['errors']:
+                        counts[error['error_code']] = counts.get(error['error_code'], 0) + 1
+                found.append(dict(sorted(counts.items())))
+            status = 'OK' if all(counts == truth for counts in found) else f'MISMATCH, found {found}'
+            print(f"{'separate runs':>16} {elapsed:>9.2f} {elapsed / args.files:>13.2f}  {status}")
+
+            for jobs in args.jobs:
+                seconds, results = run_cli(f'-b {input_directory} -o {os.path.join(output_directory, "results.csv")} {source_args} -j {jobs}')
+                found = [{code:count for code, count in result.get('by_error_code', {}).items()} for result in results]
+                status = 'OK' if all(counts == truth for counts in found) else f'MISMATCH, found {found}'
+                print(f"{f'batch -j {jobs}':>16} {seconds:>9.2f} {seconds / args.files:>13.2f}  {status}")
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
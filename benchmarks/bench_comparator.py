@@ -0,0 +1,81 @@
+'''
+Benchmark of Comparator reuse.
+
+Measures checks per minute of actual snapshots against the same expected data when expected data
+is read and prepared for every check (as a single CLI run does) and when one Comparator is reused,
+serially and from a pool of threads:
+
+    $ (venv) python benchmarks/bench_comparator.py --rows 100000 --checks 20 --threads 4
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_snapshots(rows, checks, seed=0):
+    '''
+    Create expected frame and checks actual snapshots, each with a few changed fares.
+    '''
+    rng = np.random.default_rng(seed)
+    expected_df = pd.DataFrame({
+        UNIQUE_COL:np.arange(1, rows + 1),
+        'name':[f'Passenger {i}' for i in range(1, rows + 1)],
+        'sex':rng.choice(['male', 'female'], size=rows),
+        'age':rng.integers(1, 80, size=rows).astype(float),
+        'fare':np.round(rng.random(size=rows) * 100, 4),
+        })
+    snapshots = []
+    for _ in range(checks):
+        actual_df = expected_df.sample(frac=1, random_state=int(rng.integers(1 << 31))).reset_index(drop=True)
+        broken = rng.choice(rows, size=10, replace=False)
+        actual_df.iloc[broken, actual_df.columns.get_loc('fare')] += 1.0
+        snapshots.append(actual_df)
+    return expected_df, snapshots
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Comparator reuse.')
+    parser.add_argument('--rows', type=int, default=100000, help='number of rows in compared frames')
+    parser.add_argument('--checks', type=int, default=20, help='number of compared actual snapshots')
+    parser.add_argument('--threads', type=int, default=4, help='number of threads sharing one Comparator')
+    args = parser.parse_args()
+
+    expected_df, snapshots = make_snapshots(args.rows, args.checks)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'expected.csv')
+        expected_df.to_csv(filename, sep=';', index=False)
+
+        start = time.perf_counter()
+        for actual_df in snapshots:
+            TPC.Comparator.from_file(filename).compare(actual_df)
+        setup_each = time.perf_counter() - start
+
+        start = time.perf_counter()
+        comparator = TPC.Comparator.from_file(filename)
+        setup_time = time.perf_counter() - start
+        start = time.perf_counter()
+        results = [comparator.compare(actual_df) for actual_df in snapshots]
+        reused = time.perf_counter() - start
+        assert all(result.error_counts() == {1:10} for result in results)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(comparator.compare, snapshots))
+        threaded = time.perf_counter() - start
+
+    print(f'expected data setup: {setup_time:.3f} s')
+    print(f"{'mode':>24} {'time [s]':>10} {'checks/min':>11}")
+    for mode, elapsed in [('setup for every check', setup_each), ('reused', reused), (f'reused, {args.threads} threads', threaded)]:
+        print(f'{mode:>24} {elapsed:>10.3f} {args.checks / elapsed * 60:>11.0f}')
+
+if __name__ == '__main__':
+    main()
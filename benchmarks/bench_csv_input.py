@@ -0,0 +1,83 @@
+'''
+Benchmark of CSV input reading.
+
+Scales tests/titanic-passengers.csv up to given number of rows (with new passenger ids) and compares
+the former path (read every column and row, then narrow) with iter_csv_frames using column and ID
+pushdown, dtype schema and both parsing engines:
+
+    $ (venv) python benchmarks/bench_csv_input.py --rows 2000000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from csv import Sniffer
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'titanic-passengers.csv')
+DTYPES = {'passengerid':'int64', 'pclass':'int64', 'sibsp':'int64', 'parch':'int64', 'fare':'float64',
+    'survived':'str', 'name':'str', 'sex':'str', 'ticket':'str', 'cabin':'str', 'embarked':'str'}
+
+def write_scaled_csv(filename, rows):
+    df = pd.read_csv(SOURCE, sep=';')
+    repeats = -(-rows // len(df))
+    scaled = pd.concat([df] * repeats, ignore_index=True).iloc[:rows]
+    scaled['PassengerId'] = range(1, rows + 1)
+    scaled.to_csv(filename, sep=';', index=False)
+
+def former_path(filename, dialect, usecols, useids, dtype, engine):
+    df = pd.read_csv(filename, dialect=dialect)
+    df.columns = [c.lower() for c in df.columns]
+    if usecols:
+        df = df[usecols]
+    if useids:
+        df = df[df[UNIQUE_COL].isin(useids)]
+    return df
+
+def pushdown_path(filename, dialect, usecols, useids, dtype, engine):
+    return next(TPC.iter_csv_frames(filename, usecols=usecols, useids=useids, unique_col=UNIQUE_COL, dtype=dtype,
+        engine=engine, dialect=dialect))
+
+def timed(func, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CSV input reading.')
+    parser.add_argument('--rows', type=int, default=2000000, help='number of rows of scaled CSV file')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, best time is reported')
+    args = parser.parse_args()
+
+    engines = ['c', 'pyarrow'] if TPC.resolve_csv_engine('auto') == 'pyarrow' else ['c']
+    selections = [
+        ('all', None, None),
+        ('3 columns', ['passengerid', 'name', 'fare'], None),
+        ('1% ids', None, list(range(1, args.rows + 1, 100))),
+        ]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'titanic-scaled.csv')
+        write_scaled_csv(filename, args.rows)
+        with open(filename) as f:
+            dialect = Sniffer().sniff(f.read(1024))
+        print(f'file size: {os.path.getsize(filename) / 2**20:.1f} MiB')
+        print(f"{'selection':>10} {'engine':>8} {'dtypes':>7} {'former [s]':>11} {'pushdown [s]':>13} {'speedup':>8}")
+        for name, usecols, useids in selections:
+            former, former_rows = timed(former_path, args.repeat, filename, dialect, usecols, useids, None, 'c')
+            for engine in engines:
+                for dtype in (None, DTYPES):
+                    pushdown, pushdown_rows = timed(pushdown_path, args.repeat, filename, dialect, usecols, useids, dtype, engine)
+                    assert former_rows == pushdown_rows
+                    print(f'{name:>10} {engine:>8} {str(dtype is not None):>7} {former:>11.3f} {pushdown:>13.3f} {former / pushdown:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Benchmark of wrong values (error code 1) extraction.
+
+Compares the former per-row path (two .loc lookups and one DiscrepenciesLogger.add call per
+mismatched row) with the bulk path (column_discrepencies + DiscrepenciesLogger.add_frame)
+for growing number of mismatches:
+
+    $ (venv) python benchmarks/bench_discrepancies.py --rows 200000 --mismatches 100,1000,10000,100000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_frames(rows, mismatches, seed=0):
+    '''
+    Create aligned expected and actual frames with given number of mismatched rows in "fare" column.
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(np.arange(1, rows + 1), name=UNIQUE_COL)
+    expected_df = pd.DataFrame({
+        'name':[f'Passenger {i}' for i in index],
+        'sex':rng.choice(['male', 'female'], size=rows),
+        'age':rng.integers(1, 80, size=rows).astype(float),
+        'fare':rng.random(size=rows) * 100,
+        }, index=index)
+    actual_df = expected_df.copy()
+    broken = rng.choice(rows, size=mismatches, replace=False)
+    actual_df.iloc[broken, actual_df.columns.get_loc('fare')] += 1.0
+    return expected_df, actual_df
+
+def per_row_path(expected_df, actual_df, logger):
+    '''
+    Former implementation of wrong values extraction.
+    '''
+    for col_name in actual_df.columns:
+        not_matched_bool = TPC.discrepencies_series_mask(actual_df[col_name], expected_df[col_name])
+        for row in actual_df[not_matched_bool].index:
+            logger.add({
+                UNIQUE_COL:row,
+                'error_message':'wrong value',
+                'error_code':1,
+                'column_name':col_name,
+                'expected_value':expected_df.loc[row,:][col_name],
+                'actual_value':actual_df.loc[row,:][col_name],
+                })
+
+def bulk_path(expected_df, actual_df, logger):
+    logger.add_frame(TPC.column_discrepencies(expected_df, actual_df, UNIQUE_COL))
+
+def timed(func, expected_df, actual_df, directory):
+    logger = TPC.DiscrepenciesLogger(filename=os.path.join(directory, f'{func.__name__}.csv'), unique_col=UNIQUE_COL)
+    start = time.perf_counter()
+    func(expected_df, actual_df, logger)
+    logger.close()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark wrong values extraction.')
+    parser.add_argument('--rows', type=int, default=200000, help='number of rows in compared frames')
+    parser.add_argument('--mismatches', type=lambda s: [int(i) for i in s.split(',')], default=[100, 1000, 10000, 100000],
+        help='comma-separated numbers of mismatched rows')
+    parser.add_argument('--per-row-limit', type=int, default=20000, help='skip per-row path above this number of mismatches')
+    args = parser.parse_args()
+
+    print(f"{'mismatches':>12} {'per-row [s]':>12} {'bulk [s]':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mismatches in args.mismatches:
+            expected_df, actual_df = make_frames(args.rows, mismatches)
+            bulk = timed(bulk_path, expected_df, actual_df, directory)
+            if mismatches <= args.per_row_limit:
+                per_row = timed(per_row_path, expected_df, actual_df, directory)
+                print(f'{mismatches:>12} {per_row:>12.3f} {bulk:>10.3f} {per_row / bulk:>7.1f}x')
+            else:
+                print(f"{mismatches:>12} {'skipped':>12} {bulk:>10.3f} {'-':>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+'''
+Benchmark of Excel report writing.
+
+Compares the former prepare_excel (to_excel, load_workbook and patching cells one by one) with
+the single-pass write-only report for growing number of rows, measuring time and peak memory
+(tracemalloc) with 1% of values wrong, 0.1% of rows missing and 0.1% excessive:
+
+    $ (venv) python benchmarks/bench_excel.py --rows 10000,100000,500000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import copy
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.styles import PatternFill
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_report(rows, directory, seed=0):
+    '''
+    Create aligned frames and a logger holding their discrepencies.
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(np.arange(1, rows + 1), name=UNIQUE_COL)
+    expected_df = pd.DataFrame({
+        'name':[f'Passenger {i}' for i in index],
+        'sex':rng.choice(['male', 'female'], size=rows),
+        'age':rng.integers(1, 80, size=rows).astype(float),
+        'fare':np.round(rng.random(size=rows) * 100, 4),
+        }, index=index)
+    actual_df = expected_df.copy()
+    broken = rng.choice(rows, size=rows // 100, replace=False)
+    actual_df.iloc[broken, actual_df.columns.get_loc('fare')] += 1.0
+    missing = rng.choice(index, size=max(rows // 1000, 1), replace=False)
+    actual_df = actual_df.drop(missing)
+    excessive = pd.DataFrame(actual_df.iloc[:max(rows // 1000, 1)].values, columns=actual_df.columns,
+        index=pd.Index(np.arange(rows + 1, rows + 1 + max(rows // 1000, 1)), name=UNIQUE_COL))
+    actual_df = pd.concat([actual_df, excessive])
+
+    logger = TPC.DiscrepenciesLogger(filename=os.path.join(directory, 'discrepencies.csv'), unique_col=UNIQUE_COL)
+    logger.add_frame(pd.DataFrame({UNIQUE_COL:np.sort(missing), 'error_message':'Missing row in actual data', 'error_code':4}))
+    logger.add_frame(pd.DataFrame({UNIQUE_COL:excessive.index, 'error_message':'Excessive row in actual data', 'error_code':5}))
+    common = expected_df.index.intersection(actual_df.index)
+    logger.add_frame(TPC.column_discrepencies(expected_df.loc[common], actual_df.loc[common], UNIQUE_COL))
+    logger.close()
+    return logger, actual_df, expected_df
+
+def former_prepare_excel(self, actual_df, expected_df, excel_filename):
+    '''
+    Former implementation of DiscrepenciesLogger.prepare_excel.
+    '''
+    actual_df.to_excel(excel_filename, sheet_name='Discrepencies')
+    wb = openpyxl.load_workbook(excel_filename)
+    sh = wb['Discrepencies']
+
+    columns_headings = {cell.value:idx for idx, cell in enumerate(sh[1])}
+    cols_num = len(columns_headings)
+    error_message_cell = sh.cell(row=1, column=cols_num+1)
+    error_message_cell.value = "error_message"
+    error_message_cell.font = copy(sh[1][1].font)
+    error_message_cell.border = copy(sh[1][1].border)
+    error_message_cell.alignment = copy(sh[1][1].alignment)
+
+    error_styles = {
+        1: PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
+        2: PatternFill(start_color="EBAE34", end_color="EBAE34", fill_type="solid"),
+        3: PatternFill(start_color="EBAE34", end_color="EBAE34", fill_type="solid"),
+        4: PatternFill(start_color="8A0000", end_color="8A0000", fill_type="solid"),
+        5: PatternFill(start_color="108A00", end_color="108A00", fill_type="solid"),
+    }
+
+    for row in sh.iter_rows(min_row=1):
+        row_id = row[columns_headings[self.unique_col]].value
+        if row_id in self.errors_json.keys():
+            for error in self.errors_json[row_id]['errors']:
+                err = error['error_code']
+                err_style = error_styles.get(err, None)
+                if err == 1:
+                    cell = row[columns_headings[error['column_name']]]
+                    cell.fill = err_style
+                    cell.value = f"{cell.value} \\\\ expected: {error['expected_value']} \\\\"
+                    sh.cell(row=cell.row, column=cols_num+1).value = error['error_message']
+                elif err in [2, 3, 5]:
+                    for cell in row:
+                        cell.fill = err_style
+                    sh.cell(row=row[0].row, column=cols_num+1).value = error['error_message']
+
+    rows_num = sh.max_row
+    err_style = error_styles[4]
+    for id_key, id_vals in self.errors_json.items():
+        for error in id_vals['errors']:
+            if error['error_code'] == 4:
+                for heading, idx in columns_headings.items():
+                    cell = sh.cell(row=rows_num, column=idx+1)
+                    if heading == self.unique_col:
+                        cell.value = id_key
+                    else:
+                        cell.value = expected_df.loc[id_key, heading]
+                    cell.fill = err_style
+                sh.cell(row=rows_num, column=cols_num+1).value = error['error_message']
+                rows_num += 1
+    wb.save(excel_filename)
+
+def measured(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Excel report writing.')
+    parser.add_argument('--rows', type=lambda s: [int(i) for i in s.split(',')], default=[10000, 100000, 500000],
+        help='comma-separated numbers of rows in compared frames')
+    parser.add_argument('--former-limit', type=int, default=100000, help='skip former implementation above this number of rows')
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'former [s]':>11} {'peak [MiB]':>11} {'single-pass [s]':>16} {'peak [MiB]':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            logger, actual_df, expected_df = make_report(rows, directory)
+            filename = os.path.join(directory, 'report.xlsx')
+            new_time, new_peak = measured(logger.prepare_excel, actual_df, expected_df, filename)
+            if rows <= args.former_limit:
+                former_time, former_peak = measured(former_prepare_excel, logger, actual_df, expected_df, filename)
+                print(f'{rows:>8} {former_time:>11.2f} {former_peak:>11.1f} {new_time:>16.2f} {new_peak:>11.1f}')
+            else:
+                print(f"{rows:>8} {'skipped':>11} {'-':>11} {new_time:>16.2f} {new_peak:>11.1f}")
+
+if __name__ == '__main__':
+    main()
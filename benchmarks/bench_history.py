@@ -0,0 +1,109 @@
+'''
+Benchmark of history store (--history) against re-parsing discrepencies files of past runs.
+
+Logs discrepencies of a number of runs, each differing from the previous one in a fraction of
+discrepencies (some are resolved, the same number of new ones appear), to CSV files and appends
+them to a DiscrepenciesHistory store. Then the diff of the last two runs (changes is the diff without
+persisting discrepencies, logger is the diff with discrepencies of the last run taken from its logger as in
+the CLI), discrepencies of a few ids, of a column and of an id across all runs are
+found in the store and by reading CSV files with pandas. Results of both ways are checked to be the same:
+
+    $ (venv) python benchmarks/bench_history.py --discrepencies 1000000 --runs 5 --churn 0.05
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+COLUMNS = np.array(['survived', 'pclass', 'name', 'age', 'fare'], dtype=object)
+KEY = [UNIQUE_COL, 'error_code', 'column_name']
+
+def run_discrepencies(size, run, churn, seed=0):
+    '''
+    Returns long-form DataFrame of wrong values of run. Every run resolves churn of discrepencies of the
+    previous one and adds as many new ones.
+    '''
+    changed = int(size * churn)
+    ids = np.arange(run * changed, run * changed + size) * 7 % (10 * size) + 1
+    rng = np.random.default_rng([seed, run])
+    return pd.DataFrame({
+        UNIQUE_COL:ids,
+        'error_message':'wrong value',
+        'error_code':1,
+        'column_name':COLUMNS[ids % len(COLUMNS)],
+        'expected_value':ids * 0.5,
+        'actual_value':np.round(rng.random(size) * 100, 4),
+        }).sort_values(UNIQUE_COL, ignore_index=True)
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def csv_diff(old_filename, new_filename):
+    old, new = pd.read_csv(old_filename), pd.read_csv(new_filename)
+    merged = new[KEY].merge(old[KEY], how='outer', indicator=True)
+    return merged['_merge'].map({'left_only':'new', 'right_only':'resolved', 'both':'persisting'}).value_counts().to_dict()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark history store against re-parsing discrepencies files.')
+    parser.add_argument('--discrepencies', type=int, default=1000000, help='number of discrepencies of every run')
+    parser.add_argument('--runs', type=int, default=5, help='number of recorded runs')
+    parser.add_argument('--churn', type=float, default=0.05, help='fraction of discrepencies resolved and added by every run')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        history_filename = os.path.join(directory, 'history.db')
+        csv_filenames = []
+        elapsed = 0.0
+        with TPC.DiscrepenciesHistory(history_filename, UNIQUE_COL) as history:
+            for run in range(args.runs):
+                csv_filenames.append(os.path.join(directory, f'discrepencies{run}.csv'))
+                with TPC.DiscrepenciesLogger(csv_filenames[-1], UNIQUE_COL) as logger:
+                    logger.add_frame(run_discrepencies(args.discrepencies, run, args.churn, seed=args.seed))
+                seconds, run_id = timed(lambda: history.record(logger, input_file='expected.csv'))
+                elapsed += seconds
+            print(f'{args.runs} runs of {args.discrepencies} discrepencies recorded in {elapsed / args.runs:.2f} s per run, '
+                f'store {os.path.getsize(history_filename) / 2**20:.0f} MiB, '
+                f'CSV files {sum(os.path.getsize(f) for f in csv_filenames) / 2**20:.0f} MiB\n')
+
+            ids = run_discrepencies(args.discrepencies, args.runs - 1, args.churn, seed=args.seed)[UNIQUE_COL].iloc[::args.discrepencies // 10].tolist()
+            cases = {
+                'diff':(
+                    lambda: history.diff(run_id - 1, run_id)['status'].value_counts().to_dict(),
+                    lambda: csv_diff(csv_filenames[-2], csv_filenames[-1])),
+                'diff logger':(
+                    lambda: history.diff(run_id - 1, run_id, logger=logger)['status'].value_counts().to_dict(),
+                    lambda: csv_diff(csv_filenames[-2], csv_filenames[-1])),
+                'changes':(
+                    lambda: history.diff(run_id - 1, run_id, persisting=False)['status'].value_counts().to_dict(),
+                    lambda: {status:count for status, count in csv_diff(csv_filenames[-2], csv_filenames[-1]).items() if status != 'persisting'}),
+                'ids':(
+                    lambda: len(history.query(run_id, ids=ids)),
+                    lambda: int(pd.read_csv(csv_filenames[-1])[UNIQUE_COL].isin(ids).sum())),
+                'column':(
+                    lambda: len(history.query(run_id, columns=['fare'])),
+                    lambda: int((pd.read_csv(csv_filenames[-1])['column_name'] == 'fare').sum())),
+                'id history':(
+                    lambda: len(pd.read_sql_query(f'SELECT run_id FROM discrepencies WHERE {UNIQUE_COL} = ?', history.connection,
+                        params=[ids[0]])),
+                    lambda: sum(int((pd.read_csv(f)[UNIQUE_COL] == ids[0]).sum()) for f in csv_filenames)),
+                }
+            print(f"{'query':>12} {'store [s]':>10} {'CSV [s]':>9}  result")
+            for name, (store_query, csv_query) in cases.items():
+                store_time, store_result = timed(store_query)
+                csv_time, csv_result = timed(csv_query)
+                status = 'OK' if store_result == csv_result else f'MISMATCH {store_result} != {csv_result}'
+                print(f'{name:>12} {store_time:>10.3f} {csv_time:>9.3f}  {status} {store_result}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Benchmark of parallel column comparison (-j/--jobs).
+
+Compares column_discrepencies on wide frames for given numbers of worker processes.
+Speedup is bounded by the number of available cores:
+
+    $ (venv) python benchmarks/bench_jobs.py --rows 200000 --columns 64 --jobs 1,2,4,8
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_frames(rows, columns, rate=0.01, seed=0):
+    '''
+    Create aligned wide frames of float, integer and string columns; rate of values in each column differ.
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(np.arange(1, rows + 1), name=UNIQUE_COL)
+    data = {}
+    for i in range(columns):
+        if i % 4 == 0:
+            data[f'name_{i}'] = rng.choice(['Braund', 'Cumings', 'Heikkinen', 'Futrelle'], size=rows)
+        elif i % 4 == 1:
+            data[f'count_{i}'] = rng.integers(0, 10, size=rows)
+        else:
+            data[f'fare_{i}'] = rng.random(size=rows) * 100
+    expected_df = pd.DataFrame(data, index=index)
+    actual_df = expected_df.copy()
+    for position, col_name in enumerate(actual_df.columns):
+        broken = rng.choice(rows, size=int(rows * rate), replace=False)
+        if col_name.startswith('name'):
+            actual_df.iloc[broken, position] = 'Changed'
+        else:
+            actual_df.iloc[broken, position] = actual_df.iloc[broken, position] + 1
+    return expected_df, actual_df
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel column comparison.')
+    parser.add_argument('--rows', type=int, default=200000, help='number of rows in compared frames')
+    parser.add_argument('--columns', type=int, default=64, help='number of columns in compared frames')
+    parser.add_argument('--jobs', type=lambda s: [int(j) for j in s.split(',')], default=[1, 2, 4, 8],
+        help='comma-separated numbers of worker processes')
+    parser.add_argument('-f', '--isclose', action='store_true', help='compare floats with math.isclose')
+    args = parser.parse_args()
+
+    expected_df, actual_df = make_frames(args.rows, args.columns)
+    print(f'cores: {os.cpu_count()}')
+    print(f"{'jobs':>6} {'time [s]':>10} {'speedup':>8}")
+    baseline, reference = None, None
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        frame = TPC.column_discrepencies(expected_df, actual_df, UNIQUE_COL, isclose_flag=args.isclose, row_hash=False, jobs=jobs)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            baseline, reference = elapsed, frame
+        else:
+            pd.testing.assert_frame_equal(reference, frame)
+        print(f'{jobs:>6} {elapsed:>10.3f} {baseline / elapsed:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
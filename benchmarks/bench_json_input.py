@@ -0,0 +1,101 @@
+'''
+Benchmark of JSON input parsing.
+
+Compares peak memory (tracemalloc) and time of the former json.loads + double json_normalize path
+with incremental parsing into column buffers, with and without column and ID selection:
+
+    $ (venv) python benchmarks/bench_json_input.py --rows 200000
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def write_records(filename, rows, seed=0):
+    '''
+    Write JSON file with titanic-like records exported from the API.
+    '''
+    rng = np.random.default_rng(seed)
+    with open(filename, 'w') as f:
+        f.write('[')
+        for i in range(1, rows + 1):
+            if i > 1:
+                f.write(',')
+            json.dump({
+                'datasetid':'titanic-passengers',
+                'recordid':f'{i:040x}',
+                'fields':{
+                    'fare':round(float(rng.random()) * 100, 4),
+                    'name':f'Passenger, Mr. {i}',
+                    'embarked':'S',
+                    'age':float(rng.integers(1, 80)),
+                    'parch':int(rng.integers(0, 5)),
+                    'pclass':int(rng.integers(1, 4)),
+                    'sex':'male',
+                    'survived':'No',
+                    'ticket':str(rng.integers(100000, 999999)),
+                    UNIQUE_COL:i,
+                    'sibsp':int(rng.integers(0, 5)),
+                    },
+                'record_timestamp':'2016-09-21T00:34:51.313+02:00',
+                }, f)
+        f.write(']')
+
+def former_path(filename, usecols, useids):
+    with open(filename) as f:
+        json_data = json.loads(f.read())
+    records_df = pd.json_normalize(json_data, max_level=0)
+    df = pd.json_normalize(records_df['fields'])
+    if usecols:
+        df = df[usecols]
+    if useids:
+        df = df[df[UNIQUE_COL].isin(useids)]
+    return df
+
+def incremental_path(filename, usecols, useids):
+    with open(filename) as f:
+        return next(TPC.iter_json_frames(f, usecols=usecols, useids=useids, unique_col=UNIQUE_COL))
+
+def measured(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON input parsing.')
+    parser.add_argument('--rows', type=int, default=200000, help='number of records in JSON file')
+    args = parser.parse_args()
+
+    selections = [
+        ('all', None, None),
+        ('2 columns', [UNIQUE_COL, 'fare'], None),
+        ('1% ids', None, list(range(1, args.rows + 1, 100))),
+        ]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'records.json')
+        write_records(filename, args.rows)
+        print(f'file size: {os.path.getsize(filename) / 2**20:.1f} MiB')
+        print(f"{'selection':>10} {'former [s]':>11} {'peak [MiB]':>11} {'incremental [s]':>16} {'peak [MiB]':>11}")
+        for name, usecols, useids in selections:
+            former_time, former_peak, former_rows = measured(former_path, filename, usecols, useids)
+            new_time, new_peak, new_rows = measured(incremental_path, filename, usecols, useids)
+            assert former_rows == new_rows
+            print(f'{name:>10} {former_time:>11.3f} {former_peak:>11.1f} {new_time:>16.3f} {new_peak:>11.1f}')
+
+if __name__ == '__main__':
+    main()
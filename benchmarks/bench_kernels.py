@@ -0,0 +1,81 @@
+'''
+Benchmark of per-dtype comparison kernels on clean and corrupted columns.
+
+Compares the former discrepencies_series_mask (converting both columns to strings whenever
+dtypes differ or both are object) with the kernels of the current one. Every case is checked
+to flag the same cells (the former implementation did not use numpy.isclose on corrupted
+columns, so -f is not used here):
+
+    $ (venv) python benchmarks/bench_kernels.py --rows 1000000
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+def former_series_mask(df1, df2, isclose_flag=True):
+    '''
+    Former implementation of discrepencies_series_mask.
+    '''
+    bool_mask = pd.Series(data=[True])
+    bool_mask = bool_mask.repeat(repeats=len(df1))
+    bool_mask.index = df1.index
+    bool_mask[(pd.isnull(df1) & pd.isnull(df2))] = False
+    if isclose_flag:
+        if df1.dtype == "float64" and df2.dtype == "float64":
+            bool_mask[np.isclose(df1, df2)] = False
+    if not df1.dtype == df2.dtype or (df1.dtype == 'object' and df2.dtype == 'object'):
+        df1, df2 = df1.astype(str), df2.astype(str)
+    bool_mask[df1 == df2] = False
+    return bool_mask
+
+def make_cases(rows, seed=0):
+    '''
+    Returns dict of (actual, expected) series pairs with about 1% of values changed.
+    '''
+    rng = np.random.default_rng(seed)
+    ages = rng.integers(1, 80, size=rows).astype(float)
+    changed = rng.random(size=rows) < 0.01
+    actual_ages = pd.Series(np.where(changed, ages + 1, ages))
+    corrupted = pd.Series(ages, dtype=object)
+    corrupted[rows // 2] = 'young'
+    classes = rng.integers(1, 4, size=rows)
+    names = pd.Series([f'Passenger {i}' for i in range(rows)], dtype=object)
+    actual_names = names.where(~changed, names + ' Jr.')
+    return {
+        'float, clean':(actual_ages, pd.Series(ages)),
+        'float, one string':(actual_ages, corrupted),
+        'float, read as text':(actual_ages, pd.Series(ages).astype(str).where(np.arange(rows) != rows // 2, 'young')),
+        'int vs float':(pd.Series(np.where(changed, classes + 1, classes)), pd.Series(classes.astype(float))),
+        'string':(actual_names, names),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark comparison kernels on clean and corrupted columns.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of values in compared columns')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best one is reported')
+    args = parser.parse_args()
+
+    print(f"{'case':>20} {'kind':>7} {'former [s]':>11} {'kernels [s]':>12} {'speed-up':>9}")
+    for name, (actual_col, expected_col) in make_cases(args.rows).items():
+        timings = []
+        for func in (former_series_mask, TPC.discrepencies_series_mask):
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                mask = func(actual_col, expected_col, isclose_flag=False).values
+                best = min(best, time.perf_counter() - start)
+            timings.append((best, mask))
+        (former_time, former_mask), (kernel_time, kernel_mask) = timings
+        assert (former_mask == kernel_mask).all(), name
+        kind = TPC.column_kind(actual_col, expected_col)
+        print(f'{name:>20} {kind:>7} {former_time:>11.3f} {kernel_time:>12.3f} {former_time / kernel_time:>8.1f}x')
+
+if __name__ == '__main__':
+    main()
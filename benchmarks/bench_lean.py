@@ -0,0 +1,82 @@
+'''
+Benchmark of lean mode (--lean) memory use.
+
+Serves synthetic actual data from the local stand-in API and runs the CLI in fresh interpreters
+with and without --lean. Reports peak resident memory of each run, time and peak memory of its
+stages (from --profile report) and deep memory usage of prepared frames:
+
+    $ (venv) python benchmarks/bench_lean.py --rows 1000000
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates, write_expected
+from standin_api import serve
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STAGES = ['read_expected', 'index_expected', 'fetch_actual', 'index_actual', 'column_comparison']
+
+# Runs TPC.py as __main__ and reports peak resident memory of the process in KiB (bytes on macOS)
+RUNNER = '''
+import atexit, resource, runpy, sys
+atexit.register(lambda: sys.stderr.write('maxrss:%d\\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+sys.argv = ['TPC.py'] + sys.argv[1:]
+runpy.run_path('TPC.py', run_name='__main__')
+'''
+
+def run_cli(arguments, profile_filename):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', RUNNER] + arguments + ['--profile', profile_filename], cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    maxrss = [int(line[len('maxrss:'):]) for line in result.stderr.splitlines() if line.startswith('maxrss:')][0]
+    with open(profile_filename) as f:
+        stages = {stage['name']:stage for stage in json.load(f)['stages']}
+    return elapsed, maxrss * (1 if sys.platform == 'darwin' else 1024), stages
+
+def frame_mib(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memory use of lean mode.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--pagesize', type=int, default=10000, help='number of records requested from stand-in API at once')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    server = serve(dataset)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            expected_filename = os.path.join(directory, 'expected.csv')
+            write_expected(dataset, expected_filename)
+            base_arguments = ['-i', expected_filename, '-o', os.path.join(directory, 'discrepencies.csv'), '-u', server.url,
+                '--pagesize', str(args.pagesize), '-f']
+
+            print(f"{'mode':>8} {'time [s]':>10} {'peak [MiB]':>11}  " + ' '.join(f'{name:>20}' for name in STAGES))
+            for mode, extra in [('default', []), ('lean', ['--lean'])]:
+                elapsed, maxrss, stages = run_cli(base_arguments + extra, os.path.join(directory, 'profile.json'))
+                cells = [f"{stages[name]['seconds']:>6.2f} s {stages[name]['peak_rss_mib']:>6.0f} MiB" if name in stages else f"{'-':>20}" for name in STAGES]
+                print(f'{mode:>8} {elapsed:>10.2f} {maxrss / 2**20:>11.0f}  ' + ' '.join(cells))
+
+            print(f"\n{'frame':>16} {'default [MiB]':>14} {'lean [MiB]':>11}")
+            fetcher = TPC.ActualDataFetcher(server.url, page_size=args.pagesize)
+            for name, load in [
+                    ('expected', lambda lean: TPC.Comparator.from_file(expected_filename, lean=lean).expected_df),
+                    ('actual', lambda lean: TPC.load_actual_data(fetcher, lean=lean)),
+                    ]:
+                print(f'{name:>16} {frame_mib(load(False)):>14.1f} {frame_mib(load(True)):>11.1f}')
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Benchmark of DiscrepenciesLogger sinks.
+
+Logs given number of wrong values (error code 1) in bulk and measures time of writing them
+to each sink and of building errors_json and tabularize() from memory:
+
+    $ (venv) python benchmarks/bench_logger.py --rows 1000000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_discrepencies(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        UNIQUE_COL:np.arange(1, rows + 1),
+        'error_message':'wrong value',
+        'error_code':1,
+        'column_name':rng.choice(['age', 'fare', 'name', 'sex'], size=rows),
+        'expected_value':rng.random(size=rows) * 100,
+        'actual_value':rng.random(size=rows) * 100,
+        })
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DiscrepenciesLogger sinks.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of logged discrepencies')
+    parser.add_argument('--batch-size', type=int, default=100000, help='number of rows written to the sink at once')
+    parser.add_argument('--extensions', type=lambda s: s.split(','), default=list(TPC.SINKS.keys()),
+        help='comma-separated extensions of output files')
+    args = parser.parse_args()
+
+    frame = make_discrepencies(args.rows)
+    print(f"{'sink':>10} {'write [s]':>10} {'errors_json [s]':>16} {'tabularize [s]':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in args.extensions:
+            filename = os.path.join(directory, f'discrepencies{extension}')
+            start = time.perf_counter()
+            try:
+                logger = TPC.DiscrepenciesLogger(filename=filename, unique_col=UNIQUE_COL, batch_size=args.batch_size)
+            except ImportError as e:
+                print(f'{extension:>10} skipped: {e}')
+                continue
+            logger.add_frame(frame)
+            logger.close()
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            logger.errors_json
+            json_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            logger.tabularize()
+            tabularize_time = time.perf_counter() - start
+            print(f'{extension:>10} {write_time:>10.3f} {json_time:>16.3f} {tabularize_time:>15.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+Benchmark of matching of moved rows (--rekey) against pairwise comparison of missing and excessive rows.
+
+Renumbers a fraction of rows of synthetic actual data (rows without other injected discrepencies
+get new ids), so they are reported as missing and excessive rows unless they are paired. Compares
+the datasets with and without the blocking index of match_moved_rows and measures the pairwise
+matching, which compares key values of every missing row with every excessive one, on a sample
+of missing rows (its time for all of them is extrapolated). Found pairs are checked against the
+renumbered rows:
+
+    $ (venv) python benchmarks/bench_rekey.py --rows 1000000 --moved 0.01
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates
+
+UNIQUE_COL = 'passengerid'
+KEYS = ['name', 'ticket']
+
+def renumber(dataset, actual_df, fraction, seed=0):
+    '''
+    Give new ids to fraction of actual rows without injected discrepencies. Returns renumbered
+    actual data and dict mapping old ids to new ones.
+    '''
+    clean = np.concatenate([dataset.ids(block)[~np.any(list(dataset.kinds(block).values()), axis=0)] for block in range(dataset.blocks)])
+    rng = np.random.default_rng([seed, 3])
+    moved = np.sort(rng.choice(clean, size=int(len(clean) * fraction), replace=False))
+    new_ids = dict(zip(moved.tolist(), (moved + 2 * dataset.rows).tolist()))
+    actual_df = actual_df.copy()
+    actual_df[UNIQUE_COL] = actual_df[UNIQUE_COL].map(lambda i: new_ids.get(i, i))
+    return actual_df, new_ids
+
+def pairwise_matching(expected_df, actual_df, keys):
+    '''
+    Pair every missing row with the first excessive row of equal normalized key values, comparing all pairs.
+    '''
+    expected_keys = [tuple(TPC._blocking_value(v) for v in row) for row in expected_df[keys].itertuples(index=False, name=None)]
+    actual_keys = [tuple(TPC._blocking_value(v) for v in row) for row in actual_df[keys].itertuples(index=False, name=None)]
+    used, pairs = set(), []
+    for expected_id, expected_key in zip(expected_df.index, expected_keys):
+        for position, (actual_id, actual_key) in enumerate(zip(actual_df.index, actual_keys)):
+            if position not in used and actual_key == expected_key:
+                used.add(position)
+                pairs.append((expected_id, actual_id))
+                break
+    return pairs
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark matching of moved rows.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--moved', type=float, default=0.01, help='fraction of renumbered actual rows')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--sample', type=int, default=500, help='number of missing rows matched pairwise')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    expected_df = pd.concat(dataset.iter_expected(), ignore_index=True)
+    actual_df = pd.concat([dataset.actual_block(block) for block in range(dataset.blocks)], ignore_index=True)
+    actual_df, new_ids = renumber(dataset, actual_df, args.moved, seed=args.seed)
+    print(f'{args.rows} rows, {len(new_ids)} renumbered, injected discrepencies by error code: {dataset.truth()}\n')
+
+    print(f"{'compare':>10} {'time [s]':>9}  result")
+    for name, rekey in [('default', None), ('--rekey', KEYS)]:
+        comparator = TPC.Comparator(expected_df, UNIQUE_COL, isclose_flag=True, rekey=rekey)
+        start = time.perf_counter()
+        result = comparator.compare(actual_df)
+        elapsed = time.perf_counter() - start
+        counts = result.error_counts()
+        if rekey:
+            moved = result.moved_rows[result.moved_rows['column_name'] == UNIQUE_COL]
+            found = dict(zip(moved['expected_value'], moved['actual_value']))
+            status = 'OK' if all(found.get(old) == new for old, new in new_ids.items()) else 'MISSED PAIRS'
+            missing_rows = comparator.expected_df[comparator.expected_df.index.isin(result.ids(4) + list(found))]
+            excessive_rows = result.actual_df[result.actual_df.index.isin(result.ids(5) + list(found.values()))]
+        else:
+            status = f'{counts.get(4, 0)} missing, {counts.get(5, 0)} excessive rows'
+        print(f'{name:>10} {elapsed:>9.2f}  {status}, found {counts}')
+
+    print(f"\n{len(missing_rows)} missing and {len(excessive_rows)} excessive rows before matching\n{'matching':>10} {'time [s]':>9}")
+    start = time.perf_counter()
+    TPC.match_moved_rows(missing_rows, excessive_rows, KEYS)
+    print(f"{'blocking':>10} {time.perf_counter() - start:>9.3f}")
+    sample = missing_rows.iloc[:args.sample]
+    start = time.perf_counter()
+    pairwise_matching(sample, excessive_rows, KEYS)
+    elapsed = time.perf_counter() - start
+    print(f"{'pairwise':>10} {elapsed / max(len(sample), 1) * len(missing_rows):>9.3f}  estimated from {len(sample)} missing rows")
+
+if __name__ == '__main__':
+    main()
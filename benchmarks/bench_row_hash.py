@@ -0,0 +1,81 @@
+'''
+Benchmark of the row-hash fast path of column_discrepencies.
+
+Compares column_discrepencies with and without the row-hash pre-pass on titanic-like frames
+with given mismatch rates, with and without float precision flag (-f):
+
+    $ (venv) python benchmarks/bench_row_hash.py --rows 1000000 --rates 0.001,0.1
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+
+UNIQUE_COL = 'passengerid'
+
+def make_frames(rows, rate, seed=0):
+    '''
+    Create aligned titanic-like frames; rate of actual rows have one value changed.
+    Floats of all actual rows carry API-like representation noise (e.g. 7.8542000000000005).
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.Index(np.arange(1, rows + 1), name=UNIQUE_COL)
+    expected_df = pd.DataFrame({
+        'survived':rng.choice(['Yes', 'No'], size=rows),
+        'pclass':rng.integers(1, 4, size=rows),
+        'name':[f'Passenger, Mr. {i}' for i in index],
+        'sex':rng.choice(['male', 'female'], size=rows),
+        'age':np.where(rng.random(size=rows) < 0.2, np.nan, rng.integers(1, 80, size=rows).astype(float)),
+        'sibsp':rng.integers(0, 5, size=rows),
+        'parch':rng.integers(0, 5, size=rows),
+        'ticket':rng.integers(100000, 999999, size=rows).astype(str),
+        'fare':np.round(rng.random(size=rows) * 100, 4),
+        'cabin':np.where(rng.random(size=rows) < 0.75, None, 'C85'),
+        'embarked':rng.choice(['S', 'C', 'Q'], size=rows),
+        }, index=index)
+    actual_df = expected_df.copy()
+    actual_df['fare'] = actual_df['fare'] * (1 + 1e-15)
+    broken = rng.choice(rows, size=int(rows * rate), replace=False)
+    columns = rng.choice(['pclass', 'name', 'age', 'fare'], size=len(broken))
+    for col_name in ['pclass', 'name', 'age', 'fare']:
+        rows_to_break = broken[columns == col_name]
+        position = actual_df.columns.get_loc(col_name)
+        if col_name == 'name':
+            actual_df.iloc[rows_to_break, position] = 'Changed'
+        else:
+            actual_df.iloc[rows_to_break, position] = actual_df.iloc[rows_to_break, position] + 1
+    return expected_df, actual_df
+
+def timed(expected_df, actual_df, isclose_flag, row_hash, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = TPC.column_discrepencies(expected_df, actual_df, UNIQUE_COL, isclose_flag=isclose_flag, row_hash=row_hash)
+        times.append(time.perf_counter() - start)
+    return min(times), len(frame)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark row-hash fast path.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of rows in compared frames')
+    parser.add_argument('--rates', type=lambda s: [float(r) for r in s.split(',')], default=[0.001, 0.1],
+        help='comma-separated rates of mismatched rows')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, best time is reported')
+    args = parser.parse_args()
+
+    print(f"{'rate':>6} {'-f':>5} {'mismatches':>11} {'columns [s]':>12} {'row hash [s]':>13} {'speedup':>8}")
+    for rate in args.rates:
+        expected_df, actual_df = make_frames(args.rows, rate)
+        for isclose_flag in (False, True):
+            full, full_found = timed(expected_df, actual_df, isclose_flag, False, args.repeat)
+            hashed, hashed_found = timed(expected_df, actual_df, isclose_flag, True, args.repeat)
+            assert full_found == hashed_found
+            print(f'{rate:>6} {str(isclose_flag):>5} {hashed_found:>11} {full:>12.3f} {hashed:>13.3f} {full / hashed:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Benchmark of comparison pushed down into SQLite database against in-memory comparison.
+
+Writes expected and actual data of a synthetic dataset to two tables of a SQLite database block
+by block. Then every mode runs in a fresh interpreter, so peak resident memory of the process
+is reported for each of them: the sql mode compares the tables with sql_comparison, the memory
+mode reads both tables into DataFrames and compares them with Comparator. Found discrepencies
+are checked against the numbers injected by the generator:
+
+    $ (venv) python benchmarks/bench_sql.py --rows 1000000
+'''
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates
+
+UNIQUE_COL = 'passengerid'
+
+def write_database(dataset, filename):
+    with sqlite3.connect(filename) as connection:
+        for block in range(dataset.blocks):
+            dataset.expected_block(block).to_sql('expected', connection, index=False, if_exists='append')
+            dataset.actual_block(block).to_sql('actual', connection, index=False, if_exists='append')
+    connection.close()
+
+def run_mode(mode, filename, output_filename, batch_size):
+    '''
+    Compare tables of database in this process. Returns dict with time, peak memory and error counts.
+    '''
+    start = time.perf_counter()
+    connection = sqlite3.connect(filename)
+    with TPC.DiscrepenciesLogger(output_filename, UNIQUE_COL) as logger:
+        if mode == 'sql':
+            TPC.sql_comparison(connection, 'expected', 'actual', logger, unique_col=UNIQUE_COL, batch_size=batch_size)
+        else:
+            expected_df = TPC.pd.read_sql('SELECT * FROM expected', connection)
+            actual_df = TPC.pd.read_sql('SELECT * FROM actual', connection)
+            TPC.Comparator(expected_df, UNIQUE_COL).compare(actual_df).log(logger)
+    connection.close()
+    counts = {}
+    for code in logger.columns['error_code']:
+        counts[code] = counts.get(code, 0) + 1
+    return {
+        'seconds':time.perf_counter() - start,
+        'maxrss':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        'counts':dict(sorted(counts.items())),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark comparison pushed down into SQLite database.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--batchsize', type=int, default=100000, help='number of rows fetched from database at once')
+    parser.add_argument('--directory', help='directory for generated files, temporary directory by default')
+    parser.add_argument('--mode', choices=['sql', 'memory'], help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.database, os.path.join(os.path.dirname(args.database), 'discrepencies.csv'), args.batchsize)))
+        return
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    truth = {code:count for code, count in dataset.truth().items() if count}
+    print(f'{args.rows} rows, injected discrepencies by error code: {truth}')
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        filename = os.path.join(directory, 'titanic.db')
+        start = time.perf_counter()
+        write_database(dataset, filename)
+        print(f'database written in {time.perf_counter() - start:.2f} s, {os.path.getsize(filename) / 2**20:.0f} MiB\n')
+
+        print(f"{'mode':>8} {'time [s]':>10} {'peak [MiB]':>11}  result")
+        for mode in ['sql', 'memory']:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, '--database', filename,
+                '--batchsize', str(args.batchsize)], capture_output=True, text=True)
+            if result.returncode:
+                raise RuntimeError(result.stderr)
+            run = json.loads(result.stdout)
+            counts = {int(code):count for code, count in run['counts'].items()}
+            status = 'OK' if counts == truth else f'MISMATCH, found {counts}'
+            print(f"{mode:>8} {run['seconds']:>10.2f} {run['maxrss'] / 2**20:>11.0f}  {status}")
+
+if __name__ == '__main__':
+    main()
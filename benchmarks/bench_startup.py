@@ -0,0 +1,64 @@
+'''
+Benchmark of CLI cold-start latency.
+
+Runs common invocations of TPC.py in fresh interpreters and reports median wall-clock time
+and heavy dependencies each invocation imported:
+
+    $ (venv) python benchmarks/bench_startup.py --repeat 10
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'openpyxl', 'tablib']
+
+# Runs TPC.py as __main__ and reports imported heavy modules even when the run fails
+RUNNER = '''
+import atexit, runpy, sys
+atexit.register(lambda: sys.stderr.write('imported:' + ','.join(m for m in {modules!r} if m in sys.modules) + '\\n'))
+sys.argv = ['TPC.py'] + sys.argv[1:]
+runpy.run_path('TPC.py', run_name='__main__')
+'''
+
+def invocations(directory):
+    output = os.path.join(directory, 'discrepencies.csv')
+    return [
+        ('import TPC', [sys.executable, '-c', 'import TPC']),
+        ('-h', ['-h']),
+        ('missing arguments', []),
+        ('wrong output extension', ['-i', 'tests/titanic-passengers.csv', '-o', os.path.join(directory, 'discrepencies.pdf')]),
+        ('run without -e (API unreachable)', ['-i', 'tests/titanic-passengers.csv', '-o', output, '-u', 'http://127.0.0.1:9/', '--retries', '0']),
+        ]
+
+def run(command, env):
+    if command[:1] != [sys.executable]:
+        command = [sys.executable, '-c', RUNNER.format(modules=HEAVY_MODULES)] + command
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    imported = [line[len('imported:'):] for line in result.stderr.splitlines() if line.startswith('imported:')]
+    return elapsed, imported[0] if imported else '-'
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CLI cold-start latency.')
+    parser.add_argument('--repeat', type=int, default=10, help='number of runs of each invocation, median is reported')
+    args = parser.parse_args()
+
+    # Bytecode caches are written on the first run, as in a regular installation
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    print(f"{'invocation':>34} {'median [ms]':>12}  imported heavy modules")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, command in invocations(directory):
+            run(command, env)
+            results = [run(command, env) for _ in range(args.repeat)]
+            median = statistics.median(elapsed for elapsed, _ in results) * 1000
+            print(f'{name:>34} {median:>12.0f}  {results[-1][1] or "none"}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Benchmark of summary mode (--summary) and early exit (--max-errors, --stop-on) on a badly broken load.
+
+Serves synthetic actual data with many discrepencies from the local stand-in API and runs the
+CLI in-process in the default, streaming and database modes, logging all discrepencies or only
+counts and examples, with and without a limit. Reports time of each run, number of counted
+discrepencies and size of the output file:
+
+    $ (venv) python benchmarks/bench_summary.py --rows 1000000 --rates value=0.3,missing=0.05
+'''
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates, write_expected
+from standin_api import serve
+
+def run_cli(arguments):
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(arguments)
+    start = time.perf_counter()
+    TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark summary mode and early exit on a badly broken load.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={'value':0.3, 'missing':0.05},
+        help='comma-separated kind=rate pairs, e.g. value=0.3,missing=0.05')
+    parser.add_argument('--pagesize', type=int, default=10000, help='number of records requested from stand-in API at once')
+    parser.add_argument('--maxerrors', type=int, default=1000, help='limit of discrepencies of early exit runs')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    print(f'{args.rows} rows, injected discrepencies by error code: {dataset.truth()}\n')
+    server = serve(dataset)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            expected_filename = os.path.join(directory, 'expected.csv')
+            database_filename = os.path.join(directory, 'titanic.db')
+            output_filename = os.path.join(directory, 'discrepencies.csv')
+            summary_filename = os.path.join(directory, 'summary.json')
+            write_expected(dataset, expected_filename)
+            with sqlite3.connect(database_filename) as connection:
+                for block in range(dataset.blocks):
+                    dataset.expected_block(block).to_sql('expected', connection, index=False, if_exists='append')
+                    dataset.actual_block(block).to_sql('actual', connection, index=False, if_exists='append')
+            connection.close()
+
+            inputs = {
+                'default':f'-i {expected_filename} -u {server.url} --pagesize {args.pagesize}',
+                'stream':f'-i {expected_filename} -u {server.url} --pagesize {args.pagesize} -s',
+                'sql':f'-i {database_filename}',
+                }
+            variants = {
+                'full':'',
+                'summary':f'--summary {summary_filename}',
+                'max-errors':f'--summary {summary_filename} --max-errors {args.maxerrors}',
+                'stop-on 4':f'--summary {summary_filename} --stop-on 4',
+                }
+            print(f"{'mode':>8} {'variant':>11} {'time [s]':>9} {'counted':>9} {'output [KiB]':>13}")
+            for mode, input_args in inputs.items():
+                for variant, variant_args in variants.items():
+                    if os.path.exists(summary_filename):
+                        os.remove(summary_filename)
+                    elapsed = run_cli(f'{input_args} -o {output_filename} -f {variant_args}')
+                    if os.path.exists(summary_filename):
+                        with open(summary_filename) as f:
+                            counted = json.load(f)['discrepencies']
+                    else:
+                        with open(output_filename) as f:
+                            counted = sum(1 for line in f) - 1
+                    print(f'{mode:>8} {variant:>11} {elapsed:>9.2f} {counted:>9} {os.path.getsize(output_filename) / 2**10:>13.0f}')
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+'''
+Benchmark harness running the comparison pipeline stage by stage on synthetic data.
+
+Generates expected data file (synthetic.py), serves actual data from a local stand-in API
+(standin_api.py) and measures time and peak resident memory of each stage. Found discrepencies
+are checked against the numbers injected by the generator. Results can be appended to a JSON
+Lines file and compared across versions (commits) of TPC:
+
+    $ (venv) python benchmarks/harness.py --rows 1000000 --results bench_results.jsonl
+    $ (venv) python benchmarks/harness.py --rows 1000000 --stages fetch,read_expected,compare --excel --stream
+    $ (venv) python benchmarks/harness.py --history bench_results.jsonl
+'''
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TPC
+from synthetic import SyntheticDataset, parse_rates, write_expected
+from standin_api import serve
+
+UNIQUE_COL = 'passengerid'
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+class StageMonitor():
+    '''
+    Measures wall-clock time and peak resident memory of a stage.
+    RSS is sampled every interval seconds with TPC.current_rss; without /proc, peak RSS of the whole process is reported.
+    '''
+    def __init__(self, interval=0.01):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start_rss = TPC.current_rss()
+        self.peak_rss = self.start_rss or 0
+        self.stopped = threading.Event()
+        if self.start_rss is not None:
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, TPC.current_rss())
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        self.stopped.set()
+        if self.start_rss is not None:
+            self.sampler.join()
+            self.peak_rss = max(self.peak_rss, TPC.current_rss())
+        else:
+            self.start_rss = self.peak_rss
+
+    def result(self):
+        return {
+            'seconds':round(self.seconds, 4),
+            'peak_mib':round(self.peak_rss / 2**20, 1),
+            'delta_mib':round((self.peak_rss - self.start_rss) / 2**20, 1),
+            }
+
+def tpc_version():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', 'TPC.py'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ('+dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_cli(arguments):
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(arguments)
+    return TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+
+def run_stages(args, dataset, directory):
+    '''
+    Run selected stages of the pipeline. Returns dict of stage results and found error counts.
+    '''
+    stages, counts = {}, {}
+    expected_filename = os.path.join(directory, f'expected{args.format}')
+    output_filename = os.path.join(directory, f'discrepencies{args.output_format}')
+
+    def stage(name, func, *func_args):
+        with StageMonitor() as monitor:
+            value = func(*func_args)
+        stages[name] = monitor.result()
+        print(f"{name:>14} {stages[name]['seconds']:>10.3f} {stages[name]['peak_mib']:>11.1f} {stages[name]['delta_mib']:>11.1f}")
+        return value
+
+    print(f"{'stage':>14} {'time [s]':>10} {'peak [MiB]':>11} {'delta [MiB]':>11}")
+    stage('generate', write_expected, dataset, expected_filename)
+    server = serve(dataset)
+    try:
+        fetcher = TPC.ActualDataFetcher(server.url, page_size=args.pagesize, workers=args.workers)
+        actual_df = stage('fetch', TPC.load_actual_data, fetcher)
+        comparator = stage('read_expected', TPC.Comparator.from_file, expected_filename, UNIQUE_COL, None, None, None, args.csvengine)
+        result = stage('compare', comparator.compare, actual_df)
+        counts['in-memory'] = result.error_counts()
+
+        def write_output():
+            with TPC.DiscrepenciesLogger(output_filename, UNIQUE_COL) as logger:
+                result.log(logger)
+        stage('write_output', write_output)
+        if args.excel:
+            def write_excel():
+                with TPC.DiscrepenciesLogger(output_filename, UNIQUE_COL) as logger:
+                    result.log(logger)
+                logger.prepare_excel(result.actual_df, comparator.expected_df, os.path.join(directory, 'discrepencies.xlsx'))
+            stage('excel', write_excel)
+        del actual_df, comparator, result
+
+        base_arguments = f'-i {expected_filename} -o {output_filename} -u {server.url} --pagesize {args.pagesize} --workers {args.workers}'
+        if args.cli:
+            errors_json = stage('cli', run_cli, base_arguments)
+            counts['cli'] = error_counts(errors_json)
+        if args.stream:
+            errors_json = stage('stream', run_cli, f'{base_arguments} -s --chunksize {args.chunksize}')
+            counts['stream'] = error_counts(errors_json)
+    finally:
+        server.shutdown()
+    return stages, counts
+
+def error_counts(errors_json):
+    counts = {}
+    for errors in errors_json.values():
+        for error in errors['errors']:
+            counts[error['error_code']] = counts.get(error['error_code'], 0) + 1
+    return dict(sorted(counts.items()))
+
+def print_history(filename, rows=None):
+    '''
+    Print time and peak memory of each stage for every recorded version.
+    '''
+    with open(filename) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if rows:
+        runs = [run for run in runs if run['rows'] == rows]
+    stage_names = list(dict.fromkeys(name for run in runs for name in run['stages']))
+    print(f"{'version':>16} {'rows':>10} " + ' '.join(f'{name:>22}' for name in stage_names))
+    for run in runs:
+        cells = []
+        for name in stage_names:
+            stage = run['stages'].get(name)
+            cells.append(f"{stage['seconds']:>9.2f} s {stage['peak_mib']:>6.0f} MiB" if stage else f"{'-':>22}")
+        print(f"{run['version']:>16} {run['rows']:>10} " + ' '.join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run comparison pipeline stage by stage on synthetic data.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids (1M-50M)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--format', choices=['.csv', '.json'], default='.csv', help='format of expected data file')
+    parser.add_argument('--output-format', choices=list(TPC.SINKS), default='.csv', help='format of discrepencies file')
+    parser.add_argument('--csvengine', choices=['c', 'pyarrow', 'auto'], default='c', help='CSV parser of expected data')
+    parser.add_argument('--pagesize', type=int, default=1000, help='number of records requested from stand-in API at once')
+    parser.add_argument('--workers', type=int, default=4, help='maximum number of concurrent API requests')
+    parser.add_argument('--chunksize', type=int, default=100000, help='chunk size of streaming mode')
+    parser.add_argument('--excel', action='store_true', help='measure Excel report stage')
+    parser.add_argument('--cli', action='store_true', help='measure whole in-memory CLI run')
+    parser.add_argument('--stream', action='store_true', help='measure whole streaming mode CLI run')
+    parser.add_argument('--directory', help='directory for generated files, temporary directory by default')
+    parser.add_argument('--results', help='JSON Lines file to which results are appended')
+    parser.add_argument('--history', help='print results recorded in JSON Lines file and exit')
+    args = parser.parse_args()
+
+    if args.history:
+        print_history(args.history)
+        return
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    truth = {code:count for code, count in dataset.truth().items() if count}
+    version = tpc_version()
+    print(f'TPC {version}, {args.rows} rows, injected discrepencies by error code: {truth}')
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        stages, counts = run_stages(args, dataset, directory)
+    for mode, found in counts.items():
+        status = 'OK' if found == truth else f'MISMATCH, found {found}'
+        print(f'{mode:>14}: {status}')
+
+    if args.results:
+        with open(args.results, 'a') as f:
+            f.write(json.dumps({
+                'version':version,
+                'date':datetime.datetime.now().isoformat(timespec='seconds'),
+                'rows':args.rows,
+                'seed':args.seed,
+                'rates':dataset.rates,
+                'python':sys.version.split()[0],
+                'pandas':TPC.pd.__version__,
+                'stages':stages,
+                'correct':all(found == truth for found in counts.values()),
+                }) + '\n')
+        print_history(args.results, rows=args.rows)
+
+if __name__ == '__main__':
+    main()
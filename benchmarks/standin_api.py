@@ -0,0 +1,114 @@
+'''
+Local stand-in of the records API serving actual data of a synthetic dataset (see synthetic.py).
+
+Pages are built on demand from the blocks of the dataset, so datasets larger than memory can be
+served. Supports start/rows paging with nhits and ETag revalidation like the live API:
+
+    $ (venv) python benchmarks/standin_api.py --rows 1000000 --port 8000
+    $ (venv) python TPC.py -i expected.csv -o discrepencies.csv -u "http://127.0.0.1:8000/api/records/1.0/search/?dataset=titanic-passengers"
+'''
+import argparse
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from synthetic import SyntheticDataset, frame_records, parse_rates
+
+PATH = '/api/records/1.0/search/'
+
+class ActualPages():
+    '''
+    Slices of actual data of a dataset by record offsets. Recently used blocks are kept in memory.
+    '''
+    def __init__(self, dataset, cached_blocks=4):
+        self.dataset = dataset
+        self.offsets = np.concatenate([[0], np.cumsum(dataset.actual_lengths())])
+        self.nhits = int(self.offsets[-1])
+        self.cached_blocks = cached_blocks
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def block(self, block):
+        with self.lock:
+            if block in self.blocks:
+                self.blocks.move_to_end(block)
+                return self.blocks[block]
+            df = self.dataset.actual_block(block)
+            self.blocks[block] = df
+            if len(self.blocks) > self.cached_blocks:
+                self.blocks.popitem(last=False)
+            return df
+
+    def records(self, start, rows):
+        stop = min(start + rows, self.nhits)
+        records = []
+        block = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        while start < stop:
+            df = self.block(block)
+            first = start - self.offsets[block]
+            last = min(stop, self.offsets[block + 1]) - self.offsets[block]
+            records.extend(frame_records(df.iloc[first:last]))
+            start = self.offsets[block] + last
+            block += 1
+        return records
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != PATH:
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.end_headers()
+            return
+        query = parse_qs(url.query)
+        start, rows = int(query.get('start', ['0'])[0]), int(query.get('rows', ['10'])[0])
+        pages = self.server.pages
+        body = json.dumps({'nhits':pages.nhits, 'records':pages.records(start, rows)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(dataset, host='127.0.0.1', port=0):
+    '''
+    Start stand-in API for dataset in a daemon thread. Returns the server; its url attribute
+    points to the records endpoint.
+    '''
+    server = ThreadingHTTPServer((host, port), StandInAPIHandler)
+    server.daemon_threads = True
+    server.pages = ActualPages(dataset)
+    server.etag = '"{}"'.format(hashlib.sha1(json.dumps([dataset.rows, dataset.seed, dataset.rates], sort_keys=True).encode()).hexdigest()[:16])
+    server.url = f'http://{host}:{server.server_address[1]}{PATH}?dataset=titanic-passengers'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve actual data of a synthetic dataset.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('--port', type=int, default=8000, help='port of the server')
+    args = parser.parse_args()
+
+    server = serve(SyntheticDataset(args.rows, seed=args.seed, rates=args.rates), port=args.port)
+    print(f'Serving {server.pages.nhits} records at {server.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
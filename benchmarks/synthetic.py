@@ -0,0 +1,194 @@
+'''
+Synthetic titanic datasets with a controlled mix of discrepencies.
+
+Rows are generated in blocks of block_size ids from a seed, so any block of expected or actual
+data can be rebuilt on demand without keeping the whole dataset in memory. Every id gets at most
+one injected discrepency:
+
+    missing        row dropped from actual data (error code 4)
+    dup_actual     row repeated in actual data (error code 2)
+    dup_expected   row repeated in expected data (error code 3)
+    excess         extra actual row with a new id (error code 5)
+    value          one value changed in actual data (error code 1)
+    type           "young" written to age column of expected data (error code 1)
+
+Writes expected data to CSV or JSON file (actual data is served by standin_api.py):
+
+    $ (venv) python benchmarks/synthetic.py --rows 1000000 -o expected.csv
+'''
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['passengerid', 'survived', 'pclass', 'name', 'sex', 'age', 'sibsp', 'parch', 'ticket', 'fare', 'cabin', 'embarked']
+DEFAULT_RATES = {'missing':0.001, 'dup_actual':0.001, 'dup_expected':0.001, 'excess':0.001, 'value':0.01, 'type':0.001}
+SURNAMES = ['Braund', 'Cumings', 'Heikkinen', 'Futrelle', 'Allen', 'Moran', 'McCarthy', 'Palsson', 'Johnson', 'Nasser']
+CHANGED_COLUMNS = ['survived', 'pclass', 'name', 'age', 'fare']
+
+class SyntheticDataset():
+    '''
+    Deterministic synthetic dataset of given number of rows.
+
+    Args:
+        rows (int): number of expected ids
+        seed (int): seed of random generators
+        rates (dict): fractions of ids with each kind of discrepency (see DEFAULT_RATES)
+        block_size (int): number of ids generated at once
+
+    Methods:
+        expected_block(block) / actual_block(block): DataFrame of expected / actual rows of a block
+        iter_expected(): yields expected blocks
+        actual_lengths(): numbers of actual rows of all blocks
+        truth(): numbers of discrepencies by error code the comparison should find
+    '''
+    def __init__(self, rows, seed=0, rates=None, block_size=100000):
+        self.rows = rows
+        self.seed = seed
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.block_size = block_size
+        self.blocks = -(-rows // block_size)
+        if sum(self.rates.values()) > 1:
+            raise ValueError("Rates of discrepencies must not sum up to more than 1.")
+
+    def ids(self, block):
+        return np.arange(block * self.block_size + 1, min((block + 1) * self.block_size, self.rows) + 1)
+
+    def kinds(self, block):
+        '''
+        Returns dict of boolean masks of block ids with each kind of discrepency.
+        '''
+        draws = np.random.default_rng([self.seed, block, 0]).random(len(self.ids(block)))
+        kinds, low = {}, 0.0
+        for kind, rate in self.rates.items():
+            kinds[kind] = (draws >= low) & (draws < low + rate)
+            low += rate
+        return kinds
+
+    def base_block(self, block):
+        ids = self.ids(block)
+        rng = np.random.default_rng([self.seed, block, 1])
+        size = len(ids)
+        surnames = rng.choice(SURNAMES, size=size)
+        return pd.DataFrame({
+            'passengerid':ids,
+            'survived':rng.choice(['Yes', 'No'], size=size),
+            'pclass':rng.integers(1, 4, size=size),
+            'name':[f'{surname}, Mr. Passenger {i}' for surname, i in zip(surnames, ids)],
+            'sex':rng.choice(['male', 'female'], size=size),
+            'age':np.where(rng.random(size=size) < 0.2, np.nan, rng.integers(1, 80, size=size).astype(float)),
+            'sibsp':rng.integers(0, 5, size=size),
+            'parch':rng.integers(0, 5, size=size),
+            'ticket':[f'{prefix} {number}' for prefix, number in zip(rng.choice(['PC', 'A/5', 'STON/O2.', 'SC/PARIS'], size=size),
+                rng.integers(100000, 999999, size=size))],
+            'fare':np.round(rng.random(size=size) * 100, 4),
+            'cabin':np.where(rng.random(size=size) < 0.75, None, rng.choice(['C85', 'C123', 'E46', 'G6'], size=size)),
+            'embarked':rng.choice(['S', 'C', 'Q'], size=size),
+            })
+
+    def expected_block(self, block):
+        df = self.base_block(block)
+        kinds = self.kinds(block)
+        if kinds['type'].any():
+            df['age'] = df['age'].astype(object)
+            df.loc[kinds['type'], 'age'] = 'young'
+        return pd.concat([df, df[kinds['dup_expected']]], ignore_index=True)
+
+    def actual_block(self, block):
+        df = self.base_block(block)
+        kinds = self.kinds(block)
+        changed = np.flatnonzero(kinds['value'])
+        columns = np.random.default_rng([self.seed, block, 2]).choice(CHANGED_COLUMNS, size=len(changed))
+        for col_name in CHANGED_COLUMNS:
+            rows = changed[columns == col_name]
+            if col_name == 'survived':
+                df.loc[rows, col_name] = np.where(df.loc[rows, col_name] == 'Yes', 'No', 'Yes')
+            elif col_name == 'name':
+                df.loc[rows, col_name] = df.loc[rows, col_name] + ' Jr.'
+            elif col_name == 'age':
+                df.loc[rows, col_name] = df.loc[rows, col_name].fillna(0) + 1
+            else:
+                df.loc[rows, col_name] = df.loc[rows, col_name] + 1
+        excess = df[kinds['excess']].assign(passengerid=lambda d: d['passengerid'] + self.rows)
+        return pd.concat([df[~kinds['missing']], df[kinds['dup_actual']], excess], ignore_index=True)
+
+    def actual_lengths(self):
+        lengths = []
+        for block in range(self.blocks):
+            kinds = self.kinds(block)
+            lengths.append(len(kinds['missing']) - int(kinds['missing'].sum()) + int(kinds['dup_actual'].sum()) + int(kinds['excess'].sum()))
+        return lengths
+
+    def iter_expected(self):
+        for block in range(self.blocks):
+            yield self.expected_block(block)
+
+    def truth(self):
+        counts = {code:0 for code in range(1, 6)}
+        for block in range(self.blocks):
+            kinds = self.kinds(block)
+            counts[1] += int(kinds['value'].sum() + kinds['type'].sum())
+            counts[2] += int(kinds['dup_actual'].sum())
+            counts[3] += int(kinds['dup_expected'].sum())
+            counts[4] += int(kinds['missing'].sum())
+            counts[5] += int(kinds['excess'].sum())
+        return counts
+
+def frame_records(df):
+    '''
+    Convert DataFrame to API records, leaving out missing fields as the API does.
+    '''
+    records = []
+    for row in df.to_dict('records'):
+        fields = {key:value for key, value in row.items() if value is not None and value == value}
+        records.append({
+            'datasetid':'titanic-passengers',
+            'recordid':f"{fields['passengerid']:040x}",
+            'fields':fields,
+            'record_timestamp':'2016-09-21T00:34:51.313+02:00',
+            })
+    return records
+
+def write_expected(dataset, filename):
+    '''
+    Write expected data of dataset to CSV (semicolon-separated, like the titanic file) or JSON file block by block.
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    with open(filename, 'w', newline='') as f:
+        if extension == '.json':
+            f.write('[')
+        for block, df in enumerate(dataset.iter_expected()):
+            if extension == '.json':
+                records = frame_records(df)
+                f.write((',\n' if block else '\n') + ',\n'.join(json.dumps(record, default=int) for record in records))
+            else:
+                df.rename(columns={'passengerid':'PassengerId'}).to_csv(f, sep=';', index=False, header=not block)
+        if extension == '.json':
+            f.write('\n]\n')
+
+def parse_rates(s):
+    rates = {}
+    for pair in s.split(','):
+        kind, rate = pair.split('=')
+        if kind not in DEFAULT_RATES:
+            raise argparse.ArgumentTypeError(f"Unknown kind of discrepency '{kind}', use one of {', '.join(DEFAULT_RATES)}.")
+        rates[kind] = float(rate)
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic expected titanic data.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of expected ids')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generators')
+    parser.add_argument('--rates', type=parse_rates, default={}, help='comma-separated kind=rate pairs, e.g. value=0.05,missing=0.01')
+    parser.add_argument('-o', '--output', required=True, help='path to CSV or JSON output file')
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.rows, seed=args.seed, rates=args.rates)
+    write_expected(dataset, args.output)
+    print(f'Written {args.output}; expected discrepencies by error code: {dataset.truth()}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,20 @@ import pytest
 import TPC
 import argparse
 import requests
+import subprocess
 import sys
 import os
 import pandas as pd
 import numpy as np
+import json
+import copy
+import io
+import openpyxl
+import threading
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
 
 @pytest.fixture(scope='module')
 def actual_data_response():
@@ -26,6 +36,95 @@ def test_API_response_data_schema(actual_data_response):
     assert 'records' in json_response.keys()
     assert 'fields' in json_response['records'][0].keys()
 
+def build_actual_records():
+    '''
+    Rebuild API records from test file by reverting changes listed in test_discrepencies_csv.
+    '''
+    with open('tests/titanic-passengers.json') as f:
+        expected_records = json.load(f)
+    records, seen = [], set()
+    for record in expected_records:
+        passengerid = record['fields']['passengerid']
+        if passengerid == 892 or passengerid in seen:
+            continue
+        seen.add(passengerid)
+        record = copy.deepcopy(record)
+        fields = record['fields']
+        if passengerid == 90:
+            fields.update(survived='No', pclass=3)
+        elif passengerid == 727:
+            fields['age'] = 30.0
+        elif passengerid == 797:
+            fields['fare'] = 25.9292
+        elif passengerid == 555:
+            fields['fare'] = 7.775
+        records.append(record)
+    records.append({
+        'datasetid':'titanic-passengers',
+        'recordid':'5ee8f3bd0ba5cb6c8b1b3bd8e6c2fd3e9a1f1d77',
+        'fields':{'fare':7.7958, 'name':'Svensson, Mr. Olof', 'embarked':'S', 'age':24.0, 'parch':0, 'pclass':3,
+            'sex':'male', 'survived':'No', 'ticket':'350035', 'passengerid':500, 'sibsp':0},
+        'record_timestamp':'2016-09-21T00:34:51.313+02:00',
+        })
+    return records
+
+@pytest.fixture()
+def offline_actual_data(monkeypatch):
+    '''
+    Replace API call with actual data rebuilt from test file
+    '''
+    records = build_actual_records()
+    def load_actual_data(fetcher=None, lean=False):
+        actual_df = TPC.load_json_data(records)
+        return TPC.compact_frame(actual_df) if lean else actual_df
+    monkeypatch.setattr(TPC, 'load_actual_data', load_actual_data)
+    return records
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+    '''
+    Serves records of server.records like opendatasoft records search API.
+    First server.failures requests are answered with status code 503.
+    '''
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if len(self.server.requests) <= self.server.failures:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        query = parse_qs(urlsplit(self.path).query)
+        start, rows = int(query['start'][0]), int(query['rows'][0])
+        body = json.dumps({'nhits':len(self.server.records), 'records':self.server.records[start:start + rows]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture()
+def standin_api():
+    '''
+    Local HTTP server serving actual data rebuilt from test file
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInAPIHandler)
+    server.records = build_actual_records()
+    server.requests = []
+    server.failures = 0
+    server.etag = '"v1"'
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/api/records/1.0/search/?dataset=titanic-passengers&rows=10000'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
 @pytest.fixture()
 def simple_parser_arg():
     parser = argparse.ArgumentParser()
@@ -170,3 +269,1074 @@ def test_compare_series_nan_values():
     assert bool_mask.iloc[1] == False
     assert bool_mask.iloc[2] == False
     assert bool_mask.iloc[3] == True
+
+def test_discrepencies_csv_offline(offline_actual_data, tmp_path):
+    '''
+    Test if changes listed in test_discrepencies_csv are found in data served without API
+    '''
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f')
+    json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert set(json_result.keys()) == {90, 727, 797, 555, 500, 41, 892}
+    assert [e['column_name'] for e in json_result[90]['errors']] == ['pclass', 'survived']
+    assert json_result[727]['errors'][0]['actual_value'] == 30.0
+    assert json_result[727]['errors'][0]['expected_value'] == 'Young'
+    assert json_result[500]['errors'][0]['error_code'] == 5
+    assert json_result[41]['errors'][0]['error_code'] == 3
+    assert json_result[892]['errors'][0]['error_code'] == 4
+
+def test_column_discrepencies_long_form():
+    '''
+    Test if wrong values are collected in one long-form frame ordered by column, then by id
+    '''
+    index = pd.Index([1, 2, 3], name='passengerid')
+    expected_df = pd.DataFrame({'age':[20.0, 30.0, np.nan], 'sex':['male', 'female', 'male']}, index=index)
+    actual_df = pd.DataFrame({'age':[21.0, 30.0, 5.0], 'sex':['male', 'male', 'female']}, index=index)
+    frame = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=True)
+    assert frame['passengerid'].tolist() == [1, 3, 2, 3]
+    assert frame['column_name'].tolist() == ['age', 'age', 'sex', 'sex']
+    assert frame['actual_value'].tolist() == [21.0, 5.0, 'male', 'female']
+    assert (frame['error_code'] == 1).all()
+
+def test_logger_add_frame(tmp_path):
+    '''
+    Test if rows added in bulk are logged the same way as rows added one by one
+    '''
+    missing_rows = [{'passengerid':7, 'error_message':'Missing row in actual data', 'error_code':4}]
+    wrong_rows = [
+        {'passengerid':8, 'error_message':'wrong value', 'error_code':1, 'column_name':'age', 'expected_value':1.0, 'actual_value':2.0},
+        {'passengerid':8, 'error_message':'wrong value', 'error_code':1, 'column_name':'sex', 'expected_value':'male', 'actual_value':'female'},
+        ]
+    single = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'single.csv'), unique_col='passengerid')
+    for row in missing_rows + wrong_rows:
+        single.add(row)
+    bulk = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'bulk.csv'), unique_col='passengerid')
+    bulk.add_frame(pd.DataFrame(missing_rows))
+    bulk.add_frame(pd.DataFrame(wrong_rows))
+    single.close()
+    bulk.close()
+    assert bulk.errors_json == single.errors_json
+    assert open(tmp_path / 'bulk.csv').read() == open(tmp_path / 'single.csv').read()
+
+def test_logger_writes_in_batches(tmp_path):
+    '''
+    Test if logger writes buffered rows only after batch_size rows are collected
+    '''
+    filename = str(tmp_path / 'output.csv')
+    logger = TPC.DiscrepenciesLogger(filename=filename, unique_col='passengerid', batch_size=3)
+    logger.add_frame(pd.DataFrame({'passengerid':[1, 2], 'error_message':'Missing row in actual data', 'error_code':4}))
+    assert len(open(filename).readlines()) == 1
+    logger.add({'passengerid':3, 'error_message':'Missing row in actual data', 'error_code':4})
+    assert len(open(filename).readlines()) == 4
+    logger.add({'passengerid':4, 'error_message':'Missing row in actual data', 'error_code':4})
+    logger.close()
+    assert len(open(filename).readlines()) == 5
+
+def test_logger_drops_flushed_rows(tmp_path):
+    '''
+    Test if logger with keep_rows=False holds at most batch_size discrepencies, but counts and writes all of them
+    '''
+    filename = str(tmp_path / 'output.csv')
+    logger = TPC.DiscrepenciesLogger(filename=filename, unique_col='passengerid', batch_size=2, keep_rows=False)
+    expected_chunks = [pd.DataFrame({'passengerid':range(1, 101), 'age':1.0})]
+    actual_chunks = [pd.DataFrame({'passengerid':range(1, 101), 'age':2.0}), pd.DataFrame({'passengerid':[101], 'age':[3.0]})]
+    buffered = []
+    add_frame = logger.add_frame
+    logger.add_frame = lambda frame: (add_frame(frame), buffered.append(len(logger.columns['error_code'])))
+    TPC.stream_comparison(expected_chunks, actual_chunks, logger, 'passengerid', ['age'], batch_size=10, directory=str(tmp_path))
+    logger.close()
+    assert max(buffered) < 2 and len(logger.columns['error_code']) == 0
+    assert len(logger) == 101 and logger.error_counts() == {1:100, 5:1}
+    assert len(pd.read_csv(filename)) == 101
+
+@pytest.mark.parametrize('extension', ['.jsonl', '.parquet', '.feather'])
+def test_logger_sinks(tmp_path, extension):
+    '''
+    Test if discrepencies written to each sink can be read back
+    '''
+    if extension != '.jsonl':
+        pytest.importorskip('pyarrow')
+    filename = str(tmp_path / f'output{extension}')
+    with TPC.DiscrepenciesLogger(filename=filename, unique_col='passengerid', batch_size=1) as logger:
+        logger.add({'passengerid':5, 'error_message':'Excessive row in actual data', 'error_code':5})
+        logger.add({'passengerid':9, 'error_message':'wrong value', 'error_code':1, 'column_name':'age', 'expected_value':'young', 'actual_value':np.nan})
+    if extension == '.jsonl':
+        frame = pd.read_json(filename, lines=True)
+    elif extension == '.parquet':
+        frame = pd.read_parquet(filename)
+    else:
+        frame = pd.read_feather(filename)
+    assert frame['passengerid'].tolist() == [5, 9]
+    assert frame['error_code'].tolist() == [5, 1]
+    assert frame['expected_value'].tolist()[1] == 'young'
+
+def test_logger_tabularize_from_memory(tmp_path):
+    '''
+    Test if tabularize and errors_json do not depend on the output file
+    '''
+    filename = str(tmp_path / 'output.csv')
+    logger = TPC.DiscrepenciesLogger(filename=filename, unique_col='passengerid')
+    logger.add({'passengerid':1, 'error_message':'wrong value', 'error_code':1, 'column_name':'fare', 'expected_value':7.25, 'actual_value':7.5})
+    logger.close()
+    os.remove(filename)
+    dataset = logger.tabularize()
+    assert dataset.headers == logger.fieldnames
+    assert dataset[0] == ('1', 'wrong value', '1', 'fare', '7.25', '7.5')
+    assert logger.errors_json[1]['errors'][0]['expected_value'] == 7.25
+
+@pytest.mark.parametrize('input_file', ['tests/titanic-passengers.csv', 'tests/titanic-passengers.json'])
+def test_stream_comparison_same_as_in_memory(standin_api, input_file, tmp_path):
+    '''
+    Test if streaming mode finds the same discrepencies as in-memory comparison
+    '''
+    results = []
+    for stream_args in ['', '-s --chunksize 20 --pagesize 50']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i {input_file} -o {tmp_path / "output.csv"} -f -u {standin_api.url} {stream_args}')
+        json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+        results.append(sorted(
+            (row_id, error['error_code'], error['column_name'], str(error['expected_value']))
+            for row_id, errors in json_result.items() for error in errors['errors']
+            ))
+    assert results[0] == results[1]
+
+def test_stream_comparison_duplicates_across_chunks(tmp_path):
+    '''
+    Test if ids duplicated in different chunks are detected in streaming mode
+    '''
+    expected_chunks = [
+        pd.DataFrame({'passengerid':[3, 1], 'age':[30.0, 10.0]}),
+        pd.DataFrame({'passengerid':[2, 4], 'age':[20.0, 40.0]}),
+        ]
+    actual_chunks = [
+        pd.DataFrame({'passengerid':[2, 1], 'age':[20.0, 11.0]}),
+        pd.DataFrame({'passengerid':[5]   , 'age':[50.0]}),
+        pd.DataFrame({'passengerid':[2, 3], 'age':[20.0, 30.0]}),
+        ]
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    TPC.stream_comparison(expected_chunks, actual_chunks, logger, 'passengerid', ['age'], batch_size=2, directory=str(tmp_path))
+    logger.close()
+    codes = {row_id:[error['error_code'] for error in errors['errors']] for row_id, errors in logger.errors_json.items()}
+    assert codes == {1:[1], 2:[2], 4:[4], 5:[5]}
+    assert os.listdir(tmp_path) == ['output.csv']
+
+def test_stream_comparison_flushes_row_errors(tmp_path):
+    '''
+    Test if missing and excessive ids are logged in frames of at most batch_size rows and a limit stops the comparison early
+    '''
+    expected_chunks = [pd.DataFrame({'passengerid':range(0, 1000, 2), 'age':1.0})]
+    actual_chunks = [pd.DataFrame({'passengerid':range(1, 1000, 2), 'age':1.0})]
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    sizes = []
+    add_frame = logger.add_frame
+    logger.add_frame = lambda frame: (sizes.append(len(frame)), add_frame(frame))
+    TPC.stream_comparison(expected_chunks, actual_chunks, logger, 'passengerid', ['age'], batch_size=100, directory=str(tmp_path))
+    logger.close()
+    assert len(logger) == 1000 and max(sizes) <= 100
+
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    summary = TPC.DiscrepenciesSummary(logger, sample_size=None, max_errors=150)
+    sizes = []
+    add_frame = summary.add_frame
+    summary.add_frame = lambda frame: (sizes.append(len(frame)), add_frame(frame))
+    with pytest.raises(TPC.ComparisonStopped):
+        TPC.stream_comparison(expected_chunks, actual_chunks, summary, 'passengerid', ['age'], batch_size=100, directory=str(tmp_path))
+    summary.close()
+    assert len(summary) == 150 and sum(sizes) == 200
+
+def test_fetcher_pages_through_all_records(standin_api):
+    '''
+    Test if fetcher requests all pages and yields them in order
+    '''
+    fetcher = TPC.ActualDataFetcher(standin_api.url, page_size=100, workers=3)
+    pages = list(fetcher.iter_pages())
+    assert len(pages) == 9
+    assert [r['fields']['passengerid'] for page in pages for r in page] == [r['fields']['passengerid'] for r in standin_api.records]
+    assert all('rows=100&' in path for path in standin_api.requests)
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_load_actual_data_without_records(standin_api, lean):
+    '''
+    Test if API returning no records gives empty actual data, so all expected rows are reported as missing
+    '''
+    standin_api.records = []
+    fetcher = TPC.ActualDataFetcher(standin_api.url, page_size=500, keep_meta=lean)
+    actual_df = TPC.load_actual_data(fetcher, lean=lean)
+    assert len(actual_df) == 0
+    assert actual_df.columns.tolist() == ['passengerid'] + (TPC.META_COLUMNS if lean else [])
+    result = TPC.Comparator.from_file('tests/titanic-passengers.csv').compare(actual_df)
+    assert result.error_counts() == {3:1, 4:891}
+
+def test_fetcher_retries_failed_requests(standin_api):
+    '''
+    Test if fetcher retries requests answered with 5xx status code
+    '''
+    standin_api.failures = 2
+    fetcher = TPC.ActualDataFetcher(standin_api.url, page_size=500, retries=2, backoff=0.01)
+    actual_df = TPC.load_actual_data(fetcher)
+    assert len(actual_df) == len(standin_api.records)
+    assert len(standin_api.requests) == 4
+
+    standin_api.requests, standin_api.failures = [], 3
+    fetcher = TPC.ActualDataFetcher(standin_api.url, page_size=500, retries=2, backoff=0.01)
+    with pytest.raises(TPC.requests.exceptions.RetryError):
+        TPC.load_actual_data(fetcher)
+
+def test_discrepencies_from_standin_api(standin_api, tmp_path):
+    '''
+    Test if comparison against paginated stand-in API finds changes listed in test_discrepencies_csv
+    '''
+    for stream_args in ['', '-s']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i tests/titanic-passengers.json -o {tmp_path / "output.csv"} -f -u {standin_api.url} --pagesize 128 {stream_args}')
+        json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+        assert set(json_result.keys()) == {90, 727, 797, 555, 500, 41, 892}
+
+def test_snapshot_cache_revalidation(standin_api, tmp_path):
+    '''
+    Test if cached snapshot is reused within ttl, revalidated with ETag and refreshed when data changes
+    without requesting the first page again
+    '''
+    def load(**kwargs):
+        standin_api.requests = []
+        cache = TPC.SnapshotCache(str(tmp_path), keep=1, **kwargs)
+        return cache.load(TPC.ActualDataFetcher(standin_api.url, page_size=500))
+
+    fetched_df = load()
+    assert len(standin_api.requests) == 2
+    cached_df = load()
+    assert standin_api.requests == []
+    pd.testing.assert_frame_equal(cached_df, fetched_df)
+
+    load(ttl=0)
+    assert len(standin_api.requests) == 1
+
+    standin_api.etag = '"v2"'
+    standin_api.records = standin_api.records[:-1]
+    refreshed_df = load(ttl=0)
+    assert len(standin_api.requests) == 2 and 'start=0' in standin_api.requests[0] and 'start=500' in standin_api.requests[1]
+    assert len(refreshed_df) == len(fetched_df) - 1
+    snapshots = [f for f in os.listdir(next(tmp_path.iterdir())) if f.startswith('snapshot-')]
+    assert len(snapshots) == 1
+
+    assert len(load(offline=True)) == len(refreshed_df)
+    assert standin_api.requests == []
+
+def test_snapshot_cache_offline_without_snapshot(tmp_path):
+    '''
+    Test if offline mode without cached snapshot raises ValueError
+    '''
+    cache = TPC.SnapshotCache(str(tmp_path), offline=True)
+    with pytest.raises(ValueError):
+        cache.load(TPC.ActualDataFetcher('http://127.0.0.1:1/api/records/1.0/search/?dataset=titanic-passengers'))
+
+def test_incremental_comparison(standin_api, tmp_path, monkeypatch):
+    '''
+    Test if incremental comparison compares only changed rows and reuses discrepencies of the previous run
+    '''
+    compared_rows = []
+    column_discrepencies = TPC.column_discrepencies
+    def spy(expected_df, actual_df, *args, **kwargs):
+        compared_rows.append(len(expected_df))
+        return column_discrepencies(expected_df, actual_df, *args, **kwargs)
+    monkeypatch.setattr(TPC, 'column_discrepencies', spy)
+
+    def compare(incremental=True):
+        compared_rows.clear()
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f -u {standin_api.url}')
+        if incremental:
+            APF.add_argument(f'--incremental {tmp_path / "manifest.pickle"}')
+        return TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+
+    full_result = compare(incremental=False)
+    assert compare() == full_result
+    assert compare() == full_result
+    assert compared_rows == [0]
+
+    record = next(r for r in standin_api.records if r['fields']['passengerid'] == 1)
+    record['fields']['fare'] = 100.0
+    record['record_timestamp'] = '2020-01-01T00:00:00+00:00'
+    result = compare()
+    assert compared_rows == [1]
+    assert result[1]['errors'][0]['actual_value'] == 100.0
+    del result[1]
+    assert result == full_result
+
+@pytest.mark.parametrize('isclose_flag', [True, False])
+def test_row_hash_fast_path_same_as_full_comparison(isclose_flag):
+    '''
+    Test if skipping rows with equal hashes does not change found discrepencies
+    '''
+    rows = 2000
+    rng = np.random.default_rng(0)
+    index = pd.Index(np.arange(rows), name='passengerid')
+    expected_df = pd.DataFrame({
+        'fare':rng.random(rows) * 100,
+        'pclass':rng.integers(1, 4, rows),
+        'name':[f'Passenger {i}' for i in range(rows)],
+        'cabin':rng.choice(np.array(['C85', None], dtype=object), rows),
+        'age':rng.integers(1, 80, rows).astype(float),
+        }, index=index)
+    actual_df = expected_df.copy()
+    actual_df.iloc[:10, 0] = actual_df.iloc[:10, 0] + 1e-12
+    actual_df.iloc[10:20, 0] = actual_df.iloc[10:20, 0] + 1
+    actual_df.iloc[20:30, 1] = 5
+    actual_df.iloc[30:40, 2] = 'Changed'
+    actual_df.iloc[40:50, 3] = 'X'
+    actual_df['age'] = actual_df['age'].astype(object)
+    actual_df.iloc[50, 4] = 'young'
+    hashed = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=isclose_flag, row_hash=True)
+    full = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=isclose_flag, row_hash=False)
+    pd.testing.assert_frame_equal(hashed, full)
+    assert len(hashed) == (41 if isclose_flag else 51)
+
+def test_row_hash_distinguishes_missing_values_from_strings():
+    '''
+    Test if missing values and strings 'None' and 'nan' have different row hashes
+    '''
+    index = pd.Index(np.arange(10), name='passengerid')
+    # Distinct values are hashed without factorizing, which hashes missing values like their string representations
+    cabins = [f'C{i}' for i in range(5)]
+    expected_df = pd.DataFrame({'cabin':cabins + [None, np.nan, 'B42', 15, 'X'], 'name':'a'}, index=index)
+    actual_df = pd.DataFrame({'cabin':cabins + ['None', 'nan', 'B42', '15', 'X'], 'name':'a'}, index=index)
+    for cabins in [slice(None), slice(0, 7)]:
+        expected, actual = expected_df.iloc[cabins], actual_df.iloc[cabins]
+        hashed = TPC.column_discrepencies(expected, actual, 'passengerid', row_hash=True)
+        full = TPC.column_discrepencies(expected, actual, 'passengerid', row_hash=False)
+        pd.testing.assert_frame_equal(hashed, full)
+        assert hashed['passengerid'].tolist()[:2] == [5, 6]
+
+@pytest.mark.parametrize('schema', ['fare:float:0:0', 'fare:string'])
+def test_row_hash_respects_schema_rules(schema):
+    '''
+    Test if rows equal after float normalization are still compared according to schema rules of their columns
+    '''
+    index = pd.Index(np.arange(10), name='passengerid')
+    expected_df = pd.DataFrame({'fare':7.8542, 'age':30.0}, index=index)
+    actual_df = pd.DataFrame({'fare':7.8542000000000005, 'age':[31.0] + [30.0] * 9}, index=index)
+    hashed = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=True, schema=TPC.parse_schema(schema))
+    full = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=True, row_hash=False,
+        schema=TPC.parse_schema(schema))
+    pd.testing.assert_frame_equal(hashed, full)
+    assert (hashed['column_name'] == 'fare').sum() == 10
+
+def test_changed_rows_mask_float_normalization():
+    '''
+    Test if floats differing only by API noise have equal hashes with isclose_flag
+    '''
+    expected_df = pd.DataFrame({'fare':[7.8542, 25.9292, 0.0, np.nan, 1e-300]})
+    actual_df = pd.DataFrame({'fare':[7.8542000000000005, 25.93, 0.0, np.nan, 1e-300]})
+    changed = TPC.changed_rows_mask(expected_df, actual_df, ['fare'], isclose_flag=True)
+    assert changed.tolist() == [False, True, False, False, False]
+    changed = TPC.changed_rows_mask(expected_df, actual_df, ['fare'], isclose_flag=False, max_changed=1)
+    assert changed.tolist() == [True, True, False, False, False]
+
+@pytest.mark.parametrize('use_fork', [
+    pytest.param(True, marks=pytest.mark.skipif('fork' not in TPC.multiprocessing.get_all_start_methods(), reason='fork not available')),
+    False,
+    ])
+def test_parallel_series_masks_same_as_serial(use_fork):
+    '''
+    Test if columns compared in a process pool give the same masks as serial comparison
+    '''
+    rng = np.random.default_rng(0)
+    expected_df = pd.DataFrame({
+        'fare':rng.random(100),
+        'pclass':rng.integers(1, 4, 100),
+        'name':[f'Passenger {i}' for i in range(100)],
+        'age':rng.random(100),
+        })
+    actual_df = expected_df.copy()
+    actual_df.iloc[::7, 0] += 1e-12
+    actual_df.iloc[::5, 1] = 5
+    actual_df.iloc[::3, 2] = 'Changed'
+    actual_df['age'] = actual_df['age'].astype(object)
+    actual_df.iloc[4, 3] = 'young'
+    column_pairs = [(actual_df[c], expected_df[c]) for c in actual_df.columns]
+    masks = TPC.parallel_series_masks(column_pairs, isclose_flag=True, jobs=2, use_fork=use_fork)
+    for mask, (actual_col, expected_col) in zip(masks, column_pairs):
+        assert mask.tolist() == TPC.discrepencies_series_mask(actual_col, expected_col, isclose_flag=True).tolist()
+
+def test_column_discrepencies_jobs(offline_actual_data):
+    '''
+    Test if parallel comparison of titanic data gives the same result as serial one
+    '''
+    expected_df = pd.read_csv('tests/titanic-passengers.csv', sep=';').rename(columns=str.lower)
+    expected_df = expected_df.drop_duplicates('passengerid').set_index('passengerid')
+    actual_df = TPC.load_actual_data().set_index('passengerid')
+    common = expected_df.index.intersection(actual_df.index).sort_values()
+    expected_df, actual_df = expected_df.loc[common, actual_df.columns], actual_df.loc[common]
+    serial = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=True)
+    parallel = TPC.column_discrepencies(expected_df, actual_df, 'passengerid', isclose_flag=True, jobs=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert len(serial) == 5
+
+@pytest.mark.parametrize('buffer_size', [7, 65536])
+def test_iter_json_frames_same_as_json_normalize(buffer_size):
+    '''
+    Test if incrementally parsed JSON file gives the same DataFrame as double json_normalize
+    '''
+    with open('tests/titanic-passengers.json') as f:
+        records = json.load(f)
+    expected = pd.json_normalize(pd.json_normalize(records, max_level=0)['fields'])
+    with open('tests/titanic-passengers.json') as f:
+        frames = list(TPC.iter_json_frames(f, buffer_size=buffer_size))
+    assert len(frames) == 1
+    pd.testing.assert_frame_equal(frames[0], expected)
+
+def test_iter_json_frames_filters_while_parsing():
+    '''
+    Test if columns and IDs are narrowed and mixed column types are kept while parsing
+    '''
+    records = [
+        {'fields':{'PassengerId':1, 'fare':7, 'name':'A'}, 'recordid':'a'},
+        {'fields':{'PassengerId':2, 'fare':7.25, 'cabin':'C85'}, 'recordid':'b'},
+        {'fields':{'PassengerId':3, 'fare':None, 'name':'C'}, 'recordid':'c'},
+        {'fields':{'PassengerId':4, 'fare':8, 'name':'D', 'age':1}, 'recordid':'d'},
+        ]
+    file = io.StringIO(json.dumps(records))
+    frames = list(TPC.iter_json_frames(file, chunksize=2, usecols=['passengerid', 'fare', 'cabin', 'age'], useids=[1, 2, 3],
+        keep_meta=True))
+    assert [len(frame) for frame in frames] == [2, 1]
+    assert frames[1].columns.tolist() == ['passengerid', 'fare', 'cabin', 'age', 'recordid']
+    frame = pd.concat(frames, ignore_index=True)
+    assert frame['passengerid'].dtype == np.int64
+    assert frame['fare'].dtype == np.float64
+    assert frame['fare'].tolist()[:2] == [7.0, 7.25] and np.isnan(frame['fare'][2])
+    assert frame['cabin'].isna().tolist() == [True, False, True]
+    assert frame['recordid'].tolist() == ['a', 'b', 'c']
+
+@pytest.mark.parametrize('content', ['{"records": []}', '[{"fields": {"passengerid": 1}} {"fields": {}}]', '[{"fields": {"passengerid": 1}'])
+def test_iter_json_frames_invalid_input(content):
+    '''
+    Test if malformed JSON files raise ValueError
+    '''
+    with pytest.raises(ValueError):
+        list(TPC.iter_json_frames(io.StringIO(content), buffer_size=4))
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_iter_csv_frames_pushdown(engine):
+    '''
+    Test if CSV reader selects columns case-insensitively, filters IDs and keeps given dtypes
+    '''
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+    dialect = TPC.Sniffer().sniff(open('tests/titanic-passengers.csv').read(1024))
+    expected = pd.read_csv('tests/titanic-passengers.csv', dialect=dialect).rename(columns=str.lower)
+    pd.testing.assert_frame_equal(next(TPC.iter_csv_frames('tests/titanic-passengers.csv', engine=engine, dialect=dialect)), expected)
+
+    ids = [90, 727, 41, 892]
+    frames = list(TPC.iter_csv_frames('tests/titanic-passengers.csv', chunksize=2, usecols=['passengerid', 'fare', 'name'], useids=ids,
+        dtype={'fare':'float32', 'passengerid':'int32'}, engine=engine, dialect=dialect))
+    assert all(len(frame) <= 2 for frame in frames)
+    frame = pd.concat(frames)
+    assert frame.columns.tolist() == ['passengerid', 'name', 'fare']
+    assert frame.dtypes.tolist() == [np.int32, object, np.float32]
+    narrowed = expected[expected['passengerid'].isin(ids)]
+    assert sorted(frame['passengerid']) == sorted(narrowed['passengerid'])
+
+def test_csv_engines_same_discrepencies(offline_actual_data, tmp_path):
+    '''
+    Test if pyarrow CSV engine and --dtypes give the same result as default reading
+    '''
+    pytest.importorskip('pyarrow')
+    results = []
+    for csv_args in ['', '--csvengine pyarrow --dtypes fare:float64,ticket:str']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f -c name,fare,pclass,survived -p 90,727,500,41,892 {csv_args}')
+        results.append(TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True))
+    assert results[0] == results[1]
+    assert set(results[0].keys()) == {90, 500, 41, 892}
+
+def test_arrow_csv_frames_type_change_after_first_block(tmp_path):
+    '''
+    Test if a value of another type after the first block of pyarrow reader does not stop reading of CSV file
+    '''
+    pytest.importorskip('pyarrow')
+    dialect = TPC.Sniffer().sniff(open('tests/titanic-passengers.csv').read(1024))
+    expected = pd.read_csv('tests/titanic-passengers.csv', dialect=dialect)
+    expected['Age'] = pd.to_numeric(expected['Age'], errors='coerce').astype(object)
+    expected.loc[len(expected) - 3, 'Age'] = 'Young'
+    filename = str(tmp_path / 'expected.csv')
+    expected.to_csv(filename, index=False)
+    frames = list(TPC.iter_arrow_csv_frames(filename, block_size=4096, fallback_chunksize=100))
+    assert len(frames) > 2
+    frame = pd.concat(frames, ignore_index=True)
+    c_frame = pd.read_csv(filename)
+    pd.testing.assert_frame_equal(frame.drop(columns='Age'), c_frame.drop(columns='Age'))
+    # Ages are floats in batches converted by pyarrow and numeric strings in the frame of pandas parser
+    assert frames[0]['Age'].dtype == 'float64' and frame['Age'].iat[-3] == 'Young'
+    np.testing.assert_array_equal(pd.to_numeric(frame['Age'], errors='coerce'), pd.to_numeric(c_frame['Age'], errors='coerce'))
+
+def test_excel_report(offline_actual_data, tmp_path):
+    '''
+    Test if Excel report lists rows in id order with discrepencies marked
+    '''
+    excel_filename = tmp_path / 'discrepencies.xlsx'
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f -e {excel_filename}')
+    TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    sh = openpyxl.load_workbook(excel_filename)['Discrepencies']
+    rows = list(sh.iter_rows())
+    headings = [cell.value for cell in rows[0]]
+    assert headings[0] == 'passengerid' and headings[-1] == 'error_message'
+    ids = [row[0].value for row in rows[1:]]
+    assert ids == sorted(ids)
+    by_id = {row[0].value:row for row in rows[1:]}
+    age = by_id[727][headings.index('age')]
+    assert 'expected: Young' in age.value and age.fill.start_color.rgb.endswith('FF0000')
+    assert by_id[727][-1].value == 'wrong value'
+    assert by_id[892][-1].value == 'Missing row in actual data'
+    assert all(cell.fill.start_color.rgb.endswith('8A0000') for cell in by_id[892][:-1])
+    assert all(cell.fill.start_color.rgb.endswith('108A00') for cell in by_id[500])
+    assert all(cell.fill.start_color.rgb.endswith('EBAE34') for cell in by_id[41])
+
+def test_excel_report_splits_sheets(tmp_path):
+    '''
+    Test if Excel report continues in a new sheet when a sheet reaches max_rows rows
+    '''
+    actual_df = pd.DataFrame({'fare':[7.25, 7.5, np.nan, 8.0]}, index=pd.Index([1, 2, 4, 5], name='passengerid'))
+    expected_df = pd.DataFrame({'fare':[7.25, 7.25, 9.0, np.nan]}, index=pd.Index([1, 2, 3, 4], name='passengerid'))
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'discrepencies.csv'), unique_col='passengerid')
+    logger.add({'passengerid':2, 'error_message':'wrong value', 'error_code':1, 'column_name':'fare', 'expected_value':7.25, 'actual_value':7.5})
+    logger.add({'passengerid':3, 'error_message':'Missing row in actual data', 'error_code':4})
+    logger.add({'passengerid':5, 'error_message':'Excessive row in actual data', 'error_code':5})
+    logger.close()
+    logger.prepare_excel(actual_df, expected_df, str(tmp_path / 'discrepencies.xlsx'), max_rows=3)
+    wb = openpyxl.load_workbook(tmp_path / 'discrepencies.xlsx')
+    assert wb.sheetnames == ['Discrepencies', 'Discrepencies 2', 'Discrepencies 3']
+    sheets = [[[cell.value for cell in row] for row in wb[name].iter_rows()] for name in wb.sheetnames]
+    assert all(sheet[0] == ['passengerid', 'fare', 'error_message'] for sheet in sheets)
+    assert [row for sheet in sheets for row in sheet[1:]] == [
+        [1, 7.25, None],
+        [2, '7.5 \\\\ expected: 7.25 \\\\', 'wrong value'],
+        [3, 9, 'Missing row in actual data'],
+        [4, None, None],
+        [5, 8, 'Excessive row in actual data'],
+        ]
+
+def test_excel_report_nullable_dtypes(tmp_path):
+    '''
+    Test if missing values of nullable dtypes (pd.NA) are written to Excel report as empty cells
+    '''
+    actual_df = pd.DataFrame({'pclass':pd.array([1, None, 3], dtype='Int64')}, index=pd.Index([1, 2, 3], name='passengerid'))
+    expected_df = pd.DataFrame({'pclass':pd.array([1, 2, None], dtype='Int64')}, index=pd.Index([1, 2, 3], name='passengerid'))
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'discrepencies.csv'), unique_col='passengerid')
+    logger.add_frame(TPC.column_discrepencies(expected_df, actual_df, 'passengerid'))
+    logger.close()
+    logger.prepare_excel(actual_df, expected_df, str(tmp_path / 'discrepencies.xlsx'))
+    rows = [[cell.value for cell in row] for row in openpyxl.load_workbook(tmp_path / 'discrepencies.xlsx')['Discrepencies'].iter_rows()]
+    assert rows[1:] == [[1, 1, None], [2, 'None \\\\ expected: 2 \\\\', 'wrong value'], [3, '3 \\\\ expected: <NA> \\\\', 'wrong value']]
+
+def test_comparator_structured_result():
+    '''
+    Test if Comparator finds changes listed in test_discrepencies_csv and returns them as structured result
+    '''
+    comparator = TPC.Comparator.from_file('tests/titanic-passengers.csv', isclose_flag=True)
+    result = comparator.compare(TPC.load_json_data(build_actual_records()))
+    assert result.error_counts() == {1:5, 3:1, 4:1, 5:1}
+    assert sorted(result.ids(1)) == [90, 555, 727, 797]
+    assert result.ids(4) == [892]
+    assert result.ids(5) == [500]
+    assert result.ids(3) == [41]
+    assert len(result) == 8
+    assert 500 in result.actual_df.index
+
+def test_comparator_reused_across_threads():
+    '''
+    Test if one Comparator gives the same results for many actual datasets compared from many threads at once
+    '''
+    comparator = TPC.Comparator.from_file('tests/titanic-passengers.json', columns=['name', 'fare', 'age'], isclose_flag=True)
+    base_df = TPC.load_json_data(build_actual_records())
+    actual_dfs = []
+    for i in range(16):
+        actual_df = base_df.copy()
+        actual_df.loc[i, 'fare'] = -1.0
+        actual_dfs.append(actual_df.iloc[i:])
+    serial = [comparator.compare(actual_df) for actual_df in actual_dfs]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        concurrent = list(executor.map(comparator.compare, actual_dfs))
+    for i, (serial_result, concurrent_result) in enumerate(zip(serial, concurrent)):
+        pd.testing.assert_frame_equal(serial_result.wrong_values, concurrent_result.wrong_values)
+        pd.testing.assert_frame_equal(serial_result.row_errors, concurrent_result.row_errors)
+        assert base_df.loc[i, 'passengerid'] in serial_result.ids(1)
+        assert len(serial_result.ids(4)) == i + 1
+
+def test_lazy_imports(tmp_path):
+    '''
+    Test if importing TPC and rejecting arguments do not import heavy dependencies
+    '''
+    code = '\n'.join([
+        'import argparse, sys, TPC',
+        'APF = TPC.ArgparseFactory()',
+        f"APF.add_argument('-i tests/titanic-passengers.csv -o {tmp_path / 'discrepencies.pdf'}')",
+        'try:',
+        '    TPC.titanic_datasets_comparison(APF.parse_args())',
+        'except argparse.ArgumentError:',
+        '    pass',
+        "print(','.join(m for m in ('pandas', 'numpy', 'requests', 'openpyxl', 'tablib') if m in sys.modules))",
+        ])
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(TPC.__file__)))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+def test_profile_report(offline_actual_data, tmp_path):
+    '''
+    Test if --profile saves JSON report with time, memory and counts of comparison stages
+    '''
+    profile_filename = tmp_path / 'profile.json'
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f --profile {profile_filename}')
+    TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    with open(profile_filename) as f:
+        report = json.load(f)
+    stages = {stage['name']:stage for stage in report['stages']}
+    assert list(stages) == ['read_expected', 'index_expected', 'fetch_actual', 'index_actual', 'row_errors', 'column_comparison', 'write_output']
+    assert all(stage['calls'] == 1 and stage['seconds'] >= 0 and stage['peak_rss_mib'] > 0 for stage in stages.values())
+    assert stages['read_expected']['rows'] == 892
+    assert stages['row_errors']['discrepencies'] == 3
+    assert stages['column_comparison']['discrepencies'] == 5
+    assert stages['write_output']['rows'] == report['discrepencies'] == 8
+    assert report['discrepencies_by_code'] == {'1':5, '3':1, '4':1, '5':1}
+
+def test_disabled_profiler_records_nothing():
+    '''
+    Test if disabled StageProfiler returns shared no-op stage and repeated stages of enabled one are summed up
+    '''
+    profiler = TPC.StageProfiler(enabled=False)
+    with profiler.stage('compare', rows=10) as stage:
+        stage.set(discrepencies=1)
+    assert stage is TPC.NULL_STAGE
+    assert profiler.report()['stages'] == []
+
+    profiler = TPC.StageProfiler()
+    for _ in range(3):
+        with profiler.stage('write_output', rows=10):
+            pass
+    profiler.close()
+    [stage] = profiler.report()['stages']
+    assert stage['name'] == 'write_output' and stage['calls'] == 3 and stage['rows'] == 30
+
+@pytest.mark.parametrize('input_file', ['tests/titanic-passengers.csv', 'tests/titanic-passengers.json'])
+def test_lean_mode_same_discrepencies(offline_actual_data, input_file, tmp_path):
+    '''
+    Test if --lean mode finds the same discrepencies as the default mode
+    '''
+    results = []
+    for lean in ['', ' --lean']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i {input_file} -o {tmp_path / "output.csv"} -f{lean}')
+        results.append(TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True))
+    assert repr(results[0]) == repr(results[1])
+    assert set(results[1].keys()) == {90, 727, 797, 555, 500, 41, 892}
+
+def test_conform_dtypes_compares_categoricals_by_codes():
+    '''
+    Test if actual strings get categories of expected data extended with new values, integers get a common type
+    and compacted columns compare the same way as original ones
+    '''
+    original_expected_df = pd.DataFrame({'sex':['male', 'female'] * 3, 'pclass':[1, 2, 3] * 2, 'name':list('abcdef')})
+    expected_df = TPC.compact_frame(original_expected_df)
+    assert isinstance(expected_df['sex'].dtype, pd.CategoricalDtype)
+    assert expected_df['pclass'].dtype == 'int8' and expected_df['name'].dtype == 'object'
+    actual_df = pd.DataFrame({'sex':['male', 'female', 'other', None, 'male', 'female'], 'pclass':[1, 2, 300, 1, 2, 3], 'name':list('abcdeg')})
+    conformed_expected_df, conformed_actual_df = TPC.conform_dtypes(expected_df, actual_df)
+    assert list(conformed_actual_df['sex'].cat.categories) == ['female', 'male', 'other']
+    assert conformed_expected_df['sex'].dtype == conformed_actual_df['sex'].dtype
+    assert conformed_expected_df['pclass'].dtype == conformed_actual_df['pclass'].dtype == 'int16'
+    assert expected_df['pclass'].dtype == 'int8'
+    for col_name in actual_df.columns:
+        mask = TPC.discrepencies_series_mask(conformed_actual_df[col_name], conformed_expected_df[col_name])
+        assert mask.tolist() == TPC.discrepencies_series_mask(actual_df[col_name], original_expected_df[col_name]).tolist()
+
+def test_reordered_categories_compared_by_values():
+    '''
+    Test if categoricals of equal dtypes with categories in different order are compared by values, not by codes
+    '''
+    series_1 = pd.Series(pd.Categorical(['a', 'b', 'a'], categories=['a', 'b']))
+    series_2 = pd.Series(pd.Categorical(['a', 'b', 'b'], categories=['b', 'a']))
+    assert series_1.dtype == series_2.dtype
+    assert TPC.discrepencies_series_mask(series_1, series_2).tolist() == [False, False, True]
+
+    expected_df = pd.DataFrame({'passengerid':range(1, 101), 'sex':pd.Categorical(['male', 'female'] * 50, categories=['female', 'male'])})
+    actual_df = expected_df.assign(sex=expected_df['sex'].cat.reorder_categories(['male', 'female']))
+    actual_df.loc[actual_df['passengerid'] == 7, 'sex'] = 'female'
+    result = TPC.Comparator(expected_df).compare(actual_df)
+    assert result.wrong_values[['passengerid', 'expected_value', 'actual_value']].values.tolist() == [[7, 'male', 'female']]
+
+def test_mixed_column_isolates_bad_cells():
+    '''
+    Test if a string among floats is the only mismatch of its column and other floats are compared with numpy.isclose
+    '''
+    series_1 = pd.Series(['28.0', 'Young', '14.00000001', '15', None, 7.5])
+    series_2 = pd.Series([28.0, 30.0, 14.0, 15.0, np.nan, 7.5])
+    bool_mask = TPC.discrepencies_series_mask(series_1, series_2, isclose_flag=True)
+    assert bool_mask.tolist() == [False, True, False, True, False, False]
+    bool_mask = TPC.discrepencies_series_mask(series_1, series_2, isclose_flag=False)
+    assert bool_mask.tolist() == [False, True, True, True, False, False]
+
+@pytest.mark.parametrize('isclose_flag', [True, False])
+def test_strings_compared_as_strings_in_mixed_column(isclose_flag):
+    '''
+    Test if pairs of strings match the same way in a column of strings and in a column with a non-string cell
+    '''
+    strings_1 = [' 15', '1e3', '7.85420000001', '15', 'Young']
+    strings_2 = ['15', '1000.0', '7.8542', '15', 'Young']
+    string_mask = TPC.discrepencies_series_mask(pd.Series(strings_1), pd.Series(strings_2), isclose_flag=isclose_flag)
+    mixed_mask = TPC.discrepencies_series_mask(pd.Series(strings_1 + [15.0]), pd.Series(strings_2 + [15.0]), isclose_flag=isclose_flag)
+    assert string_mask.tolist() == [True, True, True, False, False]
+    assert mixed_mask.tolist() == string_mask.tolist() + [False]
+
+def test_schema_rules():
+    '''
+    Test if declared kinds of columns and tolerances change the comparison
+    '''
+    schema = TPC.parse_schema('Fare:float:0:0.05,pclass:int,embarked:category,ticket:string,date:datetime')
+    assert schema['fare'] == {'kind':'float', 'rtol':0.0, 'atol':0.05}
+    assert schema['pclass'] == {'kind':'int'}
+    for wrong_schema in ['fare:decimal', 'pclass:int:0.1', 'fare:float:0:0:1']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            TPC.parse_schema(wrong_schema)
+
+    def mask(values_1, values_2, col_name):
+        return TPC.discrepencies_series_mask(pd.Series(values_1), pd.Series(values_2), isclose_flag=False, rule=schema[col_name]).tolist()
+    assert mask([7.785, 25.93, 7.0], [7.775, 25.9292, 8.0], 'fare') == [False, False, True]
+    assert mask(['3', 2.0, 'first', None], [3, 2, 'first', np.nan], 'pclass') == [False, False, False, False]
+    assert mask(['S', 'C', None], pd.Categorical(['S', 'Q', None]), 'embarked') == [False, True, False]
+    assert mask([15, 'A/5'], ['15.0', 'A/5'], 'ticket') == [True, False]
+    assert mask(['2020-01-01', 'unknown', None], pd.to_datetime(['2020-01-01', '2020-01-02', None]), 'date') == [False, True, False]
+
+def test_schema_argument(offline_actual_data, tmp_path):
+    '''
+    Test if tolerance given with --schema hides small differences of fares listed in test_discrepencies_csv
+    '''
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f --schema fare:float:0:0.05,age:float')
+    json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert set(json_result.keys()) == {90, 727, 500, 41, 892}
+    assert json_result[727]['errors'][0]['expected_value'] == 'Young'
+
+@pytest.fixture()
+def titanic_database(tmp_path):
+    '''
+    SQLite database with expected data of test file and actual data rebuilt from it
+    '''
+    filename = str(tmp_path / 'titanic.db')
+    with sqlite3.connect(filename) as connection:
+        pd.read_csv('tests/titanic-passengers.csv', sep=';').to_sql('expected', connection, index=False)
+        TPC.load_json_data(build_actual_records()).to_sql('passengers', connection, index=False)
+    connection.close()
+    return filename
+
+@pytest.mark.parametrize('extra_args', ['-f', '', '-f -c fare,age -p 41,90,500,555,892', '-f --schema fare:float:0:0.05 --chunksize 2'])
+def test_sql_comparison_same_as_in_memory(offline_actual_data, titanic_database, extra_args, tmp_path):
+    '''
+    Test if comparison pushed down into database finds the same discrepencies as in-memory comparison
+    '''
+    results = []
+    for input_args in ['-i tests/titanic-passengers.csv', f'-i {titanic_database} --actualtable passengers']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'{input_args} -o {tmp_path / "output.csv"} {extra_args}')
+        json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+        results.append(sorted(
+            (row_id, error['error_code'], error['column_name'], str(error['expected_value']), str(error['actual_value']))
+            for row_id, errors in json_result.items() for error in errors['errors']
+            ))
+    assert results[0] == results[1]
+
+def test_sql_comparison_row_errors(tmp_path):
+    '''
+    Test if duplicated, missing and excessive ids are found by the database and only wrong values are fetched
+    '''
+    connection = sqlite3.connect(':memory:')
+    pd.DataFrame({'PassengerId':[1, 2, 3, 3, 4], 'Age':[10.0, 20.0, 30.0, 31.0, None]}).to_sql('expected', connection, index=False)
+    pd.DataFrame({'passengerid':[1, 2, 2, 4, 5], 'age':[11.0, 20.0, 21.0, None, 50.0]}).to_sql('actual', connection, index=False)
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid', batch_size=1)
+    TPC.sql_comparison(connection, 'expected', 'actual', logger, batch_size=1)
+    logger.close()
+    assert logger.columns['passengerid'] == [2, 3, 3, 5, 1]
+    assert list(logger.columns['error_code']) == [2, 3, 4, 5, 1]
+    assert logger.columns['expected_value'][-1] == 10.0 and logger.columns['actual_value'][-1] == 11.0
+    (tmp_path / 'text.db').write_text('passengerid;age\n1;10\n')
+    for extra_args in ['', '-s']:
+        APF = TPC.ArgparseFactory()
+        APF.add_argument(f'-i {tmp_path / "text.db"} -o {tmp_path / "output.csv"} {extra_args}')
+        with pytest.raises(argparse.ArgumentError):
+            TPC.titanic_datasets_comparison(APF.parse_args())
+
+def test_summary_counts_and_samples(tmp_path):
+    '''
+    Test if summary counts all discrepencies by error code and column, but passes only examples to the logger
+    '''
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    summary = TPC.DiscrepenciesSummary(logger, sample_size=2)
+    summary.add_frame(pd.DataFrame({'passengerid':[1, 2, 3], 'error_message':'Missing row in actual data', 'error_code':4}))
+    summary.add_frame(pd.DataFrame({'passengerid':[4, 5, 6, 4], 'error_message':'wrong value', 'error_code':1,
+        'column_name':['age', 'fare', 'age', 'fare'], 'expected_value':[1, 2, 3, 4], 'actual_value':[5, 6, 7, 8]}))
+    summary.add({'passengerid':7, 'error_message':'wrong value', 'error_code':1, 'column_name':'age'})
+    summary.close()
+    assert len(summary) == 8
+    assert list(zip(logger.columns['passengerid'], logger.columns['column_name'])) == [
+        (1, None), (2, None), (4, 'age'), (5, 'fare'), (6, 'age'), (4, 'fare')]
+    assert summary.report() == {'discrepencies':8, 'by_error_code':{1:5, 4:3}, 'by_column':{'age':3, 'fare':2}, 'complete':True,
+        'stopped_by':None, 'sample_size':2}
+    assert summary.tabularize().dict[0] == {'error_code':1, 'error_message':'wrong value', 'column_name':'age', 'count':3}
+
+@pytest.mark.parametrize('max_errors, stop_codes, logged_ids, stopped_by', [
+    (3, None, [1, 2, 3], 'max_errors 3'),
+    (None, [5], [1, 2, 3, 4], 'error_code 5'),
+    (10, [4], [1, 2], 'error_code 4'),
+    ])
+def test_summary_stops_comparison(tmp_path, max_errors, stop_codes, logged_ids, stopped_by):
+    '''
+    Test if summary stops comparison at the limit and drops discrepencies following it
+    '''
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    summary = TPC.DiscrepenciesSummary(logger, sample_size=None, max_errors=max_errors, stop_codes=stop_codes)
+    summary.add_frame(pd.DataFrame({'passengerid':[1], 'error_message':'Duplicated passengerid in actual data', 'error_code':2}))
+    with pytest.raises(TPC.ComparisonStopped):
+        summary.add_frame(pd.DataFrame({'passengerid':[2, 3, 4, 5], 'error_message':'', 'error_code':[4, 4, 5, 5]}))
+        summary.add_frame(pd.DataFrame({'passengerid':[6], 'error_message':'', 'error_code':[1]}))
+    summary.add_frame(pd.DataFrame({'passengerid':[7], 'error_message':'', 'error_code':[1]}))
+    summary.close()
+    assert logger.columns['passengerid'] == logged_ids
+    assert summary.report()['stopped_by'] == stopped_by and not summary.report()['complete']
+
+def test_summary_max_errors_boundary(tmp_path):
+    '''
+    Test if exactly max_errors discrepencies leave the summary complete and only the next one stops the comparison
+    '''
+    logger = TPC.DiscrepenciesLogger(filename=str(tmp_path / 'output.csv'), unique_col='passengerid')
+    summary = TPC.DiscrepenciesSummary(logger, sample_size=None, max_errors=3)
+    summary.add_frame(pd.DataFrame({'passengerid':[1, 2], 'error_message':'', 'error_code':4}))
+    summary.add_frame(pd.DataFrame({'passengerid':[3], 'error_message':'', 'error_code':5}))
+    assert summary.report()['complete'] and summary.report()['stopped_by'] is None
+    with pytest.raises(TPC.ComparisonStopped):
+        summary.add_frame(pd.DataFrame({'passengerid':[4], 'error_message':'', 'error_code':1}))
+    summary.close()
+    assert logger.columns['passengerid'] == [1, 2, 3]
+    assert summary.report()['stopped_by'] == 'max_errors 3' and summary.report()['discrepencies'] == 3
+
+@pytest.mark.parametrize('mode_args', ['', '-s --chunksize 100'])
+def test_summary_argument(standin_api, tmp_path, mode_args):
+    '''
+    Test if --summary saves counts of discrepencies listed in test_discrepencies_csv and --max-errors stops the comparison
+    '''
+    input_args = f'-i tests/titanic-passengers.csv -o {tmp_path / "output.csv"} -f -u {standin_api.url} {mode_args}'
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'{input_args} --summary {tmp_path / "summary.json"} --sample 1')
+    json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    with open(tmp_path / 'summary.json') as f:
+        summary = json.load(f)
+    assert summary['by_error_code'] == {'1':5, '3':1, '4':1, '5':1}
+    assert summary['by_column'] == {'age':1, 'fare':2, 'pclass':1, 'survived':1}
+    assert sum(len(errors['errors']) for errors in json_result.values()) == 7
+
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'{input_args} --max-errors 2')
+    json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert sum(len(errors['errors']) for errors in json_result.values()) == 2
+
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'{input_args} --max-errors 8 --summary {tmp_path / "summary.json"}')
+    json_result = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    with open(tmp_path / 'summary.json') as f:
+        summary = json.load(f)
+    assert summary['complete'] and summary['stopped_by'] is None and summary['discrepencies'] == 8
+
+def test_compare_indexed_actual_data():
+    '''
+    Test if actual data indexed once with index_actual_data gives the same results as raw actual data
+    '''
+    actual_df = TPC.load_json_data(build_actual_records())
+    indexed_df = TPC.index_actual_data(actual_df)
+    for options in [{}, {'columns':['fare', 'age'], 'ids':[41, 90, 500, 555, 727, 892]}]:
+        comparator = TPC.Comparator.from_file('tests/titanic-passengers.csv', isclose_flag=True, **options)
+        result, indexed_result = comparator.compare(actual_df), comparator.compare(indexed_df)
+        pd.testing.assert_frame_equal(result.row_errors, indexed_result.row_errors)
+        pd.testing.assert_frame_equal(result.wrong_values, indexed_result.wrong_values)
+        pd.testing.assert_frame_equal(result.actual_df, indexed_result.actual_df)
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_batch_mode(standin_api, tmp_path, jobs):
+    '''
+    Test if every file of a batch is compared with actual data fetched once and a bad file does not stop the batch
+    '''
+    batch_dir = tmp_path / 'expected'
+    batch_dir.mkdir()
+    for name, source in [('a.csv', 'tests/titanic-passengers.csv'), ('b.json', 'tests/titanic-passengers.json')]:
+        (batch_dir / name).write_text(open(source).read())
+    (batch_dir / 'c.csv').write_text('name;fare\nBraund;7.25\n')
+    (batch_dir / 'notes.txt').write_text('not compared')
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-b {batch_dir} -o {tmp_path / "results.csv"} -f -j {jobs} -u {standin_api.url} --summary {tmp_path / "summary.json"}')
+    results = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert len(standin_api.requests) == 1
+    assert [os.path.basename(result['input_file']) for result in results] == ['a.csv', 'b.json', 'c.csv']
+    assert [result.get('by_error_code') for result in results] == [{1:5, 3:1, 4:1, 5:1}, {1:5, 3:1, 4:1, 5:1}, None]
+    assert 'passengerid' in results[2]['error']
+    assert pd.read_csv(tmp_path / 'results.csv')['discrepencies'].tolist()[:2] == [8, 8]
+    assert len(pd.read_csv(tmp_path / 'a_discrepencies.csv')) == 8 and not (tmp_path / 'c_discrepencies.csv').exists()
+    with open(tmp_path / 'summary.json') as f:
+        summary = json.load(f)
+    assert (summary['discrepencies'], summary['failed_files'], summary['by_error_code']['1']) == (16, 1, 10)
+
+def test_batch_manifest(offline_actual_data, tmp_path):
+    '''
+    Test if files listed in batch manifest are compared and clashing discrepencies files are rejected
+    '''
+    (tmp_path / 'expected').mkdir()
+    (tmp_path / 'expected' / 'partner.csv').write_text(open('tests/titanic-passengers.csv').read())
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text('# partner files\nexpected/partner.csv\n\n')
+    assert TPC.batch_input_files(str(manifest)) == [str(tmp_path / 'expected' / 'partner.csv')]
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-b {manifest} -o {tmp_path / "results.jsonl"} -f -c fare,age')
+    results = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert results[0]['by_column'] == {'age':1, 'fare':2}
+    with pytest.raises(ValueError):
+        TPC.batch_output_files(['a/partner.csv', 'b/partner.json'], 'out/results.csv')
+
+def test_match_moved_rows():
+    '''
+    Test if rows sharing normalized key values are paired in id order and rows without a key or a pair stay unmatched
+    '''
+    expected_df = pd.DataFrame({
+        'name':['Smith, John', 'Brown, Ann', 'Brown, Ann', None, 'Kelly, Mary'],
+        'ticket':[7.0, '113', '113', '220', '330'],
+        }, index=pd.Index([1, 2, 3, 4, 5], name='passengerid'))
+    actual_df = pd.DataFrame({
+        'name':['brown, ann', 'Brown,  Ann', ' SMITH, john', 'Nobody, Mr.', 'Kelly, Mary'],
+        'ticket':['113', '113', 7, '220', '331'],
+        }, index=pd.Index([14, 12, 11, 13, 15], name='passengerid'))
+    pairs = TPC.match_moved_rows(expected_df, actual_df, ['name', 'ticket'])
+    assert pairs.to_dict('list') == {'expected':[1, 2, 3], 'actual':[11, 12, 14]}
+
+def test_moved_rows_argument(offline_actual_data, tmp_path):
+    '''
+    Test if renumbered rows are logged as moved rows with their wrong values and marked in Excel report
+    '''
+    for record in offline_actual_data:
+        fields = record['fields']
+        if fields['passengerid'] == 10:
+            fields['passengerid'] = 2010
+        elif fields['passengerid'] == 20:
+            fields.update(passengerid=2020, fare=99.0)
+    excel_filename = tmp_path / 'discrepencies.xlsx'
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "discrepencies.csv"} -f --rekey name,ticket -e {excel_filename}')
+    errors_json = TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    assert errors_json[10]['errors'] == [
+        {'error_message':'Moved passengerid in actual data', 'error_code':6, 'column_name':'passengerid', 'expected_value':10, 'actual_value':2010}]
+    assert [(error['error_code'], error['column_name'], error['actual_value']) for error in errors_json[20]['errors']] == [
+        (6, 'passengerid', 2020), (6, 'fare', 99.0)]
+    assert 2010 not in errors_json and 2020 not in errors_json
+    assert errors_json[892]['errors'][0]['error_code'] == 4 and errors_json[500]['errors'][0]['error_code'] == 5
+    assert pd.read_csv(tmp_path / 'discrepencies.csv')['error_code'].value_counts().to_dict() == {1:5, 6:3, 3:1, 4:1, 5:1}
+
+    sh = openpyxl.load_workbook(excel_filename)['Discrepencies']
+    rows = list(sh.iter_rows())
+    headings = [cell.value for cell in rows[0]]
+    by_id = {row[0].value:row for row in rows[1:]}
+    assert 10 not in by_id and by_id[2010][-1].value == 'Moved passengerid in actual data from 10'
+    assert all(cell.fill.start_color.rgb.endswith('7A3DB8') for cell in by_id[2010][:-1])
+    fare = by_id[2020][headings.index('fare')]
+    assert 'expected: 7.225' in fare.value and fare.fill.start_color.rgb.endswith('FF0000')
+
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "discrepencies.csv"} -c fare,age --rekey name,ticket')
+    with pytest.raises(argparse.ArgumentError):
+        TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+
+def test_history_store(tmp_path):
+    '''
+    Test if runs are appended to history store, queried and diffed by id, error code and column
+    '''
+    runs = [
+        [(1, 'wrong value', 1, 'fare', 7.25, 7.5), (2, 'Missing row in actual data', 4, None, None, None), (3, 'wrong value', 1, 'age', 'Young', 30.0)],
+        [(1, 'wrong value', 1, 'fare', 7.25, 8.0), (3, 'wrong value', 1, 'age', 'Young', 30.0), (4, 'Excessive row in actual data', 5, None, None, None)],
+        [(1, 'wrong value', 1, 'fare', 7.25, 8.0), (2, 'Missing row in actual data', 4, None, None, None)],
+        ]
+    with TPC.DiscrepenciesHistory(str(tmp_path / 'history.db')) as history:
+        loggers = []
+        for number, rows in enumerate(runs):
+            logger = TPC.DiscrepenciesLogger(str(tmp_path / f'discrepencies{number}.csv'), 'passengerid')
+            for row in rows:
+                logger.add(dict(zip(logger.fieldnames, row)))
+            logger.close()
+            loggers.append(logger)
+            assert history.record(logger, input_file='expected.csv') == number + 1
+        assert history.runs()['discrepencies'].tolist() == [3, 3, 2]
+        assert history.runs()['previous_run'].tolist()[1:] == [1, 2]
+        statuses = history.connection.execute('SELECT run_id, passengerid, first_run, resolved_run FROM discrepencies ORDER BY rowid')
+        assert statuses.fetchall() == [
+            (1, 1, 1, None), (1, 2, 1, 2), (1, 3, 1, None), (2, 1, 1, None), (2, 3, 1, 3), (2, 4, 2, 3), (3, 1, 1, None), (3, 2, 3, None)]
+        assert history.last_run(input_file='expected.csv', before=2) == 1 and history.last_run(input_file='other.csv') is None
+        assert history.query(1, error_codes=[4])['passengerid'].tolist() == [2]
+        assert history.query(2, ids=[1, 3], columns=['age']).to_dict('records') == [
+            {'passengerid':3, 'error_message':'wrong value', 'error_code':1, 'column_name':'age', 'expected_value':'Young', 'actual_value':30.0}]
+        diff = history.diff(1, 2)
+        assert list(zip(diff['status'], diff['passengerid'], diff['error_code'])) == [
+            ('persisting', 1, 1), ('resolved', 2, 4), ('persisting', 3, 1), ('new', 4, 5)]
+        assert diff['actual_value'].iloc[0] == 8.0
+        assert history.diff(1, 2, persisting=False)['status'].tolist() == ['resolved', 'new']
+        for persisting in [True, False]:
+            pd.testing.assert_frame_equal(history.diff(1, 2, persisting, logger=loggers[1]), history.diff(1, 2, persisting))
+            pd.testing.assert_frame_equal(history.diff(2, 3, persisting, logger=loggers[2]), history.diff(2, 3, persisting))
+        diff = history.diff(2, 3)
+        assert list(zip(diff['status'], diff['passengerid'])) == [('persisting', 1), ('new', 2), ('resolved', 3), ('resolved', 4)]
+        # Runs which are not consecutive are diffed by probing the index
+        diff = history.diff(1, 3)
+        assert list(zip(diff['status'], diff['passengerid'])) == [('persisting', 1), ('persisting', 2), ('resolved', 3)]
+
+def test_history_store_without_statuses(tmp_path):
+    '''
+    Test if history store created without statuses of discrepencies is extended and diffed with the next run
+    '''
+    connection = sqlite3.connect(tmp_path / 'history.db')
+    with connection:
+        connection.executescript('''
+            CREATE TABLE runs (run_id INTEGER PRIMARY KEY, started TEXT, input_file TEXT, output_file TEXT, discrepencies INTEGER, arguments TEXT);
+            CREATE TABLE discrepencies (run_id INTEGER NOT NULL REFERENCES runs (run_id), passengerid, error_code INTEGER, column_name TEXT,
+                error_message TEXT, expected_value, actual_value);
+            INSERT INTO runs (run_id, input_file, discrepencies) VALUES (1, 'expected.csv', 2);
+            INSERT INTO discrepencies VALUES (1, 1, 1, 'fare', 'wrong value', 7.25, 7.5), (1, 2, 4, NULL, 'Missing row in actual data', NULL, NULL);
+            ''')
+    connection.close()
+    with TPC.DiscrepenciesHistory(str(tmp_path / 'history.db')) as history:
+        logger = TPC.DiscrepenciesLogger(str(tmp_path / 'discrepencies.csv'), 'passengerid')
+        logger.add({'passengerid':1, 'error_message':'wrong value', 'error_code':1, 'column_name':'fare', 'expected_value':7.25, 'actual_value':8.0})
+        logger.close()
+        assert history.record(logger, input_file='expected.csv') == 2
+        diff = history.diff(1, 2, logger=logger)
+        assert list(zip(diff['status'], diff['passengerid'])) == [('persisting', 1), ('resolved', 2)]
+        pd.testing.assert_frame_equal(diff, history.diff(1, 2))
+
+def test_history_argument(offline_actual_data, tmp_path):
+    '''
+    Test if runs are appended to history store and diffed with the previous run of the same input file
+    '''
+    arguments = f'-i tests/titanic-passengers.csv -o {tmp_path / "discrepencies.csv"} -f --history {tmp_path / "history.db"} --diff {tmp_path / "diff.csv"}'
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(arguments)
+    TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    diff = pd.read_csv(tmp_path / 'diff.csv')
+    assert set(diff['status']) == {'new'} and len(diff) == 8
+
+    for record in offline_actual_data:
+        if record['fields']['passengerid'] == 555:
+            record['fields']['fare'] = 7.785
+        elif record['fields']['passengerid'] == 3:
+            record['fields']['fare'] = 1.0
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(arguments)
+    TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)
+    diff = pd.read_csv(tmp_path / 'diff.csv')
+    assert diff.groupby('status')['passengerid'].apply(list).to_dict() == {
+        'new':[3], 'persisting':[41, 90, 90, 500, 727, 797, 892], 'resolved':[555]}
+
+    APF = TPC.ArgparseFactory()
+    APF.add_argument(f'-i tests/titanic-passengers.csv -o {tmp_path / "discrepencies.csv"} --diff {tmp_path / "diff.csv"}')
+    with pytest.raises(argparse.ArgumentError):
+        TPC.titanic_datasets_comparison(APF.parse_args(), test_flag=True)